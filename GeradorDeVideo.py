@@ -4,6 +4,9 @@ import time
 import fal_client
 from dotenv import load_dotenv
 from openai import OpenAI
+from cache_refinamento import CacheRefinamento, chave_refinamento
+from cache_renders import CacheRenders, chave_render
+from metricas import metricas
 
 load_dotenv()
 
@@ -12,15 +15,41 @@ MODO_TESTE = False #Modo Teste, Caso true, não chama a API real, apenas simula
 
 client_groq = OpenAI(
     api_key=os.getenv("GROQ_API_KEY"),
-    base_url="https://api.groq.com/openai/v1"
+    base_url=os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
 )
 
+# Quem renderiza: o próprio fal_client ou qualquer objeto com submit(app, arguments).get().
+# FAL_BACKEND=fake usa o FalFake de servidores_fake.py (testes/benchmark sem gastar créditos do fal).
+backend_fal = fal_client
+
+def configurar_backend_fal(backend):
+    global backend_fal
+    backend_fal = backend
+
+if os.getenv("FAL_BACKEND", "").lower() == "fake":
+    from servidores_fake import FalFake
+    configurar_backend_fal(FalFake())
+
+# Mudou o texto das personas abaixo? Suba a versão para não reaproveitar refinamentos antigos.
+VERSAO_REFINAMENTO = 1
+
+# Mesma ideia + mesmo tipo -> mesmo prompt refinado (memória + cache_refinamento.db)
+cache_refinamento = CacheRefinamento()
+# Renders já feitos, pela combinação exata de modelo + argumentos (cache_renders.db)
+cache_renders = CacheRenders()
+
 def refinar_prompt_com_ia(ideia_bruta, tipo_geracao="text"):
     print(f"🧠 [IA] Refinando prompt ({tipo_geracao}): '{ideia_bruta}'...")
     
     if MODO_TESTE:
         return {"prompt": ideia_bruta, "negative_prompt": "test"}
 
+    chave = chave_refinamento(ideia_bruta, tipo_geracao, VERSAO_REFINAMENTO)
+    em_cache = cache_refinamento.obter(chave)
+    if em_cache:
+        print("🧠 [IA] Refinamento reaproveitado do cache.")
+        return em_cache
+
     #Seleciona qual Persona deve utilizar
     if tipo_geracao == "image":
         #Supervisor VFX
@@ -64,36 +93,61 @@ def refinar_prompt_com_ia(ideia_bruta, tipo_geracao="text"):
         """
 
     try:
-        response = client_groq.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Pedido do usuário: {ideia_bruta}"}
-            ],
-            temperature=0.6,
-            response_format={"type": "json_object"}
-        )
-        return json.loads(response.choices[0].message.content)
+        with metricas.medir("chamada_externa_segundos", servico="groq", operacao="refinar_prompt"):
+            response = client_groq.chat.completions.create(
+                model="llama-3.3-70b-versatile",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"Pedido do usuário: {ideia_bruta}"}
+                ],
+                temperature=0.6,
+                response_format={"type": "json_object"}
+            )
+        dados = json.loads(response.choices[0].message.content)
+        if dados.get("prompt"):
+            cache_refinamento.guardar(chave, dados)
+        return dados
     except Exception as e:
         print(f"⚠️ Erro no refinamento: {e}")
         return {"prompt": ideia_bruta + ", high quality, cinematic motion", "negative_prompt": "distortion"}
 
 
-def criar_video_wan(ideia_usuario):
+def renderizar_wan(modelo, argumentos):
+    """
+    Render no fal com cache endereçado pelo conteúdo: pedido idêntico devolve o vídeo anterior.
+    Retorna (url, do_cache). Erros do fal sobem como exceção.
+    """
+    chave = chave_render(modelo, argumentos)
+    url = cache_renders.obter(chave)
+    if url:
+        print(f"♻️ Render reaproveitado do cache ({chave[:12]}).")
+        return url, True
+
+    with metricas.medir("chamada_externa_segundos", servico="fal", operacao=modelo):
+        handler = backend_fal.submit(modelo, arguments=argumentos)
+        result = handler.get()
+    url = result['video']['url']
+    cache_renders.guardar(chave, modelo, url)
+    return url, False
+
+
+def criar_video_wan(ideia_usuario, com_origem=False):
+    """URL do vídeo (ou texto de erro). com_origem=True devolve (resultado, veio_do_cache)."""
     
     if MODO_TESTE:
         print(f"⚠️ [TESTE] T2V Simulado.")
         time.sleep(2)
-        return "https://videos.pexels.com/video-files/855564/855564-hd_1920_1080_25fps.mp4"
+        url = "https://videos.pexels.com/video-files/855564/855564-hd_1920_1080_25fps.mp4"
+        return (url, False) if com_origem else url
 
     dados = refinar_prompt_com_ia(ideia_usuario, tipo_geracao="text")
     
     print(f"🎨 Prompt T2V: {dados['prompt'][:50]}...")
     
     try:
-        handler = fal_client.submit(
+        url, do_cache = renderizar_wan(
             "fal-ai/wan-2.1-t2v-1.3b",
-            arguments={
+            {
                 "prompt": dados["prompt"],
                 "negative_prompt": dados.get("negative_prompt", ""),
                 "aspect_ratio": "16:9",
@@ -101,18 +155,19 @@ def criar_video_wan(ideia_usuario):
                 "guidance_scale": 5.0
             },
         )
-        result = handler.get()
-        return result['video']['url']
     except Exception as e:
-        return f"Erro no vídeo: {str(e)}"
+        url, do_cache = f"Erro no vídeo: {str(e)}", False
+    return (url, do_cache) if com_origem else url
 
 
-def animar_foto_wan(url_imagem, ideia_movimento):
+def animar_foto_wan(url_imagem, ideia_movimento, com_origem=False):
+    """URL do vídeo (ou texto de erro). com_origem=True devolve (resultado, veio_do_cache)."""
     
     if MODO_TESTE:
         print(f"⚠️ [TESTE] I2V Simulado.")
         time.sleep(2)
-        return "https://videos.pexels.com/video-files/4763826/4763826-uhd_2560_1440_24fps.mp4"
+        url = "https://videos.pexels.com/video-files/4763826/4763826-uhd_2560_1440_24fps.mp4"
+        return (url, False) if com_origem else url
 
     if not ideia_movimento or len(ideia_movimento) < 3:
         ideia_movimento = "Make it alive, subtle cinematic movement."
@@ -122,9 +177,9 @@ def animar_foto_wan(url_imagem, ideia_movimento):
     print(f"🎨 Prompt I2V (VFX): {dados['prompt'][:50]}...")
 
     try:
-        handler = fal_client.submit(
+        url, do_cache = renderizar_wan(
             "fal-ai/wan-2.1-i2v-1.3b",
-            arguments={
+            {
                 "image_url": url_imagem,
                 "prompt": dados["prompt"],
                 "negative_prompt": dados.get("negative_prompt", ""),
@@ -133,7 +188,6 @@ def animar_foto_wan(url_imagem, ideia_movimento):
                 "guidance_scale": 5.0
             },
         )
-        result = handler.get()
-        return result['video']['url']
     except Exception as e:
-        return f"Erro na animação: {str(e)}"
\ No newline at end of file
+        url, do_cache = f"Erro na animação: {str(e)}", False
+    return (url, do_cache) if com_origem else url
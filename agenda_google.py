@@ -1,79 +1,302 @@
 ﻿import os
+import json
+import hashlib
 import datetime
 import logging
+import threading
+import time
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build, Resource
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 
 from logger_config import Log
+from metricas import metricas
+from indice_intervalos import para_minutos, de_minutos
 
 log_setup = Log("BotLog")
 logger = log_setup.get_logger("AgendaGoogle")
 
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
-_SERVICE_CACHE = None
+
+# Tokens OAuth de cada barbearia (um arquivo por email); token.json continua sendo a conta padrão
+PASTA_TOKENS = os.getenv("GOOGLE_PASTA_TOKENS", "tokens_google")
+# Renova o access token quando faltar menos que isso para expirar (a thread roda a cada INTERVALO)
+RENOVAR_ANTES_S = int(os.getenv("GOOGLE_RENOVAR_ANTES_S", "900"))
+INTERVALO_RENOVACAO_S = int(os.getenv("GOOGLE_INTERVALO_RENOVACAO_S", "300"))
+# Timeout de socket de cada chamada ao Calendar (o googleapiclient usa 60 s por padrão);
+# sem ele uma conexão pendurada prende uma thread do executores.google para sempre
+GOOGLE_TIMEOUT_S = float(os.getenv("GOOGLE_TIMEOUT_S", "30"))
 
 # Define fuso horário fixo (Brasil/São Paulo)
 SAO_PAULO_TZ = datetime.timezone(datetime.timedelta(hours=-3))
 
+# Limite de calendários por chamada do freebusy().query
+MAX_CALENDARIOS_FREEBUSY = 50
+
+
+class RequisicaoMedida(HttpRequest):
+    """HttpRequest que registra a duração de cada execute() (operacao = "calendar.events.list" etc.)."""
+
+    def execute(self, *args, **kwargs):
+        with metricas.medir("chamada_externa_segundos", servico="google", operacao=self.methodId or "?"):
+            return super().execute(*args, **kwargs)
+
 def _to_rfc3339(dt: datetime.datetime) -> str:
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=SAO_PAULO_TZ)
     return dt.isoformat()
 
-def autenticar_google() -> Resource:
-    global _SERVICE_CACHE
+def _caminho_token_padrao() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "token.json")
 
-    # Se já tiver conexão em memória e o token não expirou, usa ela
-    if _SERVICE_CACHE:
-        return _SERVICE_CACHE
+def _login_local(caminho_token: str) -> Credentials:
+    # Se não tem token, precisamos logar.
+    # Nota: Em produção (servidor), isso aqui falharia se tentasse abrir navegador.
+    # Mas como temos o login via Site agora, o token.json deve existir.
+    logger.info("Token inválido ou inexistente. Tentando fluxo local...")
+    caminho_credentials = os.path.join(os.path.dirname(caminho_token), "credentials.json")
+    if not os.path.exists(caminho_credentials):
+        raise FileNotFoundError("Arquivo credentials.json não encontrado!")
 
-    pasta_atual = os.path.dirname(os.path.abspath(__file__))
-    caminho_credentials = os.path.join(pasta_atual, "credentials.json")
-    caminho_token = os.path.join(pasta_atual, "token.json")
+    flow = InstalledAppFlow.from_client_secrets_file(caminho_credentials, SCOPES)
+    creds = flow.run_local_server(port=0)
+    with open(caminho_token, "w") as token:
+        token.write(creds.to_json())
+    return creds
 
-    creds = None
 
-    try:
-        # 1. Tenta carregar o token existente (que o site gerou ou o login anterior gerou)
-        if os.path.exists(caminho_token):
-            creds = Credentials.from_authorized_user_file(caminho_token, SCOPES)
+class CredenciaisGoogle:
+    """
+    Credenciais e service do Calendar por barbearia (chave = email do dono).
+
+    - O token de cada conta fica em PASTA_TOKENS/<sha256 do email>.json (gravado pelo callback
+      do OAuth); o hash não deixa dois emails diferentes caírem no mesmo arquivo.
+    - Um service build()-ado por conta, reaproveitado; cada requisição usa seu próprio
+      httplib2.Http, então o mesmo service pode ser usado por várias threads.
+    - A thread de renovação troca o access token antes de expirar: a mensagem do WhatsApp
+      não espera refresh de OAuth.
+    - Conta sem token próprio usa a conta padrão (token.json), como antes.
+    """
+
+    def __init__(self, pasta=PASTA_TOKENS, renovar_antes=RENOVAR_ANTES_S):
+        self.pasta = pasta
+        self.renovar_antes = renovar_antes
+        # _lock só protege os dicts e contadores (nunca fica preso durante rede ou disco);
+        # leitura de token e refresh do OAuth acontecem sob a trava da própria conta
+        self._lock = threading.Lock()
+        self._travas = {}
+        self._contas = {}
+        self._thread = None
+        self.renovacoes = 0
+        self.renovacoes_no_caminho = 0
+        self.falhas = 0
+        self._migrar_nomes_antigos()
 
-        # 2. Valida o token
+    def caminho_token(self, conta=None) -> str:
+        if not conta:
+            return _caminho_token_padrao()
+        nome = hashlib.sha256(conta.strip().lower().encode("utf-8")).hexdigest()
+        return os.path.join(self.pasta, f"{nome}.json")
+
+    def _migrar_nomes_antigos(self):
+        """
+        Renomeia os tokens gravados com o nome antigo (<email>.json, caracteres fora de
+        [a-z0-9@._-] trocados por "_") para o hash do email. O nome antigo não diz se houve troca:
+        o arquivo fica com o email escrito nele, e quem tinha "+" ou espaço no email reconecta.
+        """
+        if not os.path.isdir(self.pasta):
+            return
+        for arquivo in os.listdir(self.pasta):
+            conta, extensao = os.path.splitext(arquivo)
+            if extensao != ".json" or "@" not in conta:
+                continue
+            destino = self.caminho_token(conta)
+            if os.path.exists(destino):
+                logger.warning(f"Token antigo {arquivo} ignorado: {conta} já tem token no formato novo")
+                continue
+            os.replace(os.path.join(self.pasta, arquivo), destino)
+            logger.info(f"Token de {conta} migrado para {os.path.basename(destino)}")
+
+    def _trava(self, conta):
+        with self._lock:
+            trava = self._travas.get(conta)
+            if trava is None:
+                trava = self._travas[conta] = threading.Lock()
+            return trava
+
+    def _gravar(self, conta, creds):
+        caminho = self.caminho_token(conta)
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        temporario = caminho + ".tmp"
+        with open(temporario, "w") as f:
+            f.write(creds.to_json())
+        os.chmod(temporario, 0o600)
+        os.replace(temporario, caminho)
+
+    def _montar_service(self, creds) -> Resource:
+        def _nova_requisicao(http, *args, **kwargs):
+            return RequisicaoMedida(AuthorizedHttp(creds, http=httplib2.Http(timeout=GOOGLE_TIMEOUT_S)), *args, **kwargs)
+
+        return build("calendar", "v3", credentials=creds, requestBuilder=_nova_requisicao, cache_discovery=False)
+
+    def _expira_logo(self, creds) -> bool:
+        if not creds.valid:
+            return True
+        if creds.expiry is None:
+            return False
+        restante = (creds.expiry - datetime.datetime.utcnow()).total_seconds()
+        return restante < self.renovar_antes
+
+    def _renovar(self, conta, creds):
+        """Refresh numa cópia das credenciais: as requisições em andamento seguem com as antigas. Chamar com a trava da conta."""
+        novas = Credentials.from_authorized_user_info(json.loads(creds.to_json()), SCOPES)
+        novas.refresh(Request())
+        self._gravar(conta, novas)
+        entrada = {"creds": novas, "service": self._montar_service(novas)}
+        with self._lock:
+            self._contas[conta] = entrada
+            self.renovacoes += 1
+        return entrada
+
+    def _carregar(self, conta):
+        """Lê o token do disco (conta ou padrão) e monta o service. Chamar com a trava da conta."""
+        caminho = self.caminho_token(conta)
+        if conta and not os.path.exists(caminho):
+            return None
+        creds = Credentials.from_authorized_user_file(caminho, SCOPES) if os.path.exists(caminho) else None
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
-                logger.info("Token expirado. Tentando renovar automaticamente...")
-                creds.refresh(Request())
+                logger.info(f"Token expirado ({conta or 'padrão'}). Renovando...")
+                return self._renovar(conta, creds)
+            elif conta:
+                return None
             else:
-                # Se não tem token, precisamos logar.
-                # Nota: Em produção (servidor), isso aqui falharia se tentasse abrir navegador.
-                # Mas como temos o login via Site agora, o token.json deve existir.
-                logger.info("Token inválido ou inexistente. Tentando fluxo local...")
-                
-                if not os.path.exists(caminho_credentials):
-                    raise FileNotFoundError("Arquivo credentials.json não encontrado!")
+                creds = _login_local(caminho)
+        entrada = {"creds": creds, "service": self._montar_service(creds)}
+        with self._lock:
+            self._contas[conta] = entrada
+        return entrada
 
-                flow = InstalledAppFlow.from_client_secrets_file(caminho_credentials, SCOPES)
-                creds = flow.run_local_server(port=0)
+    def salvar_token(self, conta, creds):
+        """Callback do OAuth: grava o token da barbearia e troca o service dela."""
+        with self._trava(conta):
+            self._gravar(conta, creds)
+            entrada = {"creds": creds, "service": self._montar_service(creds)}
+            with self._lock:
+                self._contas[conta] = entrada
 
-            # Salva o token renovado/novo
-            with open(caminho_token, "w") as token:
-                token.write(creds.to_json())
+    def service(self, conta=None) -> Resource:
+        with self._lock:
+            entrada = self._contas.get(conta)
+        if entrada is not None and entrada["creds"].valid:
+            # Caminho de toda mensagem: só uma leitura de dict
+            return entrada["service"]
 
-        _SERVICE_CACHE = build("calendar", "v3", credentials=creds)
-        return _SERVICE_CACHE
+        try:
+            with self._trava(conta):
+                with self._lock:
+                    entrada = self._contas.get(conta)
+                if entrada is None:
+                    entrada = self._carregar(conta)
+                elif not entrada["creds"].valid and entrada["creds"].refresh_token:
+                    # Não deveria acontecer com a thread de renovação rodando
+                    with self._lock:
+                        self.renovacoes_no_caminho += 1
+                    entrada = self._renovar(conta, entrada["creds"])
+        except Exception as e:
+            with self._lock:
+                self.falhas += 1
+                self._contas.pop(conta, None)
+            logger.error(f"Falha crítica na autenticação Google ({conta or 'padrão'}): {e}")
+            raise
 
-    except Exception as e:
-        logger.error(f"Falha crítica na autenticação Google: {e}")
-        # Reseta o cache para forçar nova tentativa na próxima
-        _SERVICE_CACHE = None
-        raise e
+        if entrada is None:
+            # Barbearia ainda não conectou a própria conta: usa a padrão
+            return self.service(None)
+        return entrada["service"]
+
+    def renovar_expirando(self):
+        """Renova os tokens carregados que expiram dentro da margem. Retorna quantos renovou."""
+        with self._lock:
+            contas = list(self._contas.keys())
+        total = 0
+        for conta in contas:
+            try:
+                with self._trava(conta):
+                    with self._lock:
+                        entrada = self._contas.get(conta)
+                    # Conferido sob a trava: outra thread pode ter acabado de renovar
+                    if entrada is None or not entrada["creds"].refresh_token or not self._expira_logo(entrada["creds"]):
+                        continue
+                    self._renovar(conta, entrada["creds"])
+                total += 1
+            except Exception as e:
+                with self._lock:
+                    self.falhas += 1
+                logger.error(f"Erro renovando token Google ({conta or 'padrão'}): {e}")
+        return total
+
+    def iniciar_renovacao_periodica(self, intervalo=INTERVALO_RENOVACAO_S):
+        """Sobe (uma vez) a thread que renova os tokens antes de expirarem."""
+        if self._thread is not None:
+            return self._thread
+
+        def _loop():
+            while True:
+                time.sleep(intervalo)
+                try:
+                    total = self.renovar_expirando()
+                    if total:
+                        logger.info(f"Tokens Google renovados: {total}")
+                except Exception as e:
+                    logger.error(f"Erro na renovação de tokens Google: {e}")
+
+        self._thread = threading.Thread(target=_loop, name="renovacao-google", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "contas": len(self._contas),
+                "renovacoes": self.renovacoes,
+                "renovacoes_no_caminho": self.renovacoes_no_caminho,
+                "falhas": self.falhas,
+            }
+
+
+credenciais = CredenciaisGoogle()
+
+# Service no lugar do Google de verdade para todas as contas (None = Google real).
+# GOOGLE_BACKEND=fake usa o GoogleFake de servidores_fake.py (testes/benchmark sem conta Google).
+service_substituto = None
+
+def configurar_backend_google(service):
+    global service_substituto
+    service_substituto = service
 
-def listar_proximos_eventos(calendar_id: str = "primary") -> str:
+if os.getenv("GOOGLE_BACKEND", "").lower() == "fake":
+    from servidores_fake import GoogleFake
+    configurar_backend_google(GoogleFake())
+
+def autenticar_google(conta=None) -> Resource:
+    """Service do Calendar da barbearia `conta` (email) ou da conta padrão (token.json)."""
+    if service_substituto is not None:
+        return service_substituto
+    return credenciais.service(conta)
+
+def salvar_token_google(conta, creds):
+    credenciais.salvar_token(conta, creds)
+
+def listar_proximos_eventos(calendar_id: str = "primary", conta=None) -> str:
     try:
-        service = autenticar_google()
+        service = autenticar_google(conta)
         
         # Pega hora atual em UTC e formata para o padrão do Google
         agora = datetime.datetime.utcnow().isoformat() + "Z"
@@ -112,7 +335,42 @@ def listar_proximos_eventos(calendar_id: str = "primary") -> str:
         logger.error(f"Erro inesperado ao listar: {e}")
         return "Erro técnico ao acessar agenda."
 
-def criar_evento_agenda(data_hora_iso: str, nome_cliente: str, calendar_id: str = "primary", duracao_min: int = 45) -> str:
+def intervalos_ocupados_google(calendarios: dict, inicio: int, fim: int, conta=None) -> dict:
+    """
+    Horários ocupados da equipe inteira numa janela, via FreeBusy (uma chamada para até 50 agendas).
+
+    - calendarios: {barbeiro: id_google_calendar}; barbeiros com a mesma agenda a consultam uma vez só
+    - inicio/fim: minutos de indice_intervalos (mesmo formato da agenda interna)
+    Retorna {barbeiro: [(inicio, fim), ...]}. Agenda que o Google não deixou ler volta inteira
+    ocupada, para o bot nunca oferecer um horário que não conseguiu conferir.
+    """
+    service = autenticar_google(conta)
+    ids = list(dict.fromkeys(calendarios.values()))
+    ocupados_por_id = {}
+
+    for i in range(0, len(ids), MAX_CALENDARIOS_FREEBUSY):
+        lote = ids[i:i + MAX_CALENDARIOS_FREEBUSY]
+        resposta = service.freebusy().query(body={
+            "timeMin": _to_rfc3339(de_minutos(inicio)),
+            "timeMax": _to_rfc3339(de_minutos(fim)),
+            "timeZone": "America/Sao_Paulo",
+            "items": [{"id": cal_id} for cal_id in lote],
+        }).execute()
+
+        for cal_id in lote:
+            dados = resposta.get("calendars", {}).get(cal_id, {})
+            if dados.get("errors"):
+                logger.error(f"FreeBusy sem acesso à agenda {cal_id}: {dados['errors']}")
+                ocupados_por_id[cal_id] = [(inicio, fim)]
+                continue
+            ocupados_por_id[cal_id] = [
+                (para_minutos(bloco["start"]), para_minutos(bloco["end"]))
+                for bloco in dados.get("busy", [])
+            ]
+
+    return {barbeiro: list(ocupados_por_id.get(cal_id, [])) for barbeiro, cal_id in calendarios.items()}
+
+def criar_evento_agenda(data_hora_iso: str, nome_cliente: str, calendar_id: str = "primary", duracao_min: int = 45, conta=None) -> str:
     """
     Cria o evento e retorna UMA STRING de sucesso ou lança EXCEÇÃO se falhar.
     """
@@ -123,7 +381,7 @@ def criar_evento_agenda(data_hora_iso: str, nome_cliente: str, calendar_id: str
         except ValueError:
             raise ValueError("Formato de data inválido fornecido pela IA.")
 
-        service = autenticar_google()
+        service = autenticar_google(conta)
         
         # Calcula fim do corte
         fim_dt = inicio_dt + datetime.timedelta(minutes=duracao_min)
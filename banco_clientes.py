@@ -0,0 +1,314 @@
+import json
+import os
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger("BancoClientes")
+
+ARQUIVO_BANCO = "base_clientes.db"
+ARQUIVO_JSON_LEGADO = "base_clientes.json"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clientes (
+    email TEXT PRIMARY KEY,
+    telefone_whatsapp TEXT,
+    versao INTEGER NOT NULL DEFAULT 1,
+    dados TEXT NOT NULL,
+    alterado_em INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_clientes_telefone ON clientes(telefone_whatsapp);
+"""
+
+# Sequencia global de alteracoes (a versao e por cliente): cada insert/update/delete em `clientes`
+# recebe o proximo numero, e os caches de outros workers releem so o que passou do ultimo visto.
+# Mantida por triggers, entao vale para todos os caminhos de escrita (inclusive o upsert em lote).
+_SCHEMA_ALTERACOES = """
+CREATE TABLE IF NOT EXISTS sequencia_alteracoes (id INTEGER PRIMARY KEY CHECK (id = 1), valor INTEGER NOT NULL);
+INSERT OR IGNORE INTO sequencia_alteracoes (id, valor) VALUES (1, 0);
+CREATE TABLE IF NOT EXISTS clientes_removidos (email TEXT PRIMARY KEY, alterado_em INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_clientes_alterado_em ON clientes(alterado_em);
+CREATE INDEX IF NOT EXISTS idx_removidos_alterado_em ON clientes_removidos(alterado_em);
+
+CREATE TRIGGER IF NOT EXISTS clientes_inserido AFTER INSERT ON clientes BEGIN
+    UPDATE sequencia_alteracoes SET valor = valor + 1 WHERE id = 1;
+    UPDATE clientes SET alterado_em = (SELECT valor FROM sequencia_alteracoes WHERE id = 1) WHERE email = NEW.email;
+    DELETE FROM clientes_removidos WHERE email = NEW.email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS clientes_alterado AFTER UPDATE OF dados, telefone_whatsapp ON clientes
+WHEN OLD.dados IS NOT NEW.dados OR OLD.telefone_whatsapp IS NOT NEW.telefone_whatsapp BEGIN
+    UPDATE sequencia_alteracoes SET valor = valor + 1 WHERE id = 1;
+    UPDATE clientes SET alterado_em = (SELECT valor FROM sequencia_alteracoes WHERE id = 1) WHERE email = NEW.email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS clientes_apagado AFTER DELETE ON clientes BEGIN
+    UPDATE sequencia_alteracoes SET valor = valor + 1 WHERE id = 1;
+    INSERT OR REPLACE INTO clientes_removidos (email, alterado_em)
+        VALUES (OLD.email, (SELECT valor FROM sequencia_alteracoes WHERE id = 1));
+END;
+"""
+
+_UPSERT = """
+INSERT INTO clientes (email, telefone_whatsapp, dados) VALUES (?, ?, ?)
+ON CONFLICT(email) DO UPDATE SET
+    telefone_whatsapp = excluded.telefone_whatsapp,
+    dados = excluded.dados,
+    versao = clientes.versao + (clientes.dados IS NOT excluded.dados)
+"""
+
+_conexao = None
+_lock = threading.RLock()
+
+
+class TelefoneDuplicado(Exception):
+    pass
+
+
+def configurar_banco(caminho_banco, caminho_json=None):
+    """Troca o arquivo do banco (usado pelos benchmarks e scripts de migracao)."""
+    global ARQUIVO_BANCO, ARQUIVO_JSON_LEGADO, _conexao
+    with _lock:
+        if _conexao is not None:
+            _conexao.close()
+            _conexao = None
+        ARQUIVO_BANCO = caminho_banco
+        if caminho_json is not None:
+            ARQUIVO_JSON_LEGADO = caminho_json
+
+
+def conectar():
+    """Abre (uma vez por processo) a conexao SQLite. Na primeira criacao migra o JSON legado."""
+    global _conexao
+    if _conexao is not None:
+        return _conexao
+
+    with _lock:
+        if _conexao is not None:
+            return _conexao
+
+        banco_novo = not os.path.exists(ARQUIVO_BANCO)
+        conn = sqlite3.connect(ARQUIVO_BANCO, check_same_thread=False, isolation_level=None, timeout=10)
+        # WAL permite leitores concorrentes enquanto outro processo escreve
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _adicionar_coluna_alterado_em(conn)
+        conn.executescript(_SCHEMA_ALTERACOES)
+        _conexao = conn
+
+        if banco_novo and os.path.exists(ARQUIVO_JSON_LEGADO):
+            migrar_json(ARQUIVO_JSON_LEGADO)
+
+        return _conexao
+
+
+def _adicionar_coluna_alterado_em(conn):
+    """Bancos criados antes da sequencia de alteracoes: as linhas antigas ficam com alterado_em = 0."""
+    colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(clientes)")}
+    if "alterado_em" in colunas:
+        return
+    try:
+        conn.execute("ALTER TABLE clientes ADD COLUMN alterado_em INTEGER NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError as e:
+        # Outro worker adicionou a coluna ao mesmo tempo
+        if "duplicate column" not in str(e):
+            raise
+
+
+def _decodificar(linha):
+    if linha is None:
+        return None
+    return json.loads(linha[0])
+
+
+def obter_cliente(email):
+    conn = conectar()
+    with _lock:
+        linha = conn.execute("SELECT dados FROM clientes WHERE email = ?", (email,)).fetchone()
+    return _decodificar(linha)
+
+
+def obter_cliente_versionado(email):
+    """Retorna (dados, versao); a versao sobe a cada gravacao do cliente. (None, None) se nao existe."""
+    conn = conectar()
+    with _lock:
+        linha = conn.execute("SELECT dados, versao FROM clientes WHERE email = ?", (email,)).fetchone()
+    if linha is None:
+        return None, None
+    return json.loads(linha[0]), linha[1]
+
+
+def obter_cliente_por_telefone(telefone):
+    conn = conectar()
+    with _lock:
+        linha = conn.execute("SELECT dados FROM clientes WHERE telefone_whatsapp = ?", (telefone,)).fetchone()
+    return _decodificar(linha)
+
+
+def listar_telefones():
+    """Retorna {telefone_whatsapp: email} (apenas as duas colunas indexadas, sem decodificar os dados)."""
+    conn = conectar()
+    with _lock:
+        linhas = conn.execute("SELECT telefone_whatsapp, email FROM clientes WHERE telefone_whatsapp IS NOT NULL").fetchall()
+    return dict(linhas)
+
+
+def alteracoes_desde(sequencia=None):
+    """
+    Retorna (sequencia_atual, alterados, removidos) num mesmo snapshot do banco:
+    alterados = {email: telefone_whatsapp} dos clientes gravados depois de `sequencia`
+    (todos, se None) e removidos = e-mails apagados depois dela. Nao decodifica os dados.
+    """
+    conn = conectar()
+    desde = -1 if sequencia is None else sequencia
+    with _lock:
+        conn.execute("BEGIN")
+        try:
+            atual = conn.execute("SELECT valor FROM sequencia_alteracoes WHERE id = 1").fetchone()[0]
+            alterados = dict(conn.execute(
+                "SELECT email, telefone_whatsapp FROM clientes WHERE alterado_em > ?", (desde,)
+            ))
+            removidos = set()
+            if sequencia is not None:
+                removidos = {email for (email,) in conn.execute(
+                    "SELECT email FROM clientes_removidos WHERE alterado_em > ?", (desde,)
+                )}
+        finally:
+            conn.execute("COMMIT")
+    return atual, alterados, removidos
+
+
+def versao_dados():
+    """Muda sempre que OUTRA conexao (ex: outro worker) grava no banco. Escritas desta conexao nao alteram."""
+    conn = conectar()
+    with _lock:
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def listar_clientes():
+    """Retorna {email: dados} com todos os clientes. Custo O(N), evitar no caminho das mensagens."""
+    conn = conectar()
+    with _lock:
+        linhas = conn.execute("SELECT email, dados FROM clientes").fetchall()
+    return {email: json.loads(dados) for email, dados in linhas}
+
+
+def inserir_cliente(dados):
+    """Insere um cliente novo. Retorna False se o e-mail ja existir; lanca TelefoneDuplicado se o numero ja estiver em uso."""
+    conn = conectar()
+    with _lock:
+        try:
+            conn.execute(
+                "INSERT INTO clientes (email, telefone_whatsapp, dados) VALUES (?, ?, ?)",
+                (dados["email"], dados.get("telefone_whatsapp") or None, json.dumps(dados)),
+            )
+        except sqlite3.IntegrityError as e:
+            if "telefone_whatsapp" in str(e):
+                raise TelefoneDuplicado(dados.get("telefone_whatsapp"))
+            return False
+    return True
+
+
+def atualizar_cliente(email, alteracao):
+    """
+    Le, altera e grava um cliente dentro de uma unica transacao.
+    `alteracao` recebe o dict do cliente, altera no lugar e retorna o resultado que sera repassado.
+    Se o dict sai igual (ex: desconto sem saldo), nada e gravado e a versao nao sobe.
+    Retorna (encontrado, resultado, alterado); lanca TelefoneDuplicado se o novo numero ja for de outro cliente.
+    """
+    conn = conectar()
+    with _lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            linha = conn.execute("SELECT dados FROM clientes WHERE email = ?", (email,)).fetchone()
+            if linha is None:
+                conn.execute("ROLLBACK")
+                return False, None, False
+
+            dados = json.loads(linha[0])
+            resultado = alteracao(dados)
+            novo = json.dumps(dados)
+            if novo == linha[0]:
+                conn.execute("ROLLBACK")
+                return True, resultado, False
+            conn.execute(
+                "UPDATE clientes SET dados = ?, telefone_whatsapp = ?, versao = versao + 1 WHERE email = ?",
+                (novo, dados.get("telefone_whatsapp") or None, email),
+            )
+            conn.execute("COMMIT")
+            return True, resultado, True
+        except sqlite3.IntegrityError:
+            conn.execute("ROLLBACK")
+            raise TelefoneDuplicado(dados.get("telefone_whatsapp"))
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def substituir_base(base):
+    """
+    Grava o dict completo {email: dados} (compatibilidade com o antigo salvar_base).
+    Upsert em vez de apagar e reinserir: a versao de quem nao mudou continua a mesma.
+    """
+    conn = conectar()
+    with _lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existentes = {email for (email,) in conn.execute("SELECT email FROM clientes")}
+            conn.executemany("DELETE FROM clientes WHERE email = ?", [(email,) for email in existentes - base.keys()])
+            # Solta os telefones antes do upsert: dois clientes podem trocar de numero entre si
+            conn.execute("UPDATE clientes SET telefone_whatsapp = NULL")
+            _inserir_varios(conn, base.values())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def _inserir_varios(conn, clientes):
+    total = 0
+    for dados in clientes:
+        telefone = dados.get("telefone_whatsapp") or None
+        try:
+            conn.execute(_UPSERT, (dados["email"], telefone, json.dumps(dados)))
+        except sqlite3.IntegrityError:
+            # Numero ja usado por outro e-mail: mantem o cliente, mas fora do indice de telefone
+            logger.warning(f"Telefone duplicado ignorado no indice: {telefone} ({dados.get('email')})")
+            conn.execute(_UPSERT, (dados["email"], None, json.dumps(dados)))
+        total += 1
+    return total
+
+
+def migrar_json(caminho_json=None):
+    """Migracao unica: importa o base_clientes.json antigo para o SQLite."""
+    caminho_json = caminho_json or ARQUIVO_JSON_LEGADO
+    try:
+        with open(caminho_json, "r", encoding="utf-8") as f:
+            base = json.load(f)
+    except Exception as e:
+        logger.error(f"Erro ao ler {caminho_json} para migracao: {e}")
+        return 0
+
+    conn = conectar()
+    with _lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total = _inserir_varios(conn, base.values())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    logger.info(f"Migrados {total} clientes de {caminho_json} para {ARQUIVO_BANCO}")
+    return total
+
+
+if __name__ == "__main__":
+    # Uso: python banco_clientes.py  -> importa o base_clientes.json para o base_clientes.db
+    if os.path.exists(ARQUIVO_BANCO):
+        print(f"Clientes migrados: {migrar_json()}")
+    else:
+        # Banco novo: conectar() ja importa o JSON legado (chamar migrar_json de novo importaria duas vezes)
+        total = conectar().execute("SELECT COUNT(*) FROM clientes").fetchone()[0]
+        print(f"Banco criado com {total} clientes migrados")
@@ -0,0 +1,249 @@
+"""
+Teste de carga do bot inteiro: sobe o main.app (uvicorn) contra o Groq falso (HTTP), o fal e o
+Google Calendar falsos (em processo, ver servidores_fake.py), com latências configuráveis, e
+coloca N números de WhatsApp conversando ao mesmo tempo num roteiro de agendamento:
+
+    1. pergunta o preço            (caminho rápido, sem IA)
+    2. pede horários livres numa data   (IA -> verificar_agenda -> IA)
+    3. agenda um horário           (IA -> agendar_servico -> IA)
+    4. agradece                    (IA, sem tool)
+
+Uso: python benchmark_carga.py [--numeros 50] [--rodadas 1] [--agenda interna|google]
+                               [--latencia-groq-ms 300] [--latencia-google-ms 150] [--latencia-fal-ms 2000]
+
+Cada número é uma barbearia cadastrada (o dono conversando com o próprio bot). O servidor roda
+numa pasta temporária, sem tocar nas bases do projeto. Reporta p50/p95/p99 e req/s, geral e por
+passo, a média de cada etapa do /metrics, e acrescenta o resultado em resultados_carga.jsonl
+(comparando com a última execução com os mesmos parâmetros).
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PASTA_PROJETO = os.path.dirname(os.path.abspath(__file__))
+ARQUIVO_RESULTADOS = os.path.join(PASTA_PROJETO, "resultados_carga.jsonl")
+PORTA_GROQ = 9021
+PORTA_BOT = 9022
+
+PASSOS = ["preco", "horarios", "agendar", "agradecer"]
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def _resumo(latencias):
+    return {
+        "requisicoes": len(latencias),
+        "p50_ms": round(_percentil(latencias, 0.50) * 1000, 1),
+        "p95_ms": round(_percentil(latencias, 0.95) * 1000, 1),
+        "p99_ms": round(_percentil(latencias, 0.99) * 1000, 1),
+    }
+
+
+def roteiro(i, rodada):
+    """Mensagens do número i; cada número agenda num horário diferente para não colidir."""
+    dia = (datetime.date.today() + datetime.timedelta(days=1 + rodada + i // 16)).isoformat()
+    minuto = 9 * 60 + (i % 16) * 30
+    hora = f"{minuto // 60:02d}:{minuto % 60:02d}"
+    return [
+        ("preco", "quanto custa o corte?"),
+        ("horarios", f"quais horários livres para corte em {dia}?"),
+        ("agendar", f"quero agendar corte em {dia} {hora}, sou Cliente{i}"),
+        ("agradecer", "obrigado!"),
+    ]
+
+
+def _telefone(i):
+    return f"whatsapp:+5511900{i:06d}"
+
+
+def _aguardar(url, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            httpx.get(url, timeout=2)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Servidor não subiu: {url}")
+
+
+async def cadastrar(cliente, numeros, agenda):
+    for i in range(numeros):
+        resposta = await cliente.post("/api/auth/register", json={
+            "email": f"carga{i}@teste.com", "password": "senha", "phone": _telefone(i).removeprefix("whatsapp:"),
+            "nome_barbearia": f"Barbearia Carga {i}", "nome_bot": "Bot", "tipo_agenda": agenda,
+        })
+        resposta.raise_for_status()
+
+
+async def conversar(cliente, i, rodadas, latencias, erros):
+    for rodada in range(rodadas):
+        for passo, texto in roteiro(i, rodada):
+            inicio = time.perf_counter()
+            try:
+                resposta = await cliente.post("/whatsapp", data={"From": _telefone(i), "Body": texto, "NumMedia": "0"})
+                ok = resposta.status_code == 200 and "Erro interno" not in resposta.text
+            except httpx.HTTPError:
+                ok = False
+            latencias[passo].append(time.perf_counter() - inicio)
+            if not ok:
+                erros[passo] += 1
+
+
+def etapas_do_metrics(texto):
+    """Média (ms) de cada etapa do reply_whatsapp, somando tenants, a partir do /metrics."""
+    somas, contagens = {}, {}
+    for linha in texto.splitlines():
+        achado = re.match(r'whatsapp_etapa_segundos_(sum|count)\{.*?etapa="([^"]+)".*\} (\S+)', linha)
+        if achado:
+            destino = somas if achado.group(1) == "sum" else contagens
+            destino[achado.group(2)] = destino.get(achado.group(2), 0) + float(achado.group(3))
+    return {etapa: round(somas[etapa] / contagens[etapa] * 1000, 2) for etapa in somas if contagens.get(etapa)}
+
+
+async def rodar(opcoes):
+    url_bot = f"http://127.0.0.1:{PORTA_BOT}"
+    limites = httpx.Limits(max_connections=opcoes.numeros + 10, max_keepalive_connections=opcoes.numeros + 10)
+    async with httpx.AsyncClient(base_url=url_bot, timeout=120, limits=limites) as cliente:
+        await cadastrar(cliente, opcoes.numeros, opcoes.agenda)
+
+        latencias = {passo: [] for passo in PASSOS}
+        erros = {passo: 0 for passo in PASSOS}
+        inicio = time.perf_counter()
+        await asyncio.gather(*(conversar(cliente, i, opcoes.rodadas, latencias, erros) for i in range(opcoes.numeros)))
+        duracao = time.perf_counter() - inicio
+
+        metrics = (await cliente.get("/metrics")).text
+
+    todas = [valor for lista in latencias.values() for valor in lista]
+    return {
+        "duracao_s": round(duracao, 2),
+        "req_por_s": round(len(todas) / duracao, 1),
+        "erros": sum(erros.values()),
+        "geral": _resumo(todas),
+        "por_passo": {passo: dict(_resumo(latencias[passo]), erros=erros[passo]) for passo in PASSOS},
+        "etapas_ms": etapas_do_metrics(metrics),
+    }
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PASTA_PROJETO,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _anterior(parametros):
+    if not os.path.exists(ARQUIVO_RESULTADOS):
+        return None
+    ultimo = None
+    with open(ARQUIVO_RESULTADOS, encoding="utf-8") as f:
+        for linha in f:
+            registro = json.loads(linha)
+            if registro.get("parametros") == parametros:
+                ultimo = registro
+    return ultimo
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--numeros", type=int, default=50, help="números de WhatsApp simultâneos")
+    parser.add_argument("--rodadas", type=int, default=1, help="vezes que cada número repete o roteiro")
+    parser.add_argument("--agenda", choices=["interna", "google"], default="interna")
+    parser.add_argument("--latencia-groq-ms", type=float, default=300)
+    parser.add_argument("--latencia-google-ms", type=float, default=150)
+    parser.add_argument("--latencia-fal-ms", type=float, default=2000)
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn (>1 usa CONVERSAS_BACKEND=sqlite)")
+    parser.add_argument("--nao-salvar", action="store_true")
+    opcoes = parser.parse_args()
+
+    parametros = {
+        "numeros": opcoes.numeros, "rodadas": opcoes.rodadas, "agenda": opcoes.agenda,
+        "latencia_groq_ms": opcoes.latencia_groq_ms, "latencia_google_ms": opcoes.latencia_google_ms,
+        "latencia_fal_ms": opcoes.latencia_fal_ms, "workers": opcoes.workers,
+    }
+
+    with tempfile.TemporaryDirectory() as pasta:
+        ambiente = dict(
+            os.environ,
+            PYTHONPATH=PASTA_PROJETO + os.pathsep + os.environ.get("PYTHONPATH", ""),
+            GROQ_BASE_URL=f"http://127.0.0.1:{PORTA_GROQ}/v1",
+            GROQ_API_KEY="fake",
+            FAL_BACKEND="fake",
+            FAL_LATENCIA_MS=str(opcoes.latencia_fal_ms),
+            GOOGLE_BACKEND="fake",
+            GOOGLE_LATENCIA_MS=str(opcoes.latencia_google_ms),
+            CONVERSAS_BACKEND="sqlite" if opcoes.workers > 1 else "memoria",
+        )
+        groq = subprocess.Popen([
+            sys.executable, os.path.join(PASTA_PROJETO, "servidores_fake.py"), "groq",
+            "--porta", str(PORTA_GROQ), "--latencia-ms", str(opcoes.latencia_groq_ms),
+        ])
+        # O log do bot (uma linha por mensagem) iria para o terminal junto com o relatório
+        caminho_log = os.path.join(pasta, "bot.log")
+        log_bot = open(caminho_log, "w")
+        bot = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(PORTA_BOT),
+            "--workers", str(opcoes.workers), "--log-level", "warning",
+        ], cwd=pasta, env=ambiente, stdout=log_bot, stderr=subprocess.STDOUT)
+        try:
+            _aguardar(f"http://127.0.0.1:{PORTA_GROQ}/docs")
+            _aguardar(f"http://127.0.0.1:{PORTA_BOT}/metrics")
+            resultado = asyncio.run(rodar(opcoes))
+        except Exception:
+            with open(caminho_log, encoding="utf-8", errors="replace") as f:
+                print("".join(f.readlines()[-40:]), file=sys.stderr)
+            raise
+        finally:
+            bot.terminate()
+            groq.terminate()
+            bot.wait(timeout=30)
+            groq.wait(timeout=30)
+            log_bot.close()
+
+    geral = resultado["geral"]
+    print(f"{opcoes.numeros} números x {opcoes.rodadas} rodada(s), agenda {opcoes.agenda}, "
+          f"groq {opcoes.latencia_groq_ms:.0f} ms, google {opcoes.latencia_google_ms:.0f} ms")
+    print(f"{'passo':>10} | {'req':>6} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'p99 (ms)':>9} | {'erros':>5}")
+    for passo, dados in resultado["por_passo"].items():
+        print(f"{passo:>10} | {dados['requisicoes']:>6} | {dados['p50_ms']:>9.1f} | {dados['p95_ms']:>9.1f} | {dados['p99_ms']:>9.1f} | {dados['erros']:>5}")
+    print(f"{'geral':>10} | {geral['requisicoes']:>6} | {geral['p50_ms']:>9.1f} | {geral['p95_ms']:>9.1f} | {geral['p99_ms']:>9.1f} | {resultado['erros']:>5}")
+    print(f"throughput: {resultado['req_por_s']} req/s em {resultado['duracao_s']} s")
+    print(f"etapas (média ms): {resultado['etapas_ms']}")
+
+    anterior = _anterior(parametros)
+    if anterior:
+        antes = anterior["resultado"]
+        print(f"execução anterior ({anterior['data']}, {anterior.get('commit')}): "
+              f"p95 {antes['geral']['p95_ms']} -> {geral['p95_ms']} ms, "
+              f"{antes['req_por_s']} -> {resultado['req_por_s']} req/s")
+
+    if not opcoes.nao_salvar:
+        registro = {
+            "data": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit_atual(),
+            "parametros": parametros,
+            "resultado": resultado,
+        }
+        with open(ARQUIVO_RESULTADOS, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        print(f"resultado salvo em {ARQUIVO_RESULTADOS}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark das buscas de cliente no banco SQLite.
+
+Uso: python benchmark_clientes.py [--consultas 2000]
+
+Gera bases sinteticas de 10 ate 100k barbearias em uma pasta temporaria e mede
+o custo medio de buscar_cliente_por_telefone / autenticar_cliente. Com o indice
+o tempo por busca deve ficar praticamente constante entre os tamanhos.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import json
+
+import banco_clientes
+import cache_clientes
+import gerenciador_clientes
+
+TAMANHOS = [10, 100, 1_000, 10_000, 100_000]
+
+
+def gerar_base(caminho_banco, quantidade):
+    banco_clientes.configurar_banco(caminho_banco, caminho_json=os.path.join(os.path.dirname(caminho_banco), "nao_existe.json"))
+    conn = banco_clientes.conectar()
+    linhas = []
+    for i in range(quantidade):
+        email = f"barbearia{i}@teste.com"
+        telefone = f"whatsapp:+5500{i:09d}"
+        dados = gerenciador_clientes.get_cliente_padrao(email, "senha", telefone, f"Barbearia {i}", "Bot")
+        linhas.append((email, telefone, json.dumps(dados)))
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO clientes (email, telefone_whatsapp, dados) VALUES (?, ?, ?)", linhas)
+    conn.execute("COMMIT")
+    cache_clientes.cache.invalidar()
+
+
+def medir(funcao, argumentos):
+    inicio = time.perf_counter()
+    for args in argumentos:
+        funcao(*args)
+    return (time.perf_counter() - inicio) / len(argumentos) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--consultas", type=int, default=2000)
+    opcoes = parser.parse_args()
+
+    print(f"{'clientes':>10} | {'telefone (us)':>14} | {'login (us)':>11}")
+    with tempfile.TemporaryDirectory() as pasta:
+        for quantidade in TAMANHOS:
+            gerar_base(os.path.join(pasta, f"clientes_{quantidade}.db"), quantidade)
+            sorteio = [random.randrange(quantidade) for _ in range(opcoes.consultas)]
+
+            t_tel = medir(gerenciador_clientes.buscar_cliente_por_telefone, [(f"whatsapp:+5500{i:09d}",) for i in sorteio])
+            t_login = medir(gerenciador_clientes.autenticar_cliente, [(f"barbearia{i}@teste.com", "senha") for i in sorteio])
+            print(f"{quantidade:>10} | {t_tel:>14.1f} | {t_login:>11.1f}")
+            print(f"{'':>10}   cache: {cache_clientes.cache.estatisticas()}")
+
+        # fecha a conexao antes de apagar a pasta temporaria
+        banco_clientes.configurar_banco("base_clientes.db", "base_clientes.json")
+
+
+if __name__ == "__main__":
+    main()
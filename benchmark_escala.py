@@ -0,0 +1,254 @@
+"""
+Benchmark de escala do armazenamento: as funções do caminho quente medidas em bases sintéticas
+de 10, 1k, 10k e 100k barbearias, cada base com 1M de agendamentos divididos entre elas
+(100k por barbearia na menor, 10 por barbearia na maior).
+
+Uso: python benchmark_escala.py [--tamanhos 10,1000,10000,100000] [--agendamentos 1000000]
+                                [--baseline baseline_escala.json] [--limite 0.25] [--salvar-baseline]
+
+Mede o custo médio (us) de buscar_cliente_por_telefone, autenticar_cliente,
+descontar_credito_video, salvar_agendamento_interno, listar_agenda_interna e carregar_precos
+(melhor de --repeticoes). Tudo roda numa pasta temporária.
+
+Com um baseline salvo, sai com código 1 se alguma medida ficou mais de --limite (25%) acima dele
+(diferenças menores que --tolerancia-us são ruído e não contam). --salvar-baseline grava o
+resultado atual como novo baseline.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import banco_clientes
+import cache_clientes
+import diario_agendamentos
+import estatisticas_dashboard
+import gerenciador_clientes
+import gerenciador_precos
+
+PASTA_PROJETO = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PADRAO = os.path.join(PASTA_PROJETO, "baseline_escala.json")
+TAMANHOS = [10, 1_000, 10_000, 100_000]
+FUNCOES = [
+    "buscar_cliente_por_telefone",
+    "autenticar_cliente",
+    "descontar_credito_video",
+    "salvar_agendamento_interno",
+    "listar_agenda_interna",
+    "carregar_precos",
+]
+
+
+def _email(i):
+    return f"barbearia{i}@teste.com"
+
+
+def _telefone(i):
+    return f"whatsapp:+5500{i:09d}"
+
+
+def gerar_clientes(pasta, quantidade):
+    banco_clientes.configurar_banco(os.path.join(pasta, "base_clientes.db"), caminho_json=os.path.join(pasta, "nao_existe.json"))
+    conn = banco_clientes.conectar()
+    linhas = []
+    for i in range(quantidade):
+        dados = gerenciador_clientes.get_cliente_padrao(_email(i), "senha", _telefone(i), f"Barbearia {i}", "Bot")
+        dados["creditos_video"] = 10 ** 9
+        linhas.append((_email(i), _telefone(i), json.dumps(dados)))
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO clientes (email, telefone_whatsapp, dados) VALUES (?, ?, ?)", linhas)
+    conn.execute("COMMIT")
+    cache_clientes.cache.invalidar()
+
+
+def gerar_agendamentos(quantidade_clientes, total):
+    """Snapshots do diário com `total` agendamentos divididos igualmente entre as barbearias."""
+    inicio = datetime.datetime(2026, 1, 5, 9, 0)
+    por_cliente, sobra = divmod(total, quantidade_clientes)
+    for i in range(quantidade_clientes):
+        eventos = []
+        for k in range(por_cliente + (1 if i < sobra else 0)):
+            # 20 horários de 30 min por dia
+            data_hora = inicio + datetime.timedelta(days=k // 20, minutes=(k % 20) * 30)
+            eventos.append({
+                "id": f"{i}-{k}", "barbeiro": "Principal", "start": data_hora.isoformat(timespec="seconds"),
+                "title": f"Cliente {k} - Principal", "cliente": f"Cliente {k}", "servico": "corte",
+                "duracao": 30, "google_event_id": None, "calendar_id": None,
+            })
+        caminho = os.path.join(diario_agendamentos.PASTA_AGENDAMENTOS, f"{diario_agendamentos.nome_arquivo(_email(i))}.snapshot.json")
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump({"email_dono": _email(i), "eventos": eventos}, f, ensure_ascii=False)
+
+
+@contextmanager
+def estado_preservado():
+    """
+    Guarda o estado global dos módulos que o benchmark troca (conexão e arquivos do banco de
+    clientes, diário, estatísticas do dashboard, diretório de trabalho) e devolve exatamente o
+    mesmo na saída. As conexões originais só são desligadas, nunca fechadas.
+    """
+    salvo = (
+        os.getcwd(),
+        banco_clientes.ARQUIVO_BANCO, banco_clientes.ARQUIVO_JSON_LEGADO, banco_clientes._conexao,
+        dict(diario_agendamentos._estados), diario_agendamentos._pasta_pronta,
+        estatisticas_dashboard._estatisticas,
+    )
+    banco_clientes._conexao = None
+    estatisticas_dashboard._estatisticas = None
+    try:
+        yield
+    finally:
+        fechar_base()
+        (pasta, banco_clientes.ARQUIVO_BANCO, banco_clientes.ARQUIVO_JSON_LEGADO, banco_clientes._conexao,
+         estados, diario_agendamentos._pasta_pronta, estatisticas_dashboard._estatisticas) = salvo
+        diario_agendamentos._estados.update(estados)
+        # O cache só guarda cópias do banco: invalidado, volta a ler o banco restaurado
+        cache_clientes.cache.invalidar()
+        os.chdir(pasta)
+
+
+def fechar_base():
+    """Fecha o que foi aberto na pasta temporária, antes de apagá-la."""
+    if banco_clientes._conexao is not None:
+        banco_clientes._conexao.close()
+        banco_clientes._conexao = None
+    if estatisticas_dashboard._estatisticas is not None:
+        estatisticas_dashboard._estatisticas._conn.close()
+        estatisticas_dashboard._estatisticas = None
+    diario_agendamentos._estados.clear()
+
+
+def preparar_base(pasta, quantidade, agendamentos):
+    """Troca o diretório de trabalho para `pasta` e monta ali clientes, agendamentos e preços."""
+    os.chdir(pasta)
+    diario_agendamentos._estados.clear()
+    diario_agendamentos._pasta_pronta = False
+    # Estatísticas criadas antes dos snapshots: o preenchimento inicial não relê 1M de agendamentos
+    estatisticas_dashboard._estatisticas = None
+    estatisticas_dashboard.estatisticas()
+
+    gerar_clientes(pasta, quantidade)
+    gerar_agendamentos(quantidade, agendamentos)
+    gerenciador_precos.salvar_precos(gerenciador_precos.PRECOS_PADRAO)
+    diario_agendamentos._estados.clear()
+
+
+def medir(funcao, argumentos, repeticoes):
+    """Menor média (us por chamada) entre as repetições."""
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for args in argumentos:
+            funcao(*args)
+        media = (time.perf_counter() - inicio) / len(argumentos) * 1e6
+        melhor = media if melhor is None else min(melhor, media)
+    return melhor
+
+
+def medir_base(quantidade, opcoes):
+    sorteio = [random.randrange(quantidade) for _ in range(opcoes.consultas)]
+    # As funções de agenda usam poucas barbearias já carregadas (o carregamento inicial é único por processo)
+    amostra = random.sample(range(quantidade), min(quantidade, opcoes.amostra_agenda))
+    for i in amostra:
+        gerenciador_clientes.listar_agenda_interna(_email(i))
+    agenda = [amostra[n % len(amostra)] for n in range(opcoes.consultas_agenda)]
+    novos = iter(range(10 ** 9))
+
+    def _novo_agendamento(i):
+        # Horários em 2030, um por chamada: nunca conflitam, então toda chamada grava
+        data_hora = datetime.datetime(2030, 1, 1, 9, 0) + datetime.timedelta(minutes=30 * next(novos))
+        return gerenciador_clientes.salvar_agendamento_interno(
+            _email(i), "Principal", data_hora.isoformat(timespec="seconds"), "Bench", servico="corte", duracao=30
+        )
+
+    return {
+        "buscar_cliente_por_telefone": medir(gerenciador_clientes.buscar_cliente_por_telefone, [(_telefone(i),) for i in sorteio], opcoes.repeticoes),
+        "autenticar_cliente": medir(gerenciador_clientes.autenticar_cliente, [(_email(i), "senha") for i in sorteio], opcoes.repeticoes),
+        "descontar_credito_video": medir(gerenciador_clientes.descontar_credito_video, [(_email(i),) for i in sorteio[:opcoes.consultas_agenda]], opcoes.repeticoes),
+        "salvar_agendamento_interno": medir(_novo_agendamento, [(i,) for i in agenda], opcoes.repeticoes),
+        "listar_agenda_interna": medir(gerenciador_clientes.listar_agenda_interna, [(_email(i),) for i in agenda], opcoes.repeticoes),
+        "carregar_precos": medir(gerenciador_precos.carregar_precos, [()] * opcoes.consultas, opcoes.repeticoes),
+    }
+
+
+def comparar(resultados, baseline, limite, tolerancia_us):
+    """Lista de regressões (tamanho, função, baseline, atual) acima do limite."""
+    regressoes = []
+    for tamanho, medidas in resultados.items():
+        anteriores = baseline.get("resultados", {}).get(tamanho, {})
+        for funcao, atual in medidas.items():
+            antes = anteriores.get(funcao)
+            if antes is None:
+                continue
+            if atual > antes * (1 + limite) and atual - antes > tolerancia_us:
+                regressoes.append((tamanho, funcao, antes, atual))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tamanhos", default=",".join(str(t) for t in TAMANHOS), help="barbearias por base, separadas por vírgula")
+    parser.add_argument("--agendamentos", type=int, default=1_000_000, help="agendamentos por base")
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--consultas-agenda", type=int, default=200, help="chamadas das funções de agenda e de crédito")
+    parser.add_argument("--amostra-agenda", type=int, default=5, help="barbearias usadas nas funções de agenda")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PADRAO)
+    parser.add_argument("--limite", type=float, default=float(os.getenv("BENCH_LIMITE_REGRESSAO", "0.25")))
+    parser.add_argument("--tolerancia-us", type=float, default=2.0)
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--semente", type=int, default=42)
+    opcoes = parser.parse_args()
+    random.seed(opcoes.semente)
+
+    tamanhos = [int(t) for t in opcoes.tamanhos.split(",") if t.strip()]
+    parametros = {"agendamentos": opcoes.agendamentos, "consultas": opcoes.consultas, "consultas_agenda": opcoes.consultas_agenda}
+    resultados = {}
+
+    print(f"{'barbearias':>10} | " + " | ".join(f"{f[:14]:>14}" for f in FUNCOES) + "   (us por chamada)")
+    with estado_preservado():
+        for quantidade in tamanhos:
+            with tempfile.TemporaryDirectory() as pasta:
+                inicio = time.perf_counter()
+                preparar_base(pasta, quantidade, opcoes.agendamentos)
+                geracao = time.perf_counter() - inicio
+                medidas = medir_base(quantidade, opcoes)
+                resultados[str(quantidade)] = {f: round(v, 2) for f, v in medidas.items()}
+                print(f"{quantidade:>10} | " + " | ".join(f"{medidas[f]:>14.1f}" for f in FUNCOES) + f"   (base gerada em {geracao:.0f} s)")
+                fechar_base()
+                os.chdir(PASTA_PROJETO)
+
+    if len(resultados) > 1:
+        menor, maior = resultados[str(min(tamanhos))], resultados[str(max(tamanhos))]
+        print("escala (maior/menor base): " + ", ".join(f"{f}: {maior[f] / menor[f]:.2f}x" for f in FUNCOES if menor[f]))
+
+    codigo = 0
+    if os.path.exists(opcoes.baseline):
+        with open(opcoes.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("parametros") != parametros:
+            print(f"aviso: baseline gerado com outros parâmetros ({baseline.get('parametros')})")
+        regressoes = comparar(resultados, baseline, opcoes.limite, opcoes.tolerancia_us)
+        for tamanho, funcao, antes, atual in regressoes:
+            print(f"REGRESSÃO {funcao} com {tamanho} barbearias: {antes:.1f} -> {atual:.1f} us (+{(atual / antes - 1) * 100:.0f}%)")
+        if regressoes:
+            codigo = 1
+        else:
+            print(f"sem regressões acima de {opcoes.limite * 100:.0f}% em relação a {opcoes.baseline}")
+
+    if opcoes.salvar_baseline:
+        with open(opcoes.baseline, "w", encoding="utf-8") as f:
+            json.dump({"data": datetime.datetime.now().isoformat(timespec="seconds"), "parametros": parametros,
+                       "resultados": resultados}, f, indent=2)
+        print(f"baseline salvo em {opcoes.baseline}")
+
+    sys.exit(codigo)
+
+
+if __name__ == "__main__":
+    main()
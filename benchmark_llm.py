@@ -0,0 +1,86 @@
+"""
+Compara o cliente LLM antigo (OpenAI sincrono + asyncio.to_thread) com o AsyncOpenAI
+com pool de conexoes usado no main.py, contra o Groq falso de servidores_fake.py.
+
+Uso: python benchmark_llm.py [--conversas 500] [--latencia-ms 400]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+PASTA_PROJETO = os.path.dirname(os.path.abspath(__file__))
+PORTA = 9011
+BASE_URL = f"http://127.0.0.1:{PORTA}/v1"
+MENSAGENS = [{"role": "user", "content": "quanto custa o corte?"}]
+
+
+def _aguardar_servidor(timeout=15):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            httpx.post(f"{BASE_URL}/chat/completions", json={"messages": MENSAGENS}, timeout=5)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("Servidor fake do Groq nao subiu")
+
+
+async def rodar_to_thread(conversas):
+    client = OpenAI(api_key="fake", base_url=BASE_URL)
+
+    async def uma():
+        await asyncio.to_thread(client.chat.completions.create, model="fake", messages=MENSAGENS)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uma() for _ in range(conversas)))
+    return time.perf_counter() - inicio
+
+
+async def rodar_async(conversas, max_conexoes):
+    client = AsyncOpenAI(
+        api_key="fake",
+        base_url=BASE_URL,
+        http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=max_conexoes, max_keepalive_connections=max_conexoes)),
+    )
+
+    async def uma():
+        await client.chat.completions.create(model="fake", messages=MENSAGENS, timeout=30)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uma() for _ in range(conversas)))
+    duracao = time.perf_counter() - inicio
+    await client.close()
+    return duracao
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversas", type=int, default=500)
+    parser.add_argument("--latencia-ms", type=float, default=400)
+    parser.add_argument("--max-conexoes", type=int, default=200)
+    opcoes = parser.parse_args()
+
+    servidor = subprocess.Popen([
+        sys.executable, os.path.join(PASTA_PROJETO, "servidores_fake.py"), "groq",
+        "--porta", str(PORTA), "--latencia-ms", str(opcoes.latencia_ms)
+    ])
+    try:
+        _aguardar_servidor()
+        t_thread = asyncio.run(rodar_to_thread(opcoes.conversas))
+        t_async = asyncio.run(rodar_async(opcoes.conversas, opcoes.max_conexoes))
+    finally:
+        servidor.terminate()
+
+    print(f"{opcoes.conversas} conversas simultaneas, latencia do LLM {opcoes.latencia_ms:.0f} ms")
+    print(f"  to_thread + OpenAI  : {t_thread:6.2f} s ({opcoes.conversas / t_thread:7.1f} req/s)")
+    print(f"  AsyncOpenAI (pool)  : {t_async:6.2f} s ({opcoes.conversas / t_async:7.1f} req/s)")
+
+
+if __name__ == "__main__":
+    main()
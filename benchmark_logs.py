@@ -0,0 +1,112 @@
+"""
+Custo de um logger.info para quem loga (o event loop), no formato antigo e no novo.
+
+Uso: python benchmark_logs.py [--registros 20000] [--formato texto|json] [--disco-lento-ms 0]
+
+- sincrono: FileHandler + StreamHandler pendurados no logger (como era o logger_config)
+- fila: logger_config.Log (QueueHandler; a escrita fica na thread do QueueListener)
+
+O console vai para /dev/null nos dois casos, para medir o disco e não o terminal.
+--disco-lento-ms simula um disco que trava de vez em quando (1 em cada 100 escritas).
+Também mede quanto tempo a thread escritora leva para esvaziar a fila depois.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import logger_config
+
+
+def _mensagem(i):
+    return f"Msg de whatsapp:+55119999{i % 10000:04d} (Barbearia Teste): quero cortar amanhã às 15h ✂️"
+
+
+def _lento(emit, atraso):
+    contador = [0]
+
+    def emit_lento(record):
+        contador[0] += 1
+        if atraso and contador[0] % 100 == 0:
+            time.sleep(atraso)
+        emit(record)
+    return emit_lento
+
+
+def _cronometrar(logger, registros):
+    """Tempo de cada chamada em microssegundos: (média, p99, máximo)."""
+    tempos = []
+    for i in range(registros):
+        inicio = time.perf_counter()
+        logger.info(_mensagem(i))
+        tempos.append((time.perf_counter() - inicio) * 1e6)
+    tempos.sort()
+    return sum(tempos) / len(tempos), tempos[int(0.99 * (len(tempos) - 1))], tempos[-1]
+
+
+def medir_sincrono(pasta, registros, devnull, atraso):
+    logger = logging.getLogger("BenchSincrono")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    formato = logging.Formatter(fmt='%(asctime)s - %(levelname)s - %(name)s - %(message)s', datefmt='%d-%m-%y %H:%M:%S')
+    handlers = [logging.FileHandler(os.path.join(pasta, "sincrono.log"), mode='a', encoding='utf-8'), logging.StreamHandler(devnull)]
+    handlers[0].emit = _lento(handlers[0].emit, atraso)
+    for handler in handlers:
+        handler.setFormatter(formato)
+        logger.addHandler(handler)
+
+    resultado = _cronometrar(logger, registros)
+
+    for handler in handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    return resultado, 0.0
+
+
+def medir_fila(pasta, registros, devnull, formato, atraso):
+    logger_config.LOG_FORMATO = formato
+    logger_config.LOG_FILA_MAX = registros + 1
+    os.chdir(pasta)
+
+    log_setup = logger_config.Log("Bench")
+    log_setup.pipeline.c_handler.setStream(devnull)
+    log_setup.pipeline.f_handler.emit = _lento(log_setup.pipeline.f_handler.emit, atraso)
+    logger = log_setup.get_logger("BenchFila")
+    logger.propagate = False
+
+    resultado = _cronometrar(logger, registros)
+
+    inicio_escrita = time.perf_counter()
+    log_setup.pipeline.parar()
+    drenagem = time.perf_counter() - inicio_escrita
+    descartados = log_setup.estatisticas()["descartados"]
+    if descartados:
+        print(f"atenção: {descartados} registros descartados (fila cheia)")
+    return resultado, drenagem
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--registros", type=int, default=20000)
+    parser.add_argument("--formato", choices=["texto", "json"], default="texto")
+    parser.add_argument("--disco-lento-ms", type=float, default=0)
+    opcoes = parser.parse_args()
+
+    pasta_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as pasta, open(os.devnull, "w", encoding="utf-8") as devnull:
+        try:
+            atraso = opcoes.disco_lento_ms / 1000
+            sinc, _ = medir_sincrono(pasta, opcoes.registros, devnull, atraso)
+            fila, drenagem = medir_fila(pasta, opcoes.registros, devnull, opcoes.formato, atraso)
+        finally:
+            os.chdir(pasta_original)
+
+    print(f"{'pipeline':>10} | {'media (us)':>11} | {'p99 (us)':>9} | {'max (us)':>10}")
+    for nome, (media, p99, maximo) in (("sincrono", sinc), ("fila", fila)):
+        print(f"{nome:>10} | {media:>11.2f} | {p99:>9.2f} | {maximo:>10.0f}")
+    print(f"thread escritora terminou {drenagem * 1000:.0f} ms depois do último registro (formato {opcoes.formato})")
+
+
+if __name__ == "__main__":
+    main()
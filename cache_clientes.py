@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+import banco_clientes
+
+logger = logging.getLogger("CacheClientes")
+
+# Quantos clientes decodificados ficam em memoria e de quanto em quanto tempo
+# conferimos se outro processo gravou no banco.
+MAX_CLIENTES_CACHE = int(os.getenv("CACHE_CLIENTES_MAX", "5000"))
+INTERVALO_VERIFICACAO = float(os.getenv("CACHE_CLIENTES_VERIFICACAO_S", "1.0"))
+
+
+class CacheClientes:
+    """
+    Cache em processo dos clientes com indices por telefone e por e-mail.
+
+    - O indice telefone -> e-mail e completo (so duas strings por cliente), entao numeros
+      que nao sao clientes tambem sao respondidos sem ir ao banco.
+    - Os dados completos ficam num LRU limitado por e-mail.
+    - Escritas deste processo chamam `registrar_escrita`; escritas de outros processos sao
+      detectadas pelo `PRAGMA data_version`, conferido no maximo a cada INTERVALO_VERIFICACAO,
+      e so os clientes alterados desde entao (sequencia de alteracoes do banco) sao relidos.
+    - Os dicts devolvidos sao compartilhados: trate como somente leitura e grave sempre pelas
+      funcoes do gerenciador_clientes (cada escrita troca o objeto inteiro, nunca altera no lugar).
+    """
+
+    def __init__(self, max_clientes=MAX_CLIENTES_CACHE, intervalo_verificacao=INTERVALO_VERIFICACAO):
+        self.max_clientes = max_clientes
+        self.intervalo_verificacao = intervalo_verificacao
+        self._lock = threading.Lock()
+        self._clientes = OrderedDict()
+        self._versoes = {}
+        self._telefones = None
+        self._telefone_por_email = {}
+        self._versao_banco = None
+        self._sequencia = None
+        self._ultima_verificacao = 0.0
+        self.acertos = 0
+        self.falhas = 0
+        self.numeros_desconhecidos = 0
+        self.recargas = 0
+        self.atualizacoes_parciais = 0
+
+    def _garantir_atualizado(self):
+        agora = time.monotonic()
+        if self._telefones is not None and agora - self._ultima_verificacao < self.intervalo_verificacao:
+            return
+        self._ultima_verificacao = agora
+
+        versao = banco_clientes.versao_dados()
+        if self._telefones is not None and versao == self._versao_banco:
+            return
+
+        if self._telefones is None:
+            sequencia, alterados, _ = banco_clientes.alteracoes_desde(None)
+            with self._lock:
+                self._telefones = {tel: email for email, tel in alterados.items() if tel}
+                self._telefone_por_email = {email: tel for tel, email in self._telefones.items()}
+                self._clientes.clear()
+                self._versoes.clear()
+                self._versao_banco = versao
+                self._sequencia = sequencia
+                self.recargas += 1
+            return
+
+        # Outro worker gravou: rele so as linhas alteradas desde a ultima conferencia
+        sequencia, alterados, removidos = banco_clientes.alteracoes_desde(self._sequencia)
+        with self._lock:
+            if self._telefones is None:
+                return
+            # Primeiro solta os numeros antigos: dois clientes podem ter trocado de numero entre si
+            for email in removidos | alterados.keys():
+                antigo = self._telefone_por_email.pop(email, None)
+                if antigo is not None and self._telefones.get(antigo) == email:
+                    del self._telefones[antigo]
+            for email, telefone in alterados.items():
+                if telefone:
+                    self._telefones[telefone] = email
+                    self._telefone_por_email[email] = telefone
+            for email in removidos | alterados.keys():
+                self._clientes.pop(email, None)
+                self._versoes.pop(email, None)
+            self._versao_banco = versao
+            self._sequencia = sequencia
+            self.atualizacoes_parciais += 1
+
+    def por_email(self, email):
+        self._garantir_atualizado()
+        with self._lock:
+            dados = self._clientes.get(email)
+            if dados is not None:
+                self._clientes.move_to_end(email)
+                self.acertos += 1
+                return dados
+            self.falhas += 1
+
+        dados, versao = banco_clientes.obter_cliente_versionado(email)
+        if dados is not None:
+            with self._lock:
+                self._guardar(email, dados, versao)
+        return dados
+
+    def por_telefone(self, telefone):
+        self._garantir_atualizado()
+        telefones = self._telefones or {}
+        email = telefones.get(telefone)
+        if email is None:
+            with self._lock:
+                self.numeros_desconhecidos += 1
+            return None
+        return self.por_email(email)
+
+    def versao(self, email):
+        """Versao do registro do cliente (sobe a cada escrita); serve de chave para caches derivados."""
+        with self._lock:
+            if email in self._versoes:
+                return self._versoes[email]
+        self.por_email(email)
+        with self._lock:
+            return self._versoes.get(email)
+
+    def _guardar(self, email, dados, versao):
+        self._clientes[email] = dados
+        self._versoes[email] = versao
+        self._clientes.move_to_end(email)
+        while len(self._clientes) > self.max_clientes:
+            antigo, _ = self._clientes.popitem(last=False)
+            self._versoes.pop(antigo, None)
+
+    def registrar_escrita(self, email):
+        """Chamado apos gravar um cliente neste processo: relê so aquela linha e atualiza os indices."""
+        dados, versao = banco_clientes.obter_cliente_versionado(email)
+        with self._lock:
+            if self._telefones is not None:
+                antigo = self._telefone_por_email.pop(email, None)
+                if antigo is not None:
+                    self._telefones.pop(antigo, None)
+                if dados and dados.get("telefone_whatsapp"):
+                    self._telefones[dados["telefone_whatsapp"]] = email
+                    self._telefone_por_email[email] = dados["telefone_whatsapp"]
+            if dados is None:
+                self._clientes.pop(email, None)
+                self._versoes.pop(email, None)
+            else:
+                self._guardar(email, dados, versao)
+
+    def invalidar(self):
+        with self._lock:
+            self._telefones = None
+            self._telefone_por_email = {}
+            self._clientes.clear()
+            self._versoes.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "numeros_desconhecidos": self.numeros_desconhecidos,
+                "recargas": self.recargas,
+                "atualizacoes_parciais": self.atualizacoes_parciais,
+                "taxa_acerto": round(self.acertos / consultas, 4) if consultas else 0.0,
+                "clientes_em_memoria": len(self._clientes),
+                "telefones_indexados": len(self._telefones or {}),
+            }
+
+
+cache = CacheClientes()
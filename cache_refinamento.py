@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger("CacheRefinamento")
+
+ARQUIVO_CACHE = os.getenv("REFINAMENTO_CACHE_ARQUIVO", "cache_refinamento.db")
+MAX_MEMORIA = int(os.getenv("REFINAMENTO_CACHE_MAX_MEMORIA", "1000"))
+MAX_DISCO = int(os.getenv("REFINAMENTO_CACHE_MAX_DISCO", "50000"))
+TTL_S = float(os.getenv("REFINAMENTO_CACHE_TTL_S", str(30 * 24 * 3600)))
+
+
+def normalizar_ideia(texto):
+    """'  Anima AÍ!! ' e 'anima aí' caem na mesma chave: minúsculas, espaços e pontuação final."""
+    texto = re.sub(r"\s+", " ", str(texto or "").lower()).strip()
+    return texto.rstrip(".!?… ")
+
+
+def chave_refinamento(ideia, tipo_geracao, versao=1):
+    bruto = f"{versao}\x00{tipo_geracao}\x00{normalizar_ideia(ideia)}"
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+class CacheRefinamento:
+    """
+    Cache de dois níveis para o refinamento de prompt de vídeo (GeradorDeVideo.refinar_prompt_com_ia):
+    LRU em memória na frente de uma tabela SQLite, ambos com TTL e teto de entradas.
+    Só guarda respostas reais da IA; o prompt de fallback nunca entra.
+    """
+
+    def __init__(self, caminho=ARQUIVO_CACHE, max_memoria=MAX_MEMORIA, max_disco=MAX_DISCO, ttl=TTL_S):
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._memoria = OrderedDict()
+        self._gravacoes = 0
+        self.acertos_memoria = 0
+        self.acertos_disco = 0
+        self.falhas = 0
+
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refinamentos ("
+            "chave TEXT PRIMARY KEY, dados TEXT NOT NULL, criado REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_refinamentos_criado ON refinamentos(criado)")
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is not None:
+                dados, criado = entrada
+                if agora - criado < self.ttl:
+                    self._memoria.move_to_end(chave)
+                    self.acertos_memoria += 1
+                    return dict(dados)
+                del self._memoria[chave]
+
+            linha = self._conn.execute(
+                "SELECT dados, criado FROM refinamentos WHERE chave = ? AND criado > ?", (chave, agora - self.ttl)
+            ).fetchone()
+            if linha is None:
+                self.falhas += 1
+                return None
+            dados = json.loads(linha[0])
+            self._lembrar(chave, dados, linha[1])
+            self.acertos_disco += 1
+            return dict(dados)
+
+    def guardar(self, chave, dados):
+        agora = time.time()
+        with self._lock:
+            self._lembrar(chave, dict(dados), agora)
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO refinamentos (chave, dados, criado) VALUES (?, ?, ?)",
+                    (chave, json.dumps(dados, ensure_ascii=False), agora),
+                )
+                self._gravacoes += 1
+                if self._gravacoes % 100 == 0:
+                    self._limpar_disco()
+            except sqlite3.Error as e:
+                logger.error(f"Erro ao gravar cache de refinamento: {e}")
+
+    def _lembrar(self, chave, dados, criado):
+        """Coloca no LRU em memória. Chamar com o lock."""
+        self._memoria[chave] = (dados, criado)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def _limpar_disco(self):
+        """Apaga expirados e, acima do teto, os mais antigos. Chamar com o lock."""
+        self._conn.execute("DELETE FROM refinamentos WHERE criado <= ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM refinamentos WHERE chave IN ("
+            "SELECT chave FROM refinamentos ORDER BY criado DESC LIMIT -1 OFFSET ?)",
+            (self.max_disco,),
+        )
+
+    def estatisticas(self):
+        with self._lock:
+            total_disco = self._conn.execute("SELECT COUNT(*) FROM refinamentos").fetchone()[0]
+            consultas = self.acertos_memoria + self.acertos_disco + self.falhas
+            return {
+                "memoria": len(self._memoria),
+                "disco": total_disco,
+                "acertos_memoria": self.acertos_memoria,
+                "acertos_disco": self.acertos_disco,
+                "falhas": self.falhas,
+                "taxa_acerto": round((self.acertos_memoria + self.acertos_disco) / consultas, 4) if consultas else 0.0,
+            }
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+import httpx
+
+logger = logging.getLogger("CacheRenders")
+
+ARQUIVO_CACHE = os.getenv("RENDER_CACHE_ARQUIVO", "cache_renders.db")
+TTL_S = float(os.getenv("RENDER_CACHE_TTL_S", str(7 * 24 * 3600)))
+# Baixa o MP4 para PASTA_VIDEOS (a URL do fal pode expirar; o arquivo local não)
+BAIXAR_MP4 = os.getenv("RENDER_CACHE_BAIXAR", "0") == "1"
+PASTA_VIDEOS = os.getenv("RENDER_CACHE_PASTA", "videos_cache")
+MAX_MP4_BYTES = int(os.getenv("RENDER_CACHE_MAX_MP4_BYTES", str(200 * 1024 * 1024)))
+# Com URL pública configurada, acertos com MP4 local são servidos por /media/videos/<chave>.mp4
+URL_PUBLICA = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+# Política de cobrança: um acerto de cache consome crédito de vídeo?
+COBRAR_ACERTO = os.getenv("RENDER_CACHE_COBRAR_ACERTO", "0") == "1"
+
+
+def chave_render(modelo, argumentos):
+    """Hash do modelo + todos os argumentos do fal (mesma entrada -> mesmo vídeo)."""
+    bruto = json.dumps({"modelo": modelo, "argumentos": argumentos}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+class CacheRenders:
+    """
+    Resultado de cada render do Wan, endereçado pelo conteúdo do pedido.
+    obter() devolve a URL de um render idêntico anterior; guardar() registra um render novo
+    e, se configurado, baixa o MP4 para o disco.
+    """
+
+    def __init__(self, caminho=ARQUIVO_CACHE, ttl=TTL_S, baixar=BAIXAR_MP4, pasta=PASTA_VIDEOS):
+        self.ttl = ttl
+        self.baixar = baixar
+        self.pasta = pasta
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS renders ("
+            "chave TEXT PRIMARY KEY, modelo TEXT NOT NULL, video_url TEXT NOT NULL, "
+            "arquivo TEXT, criado REAL NOT NULL, usos INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def caminho_local(self, chave):
+        return os.path.join(self.pasta, f"{chave}.mp4")
+
+    def obter(self, chave):
+        """URL de um render idêntico ainda válido, ou None."""
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT video_url, arquivo, criado FROM renders WHERE chave = ?", (chave,)
+            ).fetchone()
+            tem_local = bool(linha and linha[1] and os.path.exists(linha[1]))
+            # Com o MP4 no disco o acerto não expira junto com a URL do fal
+            if linha is None or (time.time() - linha[2] >= self.ttl and not tem_local):
+                self.falhas += 1
+                return None
+            self._conn.execute("UPDATE renders SET usos = usos + 1 WHERE chave = ?", (chave,))
+            self.acertos += 1
+        if tem_local and URL_PUBLICA:
+            return f"{URL_PUBLICA}/media/videos/{chave}.mp4"
+        return linha[0]
+
+    def guardar(self, chave, modelo, video_url):
+        arquivo = self._baixar(chave, video_url) if self.baixar else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO renders (chave, modelo, video_url, arquivo, criado, usos) VALUES (?, ?, ?, ?, ?, 0)",
+                (chave, modelo, video_url, arquivo, time.time()),
+            )
+
+    def _baixar(self, chave, video_url):
+        destino = self.caminho_local(chave)
+        temporario = destino + ".parcial"
+        try:
+            os.makedirs(self.pasta, exist_ok=True)
+            with httpx.stream("GET", video_url, timeout=60, follow_redirects=True) as resposta:
+                resposta.raise_for_status()
+                total = 0
+                with open(temporario, "wb") as f:
+                    for bloco in resposta.iter_bytes(64 * 1024):
+                        total += len(bloco)
+                        if total > MAX_MP4_BYTES:
+                            raise ValueError(f"MP4 maior que {MAX_MP4_BYTES} bytes")
+                        f.write(bloco)
+            os.replace(temporario, destino)
+            return destino
+        except Exception as e:
+            logger.error(f"Erro ao baixar render {chave[:12]}: {e}")
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            return None
+
+    def estatisticas(self):
+        with self._lock:
+            total, usos = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(usos), 0) FROM renders").fetchone()
+            return {
+                "renders": total,
+                "reaproveitados": usos,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "baixar_mp4": self.baixar,
+                "cobrar_acerto": COBRAR_ACERTO,
+            }
@@ -0,0 +1,375 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import logging
+
+from indice_intervalos import IndiceAgenda, intervalo_do_evento
+
+try:
+    import fcntl  # Trava entre processos (Linux/macOS). No Windows fica so a trava do processo.
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger("DiarioAgendamentos")
+
+PASTA_AGENDAMENTOS = "agendamentos"
+ARQUIVO_LEGADO = "base_agendamentos_internos.json"
+
+# Quando o diario (.jsonl) de uma barbearia passa desse tamanho ele vira snapshot na compactacao
+LIMITE_COMPACTACAO_BYTES = int(os.getenv("AGENDA_LIMITE_COMPACTACAO_BYTES", str(256 * 1024)))
+INTERVALO_COMPACTACAO = float(os.getenv("AGENDA_INTERVALO_COMPACTACAO_S", "300"))
+
+_estados = {}
+_lock_global = threading.Lock()
+_pasta_pronta = False
+_thread_compactacao = None
+
+
+def nome_arquivo(email_dono):
+    """Nome base dos arquivos da barbearia: sha256 do email, dois emails nunca dividem o diario."""
+    return hashlib.sha256(email_dono.encode("utf-8")).hexdigest()
+
+
+class _EstadoBarbearia:
+    """Estado em memoria de uma barbearia: snapshot + linhas do diario ja aplicadas."""
+
+    def __init__(self, email_dono):
+        nome = nome_arquivo(email_dono)
+        self.email_dono = email_dono
+        self.caminho_snapshot = os.path.join(PASTA_AGENDAMENTOS, f"{nome}.snapshot.json")
+        self.caminho_diario = os.path.join(PASTA_AGENDAMENTOS, f"{nome}.jsonl")
+        self.caminho_trava = os.path.join(PASTA_AGENDAMENTOS, f"{nome}.lock")
+        self.lock = threading.RLock()
+        self.eventos = {}
+        self.indice = IndiceAgenda()
+        self.offset = 0
+        self.id_snapshot = None
+
+    # --- aplicacao das operacoes ---
+
+    def aplicar(self, operacao):
+        if operacao.get("op") == "add":
+            evento = operacao["evento"]
+            self.eventos[evento["id"]] = evento
+            self.indice.adicionar_evento(evento)
+        elif operacao.get("op") == "del":
+            evento = self.eventos.pop(operacao["id"], None)
+            if evento is not None:
+                self.indice.remover_evento(evento)
+
+    def _identidade_snapshot(self):
+        try:
+            st = os.stat(self.caminho_snapshot)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _recarregar(self):
+        self.eventos = {}
+        self.indice = IndiceAgenda()
+        self.offset = 0
+        self.id_snapshot = self._identidade_snapshot()
+        if self.id_snapshot is not None:
+            with open(self.caminho_snapshot, "r", encoding="utf-8") as f:
+                for evento in json.load(f).get("eventos", []):
+                    self.aplicar({"op": "add", "evento": evento})
+
+    def sincronizar(self):
+        """Aplica o que outros processos escreveram: recarrega se houve compactacao, senao le so a cauda."""
+        try:
+            tamanho = os.path.getsize(self.caminho_diario)
+        except FileNotFoundError:
+            tamanho = 0
+
+        if self._identidade_snapshot() != self.id_snapshot or tamanho < self.offset:
+            self._recarregar()
+
+        if tamanho == self.offset:
+            return
+
+        with open(self.caminho_diario, "rb") as f:
+            f.seek(self.offset)
+            cauda = f.read()
+
+        # So consome linhas completas; uma escrita pela metade fica para a proxima leitura
+        fim = cauda.rfind(b"\n")
+        if fim < 0:
+            return
+        for linha in cauda[:fim].splitlines():
+            if linha.strip():
+                try:
+                    self.aplicar(json.loads(linha))
+                except json.JSONDecodeError:
+                    logger.error(f"Linha corrompida ignorada no diario de {self.email_dono}")
+        self.offset += fim + 1
+
+    def anexar(self, operacao):
+        linha = (json.dumps(operacao, ensure_ascii=False) + "\n").encode("utf-8")
+        if self.offset == 0:
+            # Diario novo (ou recem compactado): a primeira linha identifica a barbearia
+            cabecalho = json.dumps({"op": "inicio", "email_dono": self.email_dono}, ensure_ascii=False) + "\n"
+            linha = cabecalho.encode("utf-8") + linha
+        with open(self.caminho_diario, "ab") as f:
+            f.write(linha)
+        self.offset += len(linha)
+        self.aplicar(operacao)
+
+
+class _Trava:
+    """Trava da barbearia: RLock do processo + flock no arquivo .lock (exclusiva para escrita)."""
+
+    def __init__(self, estado, exclusiva=True):
+        self.estado = estado
+        self.exclusiva = exclusiva
+        self.arquivo = None
+
+    def __enter__(self):
+        self.estado.lock.acquire()
+        if fcntl is not None:
+            self.arquivo = open(self.estado.caminho_trava, "a")
+            fcntl.flock(self.arquivo, fcntl.LOCK_EX if self.exclusiva else fcntl.LOCK_SH)
+        return self.estado
+
+    def __exit__(self, *exc):
+        if self.arquivo is not None:
+            fcntl.flock(self.arquivo, fcntl.LOCK_UN)
+            self.arquivo.close()
+            self.arquivo = None
+        self.estado.lock.release()
+
+
+def _garantir_pasta():
+    """Cria a pasta do diario; na primeira vez importa o base_agendamentos_internos.json como snapshots."""
+    global _pasta_pronta
+    if _pasta_pronta:
+        return
+    with _lock_global:
+        if _pasta_pronta:
+            return
+        if not os.path.isdir(PASTA_AGENDAMENTOS):
+            _migrar_legado()
+        else:
+            _migrar_nomes_antigos()
+        _pasta_pronta = True
+
+
+def _migrar_nomes_antigos():
+    """
+    Renomeia os arquivos gravados com o nome antigo (email com caracteres trocados por "_",
+    que juntava emails diferentes) para nome_arquivo(email). O email vem do proprio conteudo:
+    o snapshot e o cabecalho do diario guardam email_dono.
+    """
+    nome_novo = re.compile(r"[0-9a-f]{64}")
+    antigos = {}
+    for arquivo in os.listdir(PASTA_AGENDAMENTOS):
+        for sufixo in (".snapshot.json", ".jsonl", ".lock"):
+            if arquivo.endswith(sufixo):
+                base = arquivo[:-len(sufixo)]
+                if not nome_novo.fullmatch(base):
+                    antigos.setdefault(base, set()).add(sufixo)
+                break
+    for base, sufixos in antigos.items():
+        caminho = os.path.join(PASTA_AGENDAMENTOS, base)
+        try:
+            email_dono = None
+            if ".snapshot.json" in sufixos:
+                email_dono = _email_do_arquivo(caminho + ".snapshot.json")
+            if not email_dono and ".jsonl" in sufixos:
+                email_dono = _email_do_arquivo(caminho + ".jsonl")
+            if not email_dono:
+                # Diario vazio sem snapshot: nao ha agendamento para levar
+                if ".jsonl" in sufixos and os.path.getsize(caminho + ".jsonl") == 0:
+                    os.remove(caminho + ".jsonl")
+                continue
+            destino = os.path.join(PASTA_AGENDAMENTOS, nome_arquivo(email_dono))
+            # Diario antes do snapshot: quem ler no meio ve o snapshot mudar e recarrega tudo
+            for sufixo in (".jsonl", ".snapshot.json"):
+                if sufixo in sufixos and not os.path.exists(destino + sufixo):
+                    os.replace(caminho + sufixo, destino + sufixo)
+            if ".lock" in sufixos:
+                os.remove(caminho + ".lock")
+            logger.info(f"Agenda de {email_dono} migrada para {os.path.basename(destino)}")
+        except FileNotFoundError:
+            # Outro worker migrou este ao mesmo tempo
+            continue
+
+
+def _migrar_legado():
+    legado = {}
+    if os.path.exists(ARQUIVO_LEGADO):
+        try:
+            with open(ARQUIVO_LEGADO, "r", encoding="utf-8") as f:
+                legado = json.load(f)
+        except Exception as e:
+            logger.error(f"Erro ao ler {ARQUIVO_LEGADO} para migracao: {e}")
+
+    # Monta numa pasta temporaria e renomeia: se dois processos migrarem juntos so um vence
+    temporaria = f"{PASTA_AGENDAMENTOS}.migrando.{os.getpid()}"
+    os.makedirs(temporaria, exist_ok=True)
+    for email_dono, eventos in legado.items():
+        with open(os.path.join(temporaria, f"{nome_arquivo(email_dono)}.snapshot.json"), "w", encoding="utf-8") as f:
+            json.dump({"email_dono": email_dono, "eventos": eventos}, f, ensure_ascii=False)
+    try:
+        os.rename(temporaria, PASTA_AGENDAMENTOS)
+        if legado:
+            logger.info(f"Agenda interna migrada para {PASTA_AGENDAMENTOS}/ ({len(legado)} barbearias)")
+    except OSError:
+        for arquivo in os.listdir(temporaria):
+            os.remove(os.path.join(temporaria, arquivo))
+        os.rmdir(temporaria)
+
+
+def _estado(email_dono):
+    _garantir_pasta()
+    estado = _estados.get(email_dono)
+    if estado is None:
+        with _lock_global:
+            estado = _estados.get(email_dono)
+            if estado is None:
+                estado = _EstadoBarbearia(email_dono)
+                with _Trava(estado, exclusiva=False):
+                    estado._recarregar()
+                    estado.sincronizar()
+                _estados[email_dono] = estado
+    return estado
+
+
+# --- API ---
+
+def registrar(email_dono, evento, verificar_conflito=True):
+    """
+    Anexa um agendamento ao diario da barbearia. Custo O(1) na escrita, independente do historico.
+    Com verificar_conflito, a checagem no indice e a gravacao acontecem sob a mesma trava exclusiva:
+    retorna (False, [eventos em conflito]) sem gravar nada, ou (True, evento).
+    """
+    estado = _estado(email_dono)
+    with _Trava(estado):
+        estado.sincronizar()
+        if verificar_conflito:
+            inicio, fim = intervalo_do_evento(evento)
+            ids = estado.indice.conflitos(evento.get("barbeiro"), inicio, fim)
+            if ids:
+                return False, [estado.eventos[i] for i in ids if i in estado.eventos]
+        estado.anexar({"op": "add", "evento": evento})
+    return True, evento
+
+
+def conflitos(email_dono, barbeiro, inicio, fim):
+    """Eventos do barbeiro que se sobrepoem a [inicio, fim) (minutos, ver indice_intervalos)."""
+    estado = _estado(email_dono)
+    with _Trava(estado, exclusiva=False):
+        estado.sincronizar()
+        return [estado.eventos[i] for i in estado.indice.conflitos(barbeiro, inicio, fim) if i in estado.eventos]
+
+
+def cancelar(email_dono, agendamento_id):
+    """Grava uma lapide (tombstone) para o agendamento. Retorna o evento removido ou None."""
+    estado = _estado(email_dono)
+    with _Trava(estado):
+        estado.sincronizar()
+        evento = estado.eventos.get(agendamento_id)
+        if evento is None:
+            return None
+        estado.anexar({"op": "del", "id": agendamento_id})
+    return evento
+
+
+def intervalos_ocupados(email_dono, barbeiros, inicio, fim):
+    """{barbeiro: [(inicio, fim), ...]} que encostam na janela [inicio, fim) (minutos), direto do indice."""
+    estado = _estado(email_dono)
+    with _Trava(estado, exclusiva=False):
+        estado.sincronizar()
+        return {
+            barbeiro: [(ini, fi) for ini, fi, _ in estado.indice.indice(barbeiro).entre(inicio, fim)]
+            for barbeiro in barbeiros
+        }
+
+
+def listar(email_dono):
+    estado = _estado(email_dono)
+    with _Trava(estado, exclusiva=False):
+        estado.sincronizar()
+        return list(estado.eventos.values())
+
+
+def listar_barbearias():
+    _garantir_pasta()
+    nomes = set()
+    for arquivo in os.listdir(PASTA_AGENDAMENTOS):
+        if arquivo.endswith(".snapshot.json") or arquivo.endswith(".jsonl"):
+            caminho = os.path.join(PASTA_AGENDAMENTOS, arquivo)
+            nomes.add(_email_do_arquivo(caminho))
+    return sorted(n for n in nomes if n)
+
+
+def _email_do_arquivo(caminho):
+    if caminho.endswith(".snapshot.json"):
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                return json.load(f).get("email_dono")
+        except Exception:
+            return None
+    # Diario: a primeira linha e o cabecalho {"op": "inicio", "email_dono": ...}
+    with open(caminho, "r", encoding="utf-8") as f:
+        primeira = f.readline()
+    try:
+        return json.loads(primeira).get("email_dono")
+    except json.JSONDecodeError:
+        return None
+
+
+def compactar(email_dono):
+    """Reescreve o snapshot com o estado atual e zera o diario."""
+    estado = _estado(email_dono)
+    with _Trava(estado):
+        estado.sincronizar()
+        temporario = estado.caminho_snapshot + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump({"email_dono": email_dono, "eventos": list(estado.eventos.values())}, f, ensure_ascii=False)
+        os.replace(temporario, estado.caminho_snapshot)
+        # Se cair entre o replace e o truncate, reaplicar o diario e idempotente (add/del por id)
+        with open(estado.caminho_diario, "wb"):
+            pass
+        estado.offset = 0
+        estado.id_snapshot = estado._identidade_snapshot()
+
+
+def compactar_pendentes():
+    """Compacta as barbearias cujo diario passou de LIMITE_COMPACTACAO_BYTES."""
+    _garantir_pasta()
+    compactadas = 0
+    for arquivo in os.listdir(PASTA_AGENDAMENTOS):
+        if not arquivo.endswith(".jsonl"):
+            continue
+        caminho = os.path.join(PASTA_AGENDAMENTOS, arquivo)
+        if os.path.getsize(caminho) < LIMITE_COMPACTACAO_BYTES:
+            continue
+        email_dono = _email_do_arquivo(caminho)
+        if email_dono:
+            compactar(email_dono)
+            compactadas += 1
+    return compactadas
+
+
+def iniciar_compactacao_periodica(intervalo=INTERVALO_COMPACTACAO):
+    """Sobe (uma vez) a thread de fundo que compacta os diarios grandes."""
+    global _thread_compactacao
+    if _thread_compactacao is not None:
+        return _thread_compactacao
+
+    def _loop():
+        while True:
+            time.sleep(intervalo)
+            try:
+                total = compactar_pendentes()
+                if total:
+                    logger.info(f"Compactacao da agenda: {total} diarios")
+            except Exception as e:
+                logger.error(f"Erro na compactacao da agenda: {e}")
+
+    _thread_compactacao = threading.Thread(target=_loop, name="compactacao-agenda", daemon=True)
+    _thread_compactacao.start()
+    return _thread_compactacao
@@ -0,0 +1,258 @@
+import datetime
+import os
+import threading
+import time
+import logging
+from concurrent.futures import wait
+
+from googleapiclient.errors import HttpError
+
+import executores
+from agenda_google import autenticar_google
+from indice_intervalos import IndiceIntervalos, para_minutos
+
+logger = logging.getLogger("EspelhoGoogle")
+
+# Idade máxima do espelho para responder uma consulta sem antes puxar as mudanças do Google
+ESPELHO_MAX_ATRASO_S = float(os.getenv("ESPELHO_MAX_ATRASO_S", "60"))
+# Intervalo da sincronização de fundo (0 desliga; aí só sincroniza sob demanda)
+ESPELHO_INTERVALO_S = float(os.getenv("ESPELHO_INTERVALO_S", "30"))
+# Agenda sem consulta há mais que isso sai do espelho (e da sincronização de fundo)
+ESPELHO_TTL_OCIOSO_S = float(os.getenv("ESPELHO_TTL_OCIOSO_S", "1800"))
+# Eventos que terminaram há mais que isso saem da memória (e a sincronização completa começa aí)
+ESPELHO_HISTORICO_S = 24 * 3600
+TAMANHO_PAGINA = 2500
+
+
+def _intervalo_google(evento):
+    """(inicio, fim) em minutos de um evento do Calendar, ou None se ele não ocupa horário."""
+    if evento.get("status") == "cancelled" or evento.get("transparency") == "transparent":
+        return None
+    inicio, fim = evento.get("start", {}), evento.get("end", {})
+    if "dateTime" in inicio:
+        return para_minutos(inicio["dateTime"]), para_minutos(fim.get("dateTime", inicio["dateTime"]))
+    if "date" in inicio:
+        # Evento de dia inteiro ocupado: do começo do dia inicial ao começo do dia final
+        return para_minutos(inicio["date"] + "T00:00"), para_minutos(fim.get("date", inicio["date"]) + "T00:00")
+    return None
+
+
+class EspelhoCalendario:
+    """Cópia local de UMA agenda do Google, mantida por sincronização incremental (syncToken)."""
+
+    def __init__(self, calendar_id):
+        self.calendar_id = calendar_id
+        self.indice = IndiceIntervalos()
+        self.eventos = {}
+        self.sync_token = None
+        self.ultima_sincronizacao = 0.0
+        self.ultima_consulta = time.monotonic()
+        self.sem_acesso = False
+        self.lock = threading.Lock()
+        self.sincronizacoes = 0
+        self.ressincronizacoes_completas = 0
+
+    def _aplicar(self, evento, corte):
+        ident = evento["id"]
+        if ident in self.eventos:
+            self.indice.remover(ident)
+            del self.eventos[ident]
+        try:
+            intervalo = _intervalo_google(evento)
+        except ValueError:
+            logger.warning(f"Evento com data inválida no Google ({self.calendar_id}): {ident}")
+            return
+        if intervalo and intervalo[1] > corte:
+            self.eventos[ident] = intervalo
+            self.indice.adicionar(intervalo[0], intervalo[1], ident)
+
+    def _podar(self, corte):
+        for ident in [i for i, (_, fim) in self.eventos.items() if fim <= corte]:
+            self.indice.remover(ident)
+            del self.eventos[ident]
+
+    def _limpar(self):
+        self.indice = IndiceIntervalos()
+        self.eventos = {}
+        self.sync_token = None
+
+    def sincronizar(self, service):
+        """Puxa as mudanças desde o último syncToken. Sem token (ou com 410 Gone) refaz tudo. Chamar com self.lock."""
+        desde = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=ESPELHO_HISTORICO_S)
+        corte = para_minutos(desde)
+        completa = self.sync_token is None
+        try:
+            self._paginar(service, corte, desde)
+        except HttpError as erro:
+            status = erro.resp.status
+            if status == 410:
+                # Token invalidado pelo Google: única situação que pede ressincronização completa
+                logger.info(f"syncToken expirado ({self.calendar_id}), refazendo espelho completo")
+                self._limpar()
+                completa = True
+                self._paginar(service, corte, desde)
+            elif status in (403, 404):
+                logger.error(f"Sem acesso à agenda {self.calendar_id} ({status})")
+                self.sem_acesso = True
+                self.ultima_sincronizacao = time.monotonic()
+                return
+            else:
+                raise
+
+        self.sem_acesso = False
+        if completa:
+            self.ressincronizacoes_completas += 1
+        self.sincronizacoes += 1
+        self._podar(corte)
+        self.ultima_sincronizacao = time.monotonic()
+
+    def _paginar(self, service, corte, desde):
+        pagina = None
+        novos = {}
+        if self.sync_token is None:
+            self._limpar()
+        while True:
+            parametros = {"calendarId": self.calendar_id, "singleEvents": True, "maxResults": TAMANHO_PAGINA}
+            if self.sync_token:
+                parametros["syncToken"] = self.sync_token
+            else:
+                # Completa só a partir de `desde`, não o histórico inteiro; o nextSyncToken
+                # devolvido vale para as incrementais (que não podem repetir o timeMin)
+                parametros["timeMin"] = desde.isoformat()
+            if pagina:
+                parametros["pageToken"] = pagina
+            resposta = service.events().list(**parametros).execute()
+            for evento in resposta.get("items", []):
+                novos[evento["id"]] = evento
+            pagina = resposta.get("nextPageToken")
+            if not pagina:
+                # Só troca o token depois de aplicar a última página
+                for evento in novos.values():
+                    self._aplicar(evento, corte)
+                self.sync_token = resposta.get("nextSyncToken", self.sync_token)
+                return
+
+
+class EspelhoGoogle:
+    """
+    Espelho em memória das agendas do Google usadas pelas barbearias.
+
+    As consultas de disponibilidade leem só a memória; o Google é consultado quando o espelho
+    da agenda passou de `max_atraso` segundos (ou pela thread de fundo). Se o Google estiver
+    fora do ar, responde com a última cópia boa.
+    Cada agenda é identificada por (conta, calendar_id): "primary" de contas diferentes são agendas
+    diferentes. conta é o email da barbearia (credenciais em agenda_google.CredenciaisGoogle).
+    """
+
+    def __init__(self, obter_service=None, max_atraso=ESPELHO_MAX_ATRASO_S):
+        self.obter_service = obter_service or autenticar_google
+        self.max_atraso = max_atraso
+        self._lock = threading.Lock()
+        self._calendarios = {}
+        self._thread = None
+        self.falhas_google = 0
+        self.respostas_desatualizadas = 0
+
+    def _calendario(self, conta, calendar_id):
+        with self._lock:
+            chave = (conta, calendar_id)
+            if chave not in self._calendarios:
+                self._calendarios[chave] = EspelhoCalendario(calendar_id)
+            espelho = self._calendarios[chave]
+            espelho.ultima_consulta = time.monotonic()
+            return espelho
+
+    def _atualizar(self, conta, espelho, forcar=False):
+        with espelho.lock:
+            atrasado = time.monotonic() - espelho.ultima_sincronizacao >= self.max_atraso
+            nunca_leu = espelho.sincronizacoes == 0 and not espelho.sem_acesso
+            if not (forcar or atrasado or nunca_leu):
+                return
+            try:
+                espelho.sincronizar(self.obter_service(conta))
+            except Exception as e:
+                self.falhas_google += 1
+                if nunca_leu:
+                    raise
+                self.respostas_desatualizadas += 1
+                logger.warning(f"Google indisponível, usando espelho antigo de {espelho.calendar_id}: {e}")
+
+    def invalidar(self, calendar_id, conta=None):
+        """Marca a agenda para sincronizar na próxima consulta (ex: logo depois de criar um evento)."""
+        self._calendario(conta, calendar_id).ultima_sincronizacao = 0.0
+
+    def intervalos_ocupados(self, calendarios, inicio, fim, conta=None):
+        """Mesmo contrato de agenda_google.intervalos_ocupados_google, servido da memória."""
+        resultado = {}
+        for barbeiro, calendar_id in calendarios.items():
+            espelho = self._calendario(conta, calendar_id)
+            self._atualizar(conta, espelho)
+            with espelho.lock:
+                if espelho.sem_acesso:
+                    resultado[barbeiro] = [(inicio, fim)]
+                else:
+                    resultado[barbeiro] = [(ini, fi) for ini, fi, _ in espelho.indice.entre(inicio, fim)]
+        return resultado
+
+    def conflitos(self, calendar_id, inicio, fim, conta=None):
+        espelho = self._calendario(conta, calendar_id)
+        self._atualizar(conta, espelho)
+        with espelho.lock:
+            return espelho.indice.conflitos(inicio, fim)
+
+    def sincronizar_todos(self, idade_minima=0.0, ttl_ocioso=ESPELHO_TTL_OCIOSO_S):
+        """
+        Uma passada da sincronização de fundo: esquece as agendas sem consulta há `ttl_ocioso` e
+        sincroniza, em paralelo no executores.google, as que têm mais de `idade_minima` segundos.
+        Espera a passada terminar (a próxima nunca se sobrepõe a esta). Retorna quantas sincronizou.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            for chave in [c for c, e in self._calendarios.items() if agora - e.ultima_consulta > ttl_ocioso]:
+                del self._calendarios[chave]
+            calendarios = [
+                (conta, espelho) for (conta, _), espelho in self._calendarios.items()
+                if agora - espelho.ultima_sincronizacao >= idade_minima
+            ]
+        futuros = {executores.google.submeter(self._atualizar, conta, espelho, forcar=True): espelho for conta, espelho in calendarios}
+        wait(futuros)
+        for futuro, espelho in futuros.items():
+            if futuro.exception() is not None:
+                logger.error(f"Erro sincronizando {espelho.calendar_id}: {futuro.exception()}")
+        return len(futuros)
+
+    def iniciar_sincronizacao_periodica(self, intervalo=ESPELHO_INTERVALO_S):
+        """Sobe (uma vez) a thread que mantém em dia as agendas consultadas recentemente."""
+        if self._thread is not None or intervalo <= 0:
+            return self._thread
+
+        def _loop():
+            while True:
+                time.sleep(intervalo)
+                try:
+                    # Só as agendas que envelheceram desde a última passada (as consultas também
+                    # sincronizam); metade do intervalo de folga para o relógio da passada anterior
+                    self.sincronizar_todos(idade_minima=intervalo / 2)
+                except Exception as e:
+                    logger.error(f"Erro na sincronização do espelho Google: {e}")
+
+        self._thread = threading.Thread(target=_loop, name="espelho-google", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def estatisticas(self):
+        with self._lock:
+            calendarios = list(self._calendarios.values())
+        agora = time.monotonic()
+        return {
+            "agendas": len(calendarios),
+            "eventos": sum(len(c.eventos) for c in calendarios),
+            "sincronizacoes": sum(c.sincronizacoes for c in calendarios),
+            "ressincronizacoes_completas": sum(c.ressincronizacoes_completas for c in calendarios),
+            "maior_atraso_s": round(max((agora - c.ultima_sincronizacao for c in calendarios if c.ultima_sincronizacao), default=0), 1),
+            "falhas_google": self.falhas_google,
+            "respostas_desatualizadas": self.respostas_desatualizadas,
+        }
+
+
+espelho_google = EspelhoGoogle()
@@ -0,0 +1,153 @@
+import datetime
+import os
+import sqlite3
+import threading
+import logging
+from collections import Counter
+
+import diario_agendamentos
+from indice_intervalos import SAO_PAULO_TZ
+
+logger = logging.getLogger("EstatisticasDashboard")
+
+ARQUIVO_ESTATISTICAS = os.getenv("ESTATISTICAS_ARQUIVO", "estatisticas_dashboard.db")
+
+
+def _servico(servico):
+    return str(servico or "").strip().lower()
+
+
+def _dia(data_hora):
+    return str(data_hora)[:10]
+
+
+def hoje_sao_paulo():
+    return datetime.datetime.now(SAO_PAULO_TZ).date().isoformat()
+
+
+class EstatisticasDashboard:
+    """
+    Agregados por barbearia mantidos a cada evento, para o /api/dashboard/stats não varrer nada:
+    - agendamentos por (dia, serviço): +1 ao agendar, -1 ao cancelar
+    - vídeos gerados e créditos consumidos: +1 quando um vídeo fica pronto
+
+    A receita estimada é quantidade × preço atual de cada serviço do dia (poucos serviços), então
+    uma mudança de preço já vale na próxima leitura sem reprocessar agendamentos.
+    Fica em SQLite (WAL) para valer entre workers e sobreviver a reinícios; na primeira vez é
+    preenchido a partir do diário de agendamentos. O preenchimento grava a marca "preenchido" na
+    mesma transação: se o processo cair no meio, o próximo refaz; e até a marca existir os +1/-1
+    de agendamento não são somados (o diário, que o preenchimento lê, já tem esses eventos).
+    """
+
+    def __init__(self, caminho=ARQUIVO_ESTATISTICAS):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS agendamentos_dia ("
+            "email TEXT NOT NULL, dia TEXT NOT NULL, servico TEXT NOT NULL, quantidade INTEGER NOT NULL, "
+            "PRIMARY KEY (email, dia, servico))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS contadores ("
+            "email TEXT PRIMARY KEY, videos_gerados INTEGER NOT NULL DEFAULT 0, creditos_usados INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT)")
+        self._preencher_do_diario()
+
+    def _preencher_do_diario(self):
+        """
+        Uma vez por banco (marca "preenchido" em meta). A leitura do diário acontece dentro da
+        transação de escrita: um agendamento que outro worker gravar durante o preenchimento
+        ou entrou na contagem, ou tem o +1 aplicado depois do COMMIT, já com a marca.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM meta WHERE chave = 'preenchido'").fetchone():
+                    self._conn.execute("COMMIT")
+                    return
+                contagem = Counter()
+                # Banco de antes da marca já com números: foi preenchido por uma versão anterior
+                if not self._conn.execute("SELECT 1 FROM agendamentos_dia LIMIT 1").fetchone():
+                    for email in diario_agendamentos.listar_barbearias():
+                        for evento in diario_agendamentos.listar(email):
+                            contagem[(email, _dia(evento.get("start")), _servico(evento.get("servico")))] += 1
+                    self._conn.executemany(
+                        "INSERT INTO agendamentos_dia (email, dia, servico, quantidade) VALUES (?, ?, ?, ?)",
+                        [(*chave, quantidade) for chave, quantidade in contagem.items()],
+                    )
+                self._conn.execute(
+                    "INSERT INTO meta (chave, valor) VALUES ('preenchido', ?)",
+                    (datetime.datetime.now().isoformat(timespec="seconds"),),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        total = sum(contagem.values())
+        if total:
+            logger.info(f"Estatísticas do dashboard preenchidas com {total} agendamentos do diário")
+
+    def _somar_agendamento(self, email, data_hora, servico, delta):
+        with self._lock:
+            # Sem a marca o preenchimento ainda vai contar este evento pelo diário
+            self._conn.execute(
+                "INSERT INTO agendamentos_dia (email, dia, servico, quantidade) "
+                "SELECT ?, ?, ?, MAX(0, ?) WHERE EXISTS (SELECT 1 FROM meta WHERE chave = 'preenchido') "
+                "ON CONFLICT(email, dia, servico) DO UPDATE SET quantidade = MAX(0, quantidade + ?)",
+                (email, _dia(data_hora), _servico(servico), delta, delta),
+            )
+
+    def registrar_agendamento(self, email, data_hora, servico):
+        self._somar_agendamento(email, data_hora, servico, 1)
+
+    def registrar_cancelamento(self, email, data_hora, servico):
+        self._somar_agendamento(email, data_hora, servico, -1)
+
+    def registrar_video(self, email, credito_usado):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO contadores (email, videos_gerados, creditos_usados) VALUES (?, 1, ?) "
+                "ON CONFLICT(email) DO UPDATE SET videos_gerados = videos_gerados + 1, "
+                "creditos_usados = creditos_usados + excluded.creditos_usados",
+                (email, int(bool(credito_usado))),
+            )
+
+    def resumo(self, email, precos, dia=None):
+        """Números do dashboard. precos: tabela atual da barbearia ({servico: {"preco", ...}})."""
+        dia = dia or hoje_sao_paulo()
+        with self._lock:
+            por_servico = self._conn.execute(
+                "SELECT servico, quantidade FROM agendamentos_dia WHERE email = ? AND dia = ?", (email, dia)
+            ).fetchall()
+            contadores = self._conn.execute(
+                "SELECT videos_gerados, creditos_usados FROM contadores WHERE email = ?", (email,)
+            ).fetchone() or (0, 0)
+
+        tabela = {_servico(nome): valor for nome, valor in (precos or {}).items()}
+        receita = 0.0
+        for servico, quantidade in por_servico:
+            valor = tabela.get(servico, 0)
+            preco = valor.get("preco", 0) if isinstance(valor, dict) else valor
+            receita += float(preco) * quantidade
+
+        return {
+            "agendamentos_hoje": sum(q for _, q in por_servico),
+            "receita_estimada": round(receita, 2),
+            "videos_gerados": contadores[0],
+            "creditos_usados": contadores[1],
+        }
+
+
+_estatisticas = None
+_lock_instancia = threading.Lock()
+
+
+def estatisticas():
+    """Instância única, criada no primeiro uso (o preenchimento inicial lê o diário)."""
+    global _estatisticas
+    with _lock_instancia:
+        if _estatisticas is None:
+            _estatisticas = EstatisticasDashboard()
+        return _estatisticas
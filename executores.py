@@ -0,0 +1,123 @@
+import asyncio
+import os
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import metricas
+
+logger = logging.getLogger("Executores")
+
+# Amostras recentes usadas nos percentis de latência
+AMOSTRAS_LATENCIA = 1000
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+class ExecutorDependencia:
+    """
+    Pool de threads limitado para o código bloqueante de UMA dependência externa (google, fal,
+    storage). Um Google lento enche só a fila dele; as outras dependências seguem atendendo.
+    Mede fila, tarefas ativas, espera na fila e tempo de execução (também nos histogramas de /metrics).
+    """
+
+    def __init__(self, nome, max_workers):
+        self.nome = nome
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"exec-{nome}")
+        self._lock = threading.Lock()
+        self.na_fila = 0
+        self.ativas = 0
+        self.concluidas = 0
+        self.erros = 0
+        self.canceladas = 0
+        self.maior_fila = 0
+        self._esperas = deque(maxlen=AMOSTRAS_LATENCIA)
+        self._duracoes = deque(maxlen=AMOSTRAS_LATENCIA)
+
+    def _medido(self, funcao, args, kwargs, enfileirado):
+        inicio = time.perf_counter()
+        with self._lock:
+            self.na_fila -= 1
+            self.ativas += 1
+            self._esperas.append(inicio - enfileirado)
+        metricas.observar("executor_espera_segundos", inicio - enfileirado, executor=self.nome)
+        falhou = False
+        try:
+            return funcao(*args, **kwargs)
+        except Exception:
+            falhou = True
+            raise
+        finally:
+            duracao = time.perf_counter() - inicio
+            with self._lock:
+                self.ativas -= 1
+                self.concluidas += 1
+                self.erros += falhou
+                self._duracoes.append(duracao)
+            metricas.observar(
+                "executor_execucao_segundos", duracao, executor=self.nome, funcao=getattr(funcao, "__name__", "?")
+            )
+
+    def submeter(self, funcao, *args, **kwargs):
+        """Agenda funcao(*args, **kwargs) no pool e devolve o concurrent.futures.Future."""
+        with self._lock:
+            self.na_fila += 1
+            self.maior_fila = max(self.maior_fila, self.na_fila)
+        futuro = self._pool.submit(self._medido, funcao, args, kwargs, time.perf_counter())
+        futuro.add_done_callback(self._ao_terminar)
+        return futuro
+
+    def _ao_terminar(self, futuro):
+        # Cancelada ainda na fila (timeout de quem esperava, encerrar()): _medido nunca rodou
+        if futuro.cancelled():
+            with self._lock:
+                self.na_fila -= 1
+                self.canceladas += 1
+
+    async def executar(self, funcao, *args, **kwargs):
+        """Versão para o event loop: await executor.executar(funcao, ...)."""
+        return await asyncio.wrap_future(self.submeter(funcao, *args, **kwargs))
+
+    def encerrar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def estatisticas(self):
+        with self._lock:
+            esperas, duracoes = list(self._esperas), list(self._duracoes)
+            return {
+                "max_workers": self.max_workers,
+                "na_fila": self.na_fila,
+                "ativas": self.ativas,
+                "maior_fila": self.maior_fila,
+                "concluidas": self.concluidas,
+                "erros": self.erros,
+                "canceladas": self.canceladas,
+                "espera_p50_ms": round(_percentil(esperas, 0.5) * 1000, 2),
+                "espera_p95_ms": round(_percentil(esperas, 0.95) * 1000, 2),
+                "duracao_p50_ms": round(_percentil(duracoes, 0.5) * 1000, 2),
+                "duracao_p95_ms": round(_percentil(duracoes, 0.95) * 1000, 2),
+            }
+
+
+google = ExecutorDependencia("google", int(os.getenv("EXECUTOR_GOOGLE_WORKERS", "16")))
+fal = ExecutorDependencia("fal", int(os.getenv("VIDEO_WORKERS", "4")))
+storage = ExecutorDependencia("storage", int(os.getenv("EXECUTOR_STORAGE_WORKERS", "8")))
+
+executores = {"google": google, "fal": fal, "storage": storage}
+
+
+def estatisticas_executores():
+    return {nome: executor.estatisticas() for nome, executor in executores.items()}
+
+
+def encerrar_executores():
+    for executor in executores.values():
+        executor.encerrar()
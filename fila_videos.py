@@ -0,0 +1,302 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+
+from GeradorDeVideo import criar_video_wan, animar_foto_wan
+from gerenciador_clientes import descontar_credito_video, adicionar_creditos_video
+from cache_renders import COBRAR_ACERTO
+import executores
+from estatisticas_dashboard import estatisticas as estatisticas_dashboard
+
+logger = logging.getLogger("FilaVideos")
+
+# Jobs ficam num SQLite compartilhado: com UVICORN_WORKERS > 1 qualquer worker consulta
+# qualquer job e os limites por cliente valem para o servidor inteiro
+ARQUIVO_JOBS = os.getenv("VIDEO_JOBS_ARQUIVO", "fila_videos.db")
+# Renders simultâneos: o tamanho do executor "fal" (VIDEO_WORKERS) em cada worker; e por
+# barbearia, somando todos os workers, para um cliente não ocupar todos os renders
+VIDEO_MAX_POR_CLIENTE = int(os.getenv("VIDEO_MAX_POR_CLIENTE", "1"))
+# Pedidos aguardando na fila, somando todos os clientes
+VIDEO_MAX_PENDENTES = int(os.getenv("VIDEO_MAX_PENDENTES", "200"))
+# Jobs terminados que continuam consultáveis
+VIDEO_JOBS_GUARDADOS = int(os.getenv("VIDEO_JOBS_GUARDADOS", "2000"))
+
+NA_FILA = "na_fila"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+CAMPOS = ("id", "dono", "tipo", "prompt", "image_url", "email_cobranca", "avisar", "status", "video_url",
+          "erro", "do_cache", "criado_em", "iniciado_em", "concluido_em", "pid")
+
+
+def _eh_url_video(resultado):
+    # criar_video_wan/animar_foto_wan devolvem a URL ou um texto "Erro ..."
+    return isinstance(resultado, str) and resultado.startswith("http")
+
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class FilaVideos:
+    """
+    Fila de geração de vídeo: submeter() devolve o job na hora e o render roda num pool limitado.
+
+    - Os jobs ficam em SQLite (WAL), compartilhados entre os workers do uvicorn. Cada worker
+      pega da fila, numa transação, os jobs que cabem no seu executor.
+    - Até `max_workers` renders ao mesmo tempo por worker, no máximo `max_por_cliente` por dono
+      (email da barbearia ou número do admin) no total; o resto espera na ordem de chegada.
+    - O crédito é descontado na entrada e devolvido se o render falhar, ou se o vídeo saiu do
+      cache de renders e a política (RENDER_CACHE_COBRAR_ACERTO) não cobra acertos.
+    - Quando o job termina, o aviso configurado (configurar_aviso) é chamado com o número
+      gravado em `avisar`, na thread do worker que renderizou.
+    """
+
+    def __init__(self, caminho=ARQUIVO_JOBS, executor=None, max_por_cliente=VIDEO_MAX_POR_CLIENTE,
+                 max_pendentes=VIDEO_MAX_PENDENTES, jobs_guardados=VIDEO_JOBS_GUARDADOS):
+        self._executor = executor or executores.fal
+        self.max_workers = self._executor.max_workers
+        self.max_por_cliente = max_por_cliente
+        self.max_pendentes = max_pendentes
+        self.jobs_guardados = jobs_guardados
+        self._lock = threading.Lock()
+        self._rodando = 0
+        self._aviso = None
+        self.concluidos = 0
+        self.falhas = 0
+        self.reembolsos = 0
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL, dono TEXT NOT NULL, "
+            "tipo TEXT NOT NULL, prompt TEXT, image_url TEXT, email_cobranca TEXT, avisar TEXT, "
+            "status TEXT NOT NULL, video_url TEXT, erro TEXT, do_cache INTEGER NOT NULL DEFAULT 0, "
+            "criado_em REAL NOT NULL, iniciado_em REAL, concluido_em REAL, pid INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_dono ON jobs (dono, seq)")
+
+    # --- API ---
+
+    def configurar_aviso(self, funcao):
+        """funcao(avisar, job): chamada quando um job com `avisar` termina, com sucesso ou erro."""
+        self._aviso = funcao
+
+    def submeter(self, dono, prompt, tipo="texto", image_url=None, email_cobranca=None, avisar=None):
+        """
+        Enfileira um vídeo. Retorna (True, job) ou (False, motivo).
+        email_cobranca: se informado, desconta 1 crédito agora (devolvido em caso de falha).
+        avisar: número do WhatsApp que recebe o vídeo quando ficar pronto.
+        """
+        with self._lock:
+            pendentes = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (NA_FILA,)).fetchone()[0]
+        if pendentes >= self.max_pendentes:
+            return False, "Fila de vídeos cheia. Tente novamente em alguns minutos."
+
+        if email_cobranca and not descontar_credito_video(email_cobranca):
+            return False, "Sem créditos. Recarregue no Studio."
+
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "dono": dono,
+            "tipo": "imagem" if tipo == "imagem" and image_url else "texto",
+            "prompt": prompt,
+            "image_url": image_url,
+            "email_cobranca": email_cobranca,
+            "avisar": avisar,
+            "status": NA_FILA,
+            "video_url": None,
+            "erro": None,
+            "do_cache": False,
+            "criado_em": time.time(),
+            "iniciado_em": None,
+            "concluido_em": None,
+            "pid": None,
+        }
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(CAMPOS)}) VALUES ({', '.join('?' * len(CAMPOS))})",
+                tuple(job[c] for c in CAMPOS),
+            )
+            self._podar()
+        self._despachar()
+        logger.info(f"Vídeo {job['id']} na fila ({dono}, {job['tipo']})")
+        return True, job
+
+    def obter(self, job_id):
+        with self._lock:
+            linha = self._conn.execute(f"SELECT seq, {', '.join(CAMPOS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if linha is None:
+                return None
+            resposta = self._job(linha[1:])
+            if resposta["status"] == NA_FILA:
+                resposta["posicao_fila"] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND seq <= ?", (NA_FILA, linha[0])
+                ).fetchone()[0]
+            return resposta
+
+    def listar(self, dono, limite=20):
+        with self._lock:
+            linhas = self._conn.execute(
+                f"SELECT {', '.join(CAMPOS)} FROM jobs WHERE dono = ? ORDER BY seq DESC LIMIT ?", (dono, limite)
+            ).fetchall()
+        return [self._job(linha) for linha in linhas]
+
+    def retomar(self):
+        """
+        Devolve à fila os jobs que estavam processando num worker que morreu e despacha os
+        pendentes. Chamar na subida de cada worker. O pid só identifica processos da mesma máquina.
+        """
+        with self._lock:
+            orfaos = [
+                job_id for job_id, pid in self._conn.execute(
+                    "SELECT id, pid FROM jobs WHERE status = ?", (PROCESSANDO,)
+                ).fetchall()
+                if not pid or not _processo_vivo(pid)
+            ]
+            for job_id in orfaos:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, iniciado_em = NULL, pid = NULL WHERE id = ? AND status = ?",
+                    (NA_FILA, job_id, PROCESSANDO),
+                )
+        if orfaos:
+            logger.warning(f"{len(orfaos)} vídeo(s) de um worker encerrado voltaram para a fila")
+        self._despachar()
+        return len(orfaos)
+
+    def estatisticas(self):
+        with self._lock:
+            contagem = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status", (NA_FILA, PROCESSANDO)
+            ).fetchall())
+            return {
+                "pendentes": contagem.get(NA_FILA, 0),
+                "processando": contagem.get(PROCESSANDO, 0),
+                "processando_neste_worker": self._rodando,
+                "concluidos": self.concluidos,
+                "falhas": self.falhas,
+                "reembolsos": self.reembolsos,
+                "max_workers": self.max_workers,
+                "max_por_cliente": self.max_por_cliente,
+            }
+
+    # --- interno ---
+
+    @staticmethod
+    def _job(linha):
+        job = dict(zip(CAMPOS, linha))
+        job["do_cache"] = bool(job["do_cache"])
+        return job
+
+    def _despachar(self):
+        """Pega da fila, na ordem, os jobs que cabem neste worker e no limite de cada dono."""
+        iniciados = []
+        with self._lock:
+            livres = self.max_workers - self._rodando
+            if livres <= 0:
+                return
+            # IMMEDIATE: dois workers nunca pegam o mesmo job nem estouram o limite de um dono
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ativos = dict(self._conn.execute(
+                    "SELECT dono, COUNT(*) FROM jobs WHERE status = ? GROUP BY dono", (PROCESSANDO,)
+                ).fetchall())
+                pendentes = self._conn.execute(
+                    "SELECT id, dono FROM jobs WHERE status = ? ORDER BY seq", (NA_FILA,)
+                ).fetchall()
+                agora = time.time()
+                for job_id, dono in pendentes:
+                    if livres <= 0:
+                        break
+                    if ativos.get(dono, 0) >= self.max_por_cliente:
+                        continue
+                    ativos[dono] = ativos.get(dono, 0) + 1
+                    livres -= 1
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, iniciado_em = ?, pid = ? WHERE id = ?",
+                        (PROCESSANDO, agora, os.getpid(), job_id),
+                    )
+                    iniciados.append(job_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._rodando += len(iniciados)
+        for job_id in iniciados:
+            self._executor.submeter(self._rodar, job_id)
+
+    def _podar(self):
+        """Apaga os jobs terminados mais antigos acima do limite guardado. Chamar com o lock."""
+        self._conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND seq NOT IN "
+            "(SELECT seq FROM jobs ORDER BY seq DESC LIMIT ?)",
+            (CONCLUIDO, ERRO, self.jobs_guardados),
+        )
+
+    def _rodar(self, job_id):
+        with self._lock:
+            job = self._job(self._conn.execute(f"SELECT {', '.join(CAMPOS)} FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        try:
+            if job["tipo"] == "imagem":
+                resultado, do_cache = animar_foto_wan(job["image_url"], job["prompt"], com_origem=True)
+            else:
+                resultado, do_cache = criar_video_wan(job["prompt"], com_origem=True)
+            erro = None if _eh_url_video(resultado) else str(resultado)
+        except Exception as e:
+            resultado, do_cache, erro = None, False, f"Erro no vídeo: {e}"
+
+        job["concluido_em"] = time.time()
+        if erro:
+            job["status"], job["erro"] = ERRO, erro
+            reembolsar = bool(job["email_cobranca"])
+        else:
+            job["status"], job["video_url"], job["do_cache"] = CONCLUIDO, resultado, do_cache
+            reembolsar = bool(job["email_cobranca"]) and do_cache and not COBRAR_ACERTO
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, video_url = ?, erro = ?, do_cache = ?, concluido_em = ? WHERE id = ?",
+                (job["status"], job["video_url"], job["erro"], int(job["do_cache"]), job["concluido_em"], job_id),
+            )
+            self._rodando -= 1
+            if erro:
+                self.falhas += 1
+            else:
+                self.concluidos += 1
+        self._despachar()
+
+        if not erro:
+            try:
+                estatisticas_dashboard().registrar_video(
+                    job["email_cobranca"] or job["dono"], credito_usado=bool(job["email_cobranca"]) and not reembolsar
+                )
+            except Exception as e:
+                logger.error(f"Erro ao atualizar estatisticas do dashboard: {e}")
+
+        if reembolsar:
+            adicionar_creditos_video(job["email_cobranca"], 1)
+            with self._lock:
+                self.reembolsos += 1
+            if erro:
+                logger.warning(f"Vídeo {job_id} falhou, crédito devolvido a {job['email_cobranca']}: {erro}")
+            else:
+                logger.info(f"Vídeo {job_id} veio do cache de renders, crédito devolvido a {job['email_cobranca']}")
+
+        if job["avisar"] and self._aviso:
+            try:
+                self._aviso(job["avisar"], job)
+            except Exception as e:
+                logger.error(f"Erro ao avisar conclusão do vídeo {job_id}: {e}")
+
+fila_videos = FilaVideos()
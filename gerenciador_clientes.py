@@ -1,10 +1,10 @@
-﻿import json
-import os
-import logging
+﻿import logging
 import uuid
 
-ARQUIVO_CLIENTES = "base_clientes.json"
-ARQUIVO_AGENDAMENTOS = "base_agendamentos_internos.json"
+import banco_clientes
+import diario_agendamentos
+from cache_clientes import cache as cache_clientes
+from estatisticas_dashboard import estatisticas as estatisticas_dashboard
 
 logger = logging.getLogger("GerenciadorClientes")
 
@@ -52,98 +52,91 @@ def get_cliente_padrao(email, senha, telefone, nome_barbearia, nome_bot, tipo_ag
     }
 
 def carregar_base():
-    if not os.path.exists(ARQUIVO_CLIENTES):
-        with open(ARQUIVO_CLIENTES, "w", encoding="utf-8") as f:
-            json.dump({}, f)
-        return {}
-    try:
-        with open(ARQUIVO_CLIENTES, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    """Retorna {email: dados} de todos os clientes. O(N): use as buscas indexadas no dia a dia."""
+    return banco_clientes.listar_clientes()
 
 def salvar_base(dados):
-    with open(ARQUIVO_CLIENTES, "w", encoding="utf-8") as f:
-        json.dump(dados, f, indent=4)
+    banco_clientes.substituir_base(dados)
+    cache_clientes.invalidar()
+
+def _atualizar_cliente(email, alteracao):
+    try:
+        encontrado, resultado, alterado = banco_clientes.atualizar_cliente(email, alteracao)
+    except banco_clientes.TelefoneDuplicado as e:
+        # Nada foi gravado: os chamadores tratam como falha na atualizacao
+        logger.warning(f"Telefone {e} ja pertence a outro cliente; {email} nao foi alterado")
+        return False, None
+    # Sem alteracao (ex: desconto sem saldo) a versao nao sobe e os caches continuam valendo
+    if alterado:
+        cache_clientes.registrar_escrita(email)
+    return encontrado, resultado
+
+def versao_cliente(email):
+    """Versao do cadastro (sobe a cada alteracao de precos, equipe, config...)."""
+    return cache_clientes.versao(email)
+
+def estatisticas_cache_clientes():
+    return cache_clientes.estatisticas()
 
 # --- FUNCOES PUBLICAS DE CLIENTE ---
 
 def registrar_cliente(email, senha, telefone, nome_barbearia, nome_bot, tipo_agenda="interna"):
-    base = carregar_base()
-    if email in base:
+    if cache_clientes.por_email(email):
         return False, "E-mail já cadastrado."
 
-    base[email] = get_cliente_padrao(email, senha, telefone, nome_barbearia, nome_bot, tipo_agenda)
-    salvar_base(base)
-    return True, base[email]
+    novo = get_cliente_padrao(email, senha, telefone, nome_barbearia, nome_bot, tipo_agenda)
+    try:
+        if not banco_clientes.inserir_cliente(novo):
+            return False, "E-mail já cadastrado."
+    except banco_clientes.TelefoneDuplicado:
+        return False, "Telefone já cadastrado."
+    cache_clientes.registrar_escrita(email)
+    return True, novo
 
 def autenticar_cliente(email, senha):
-    base = carregar_base()
-    cliente = base.get(email)
+    cliente = cache_clientes.por_email(email)
     if cliente and cliente["senha"] == senha:
         return cliente
     return None
 
 def buscar_cliente_por_telefone(telefone_wpp):
-    base = carregar_base()
-    for email, dados in base.items():
-        if dados.get("telefone_whatsapp") == telefone_wpp:
-            return dados
-    return None
+    return cache_clientes.por_telefone(telefone_wpp)
 
 def buscar_cliente_por_email(email):
-    base = carregar_base()
-    return base.get(email)
+    return cache_clientes.por_email(email)
 
 def atualizar_dados_cliente(email, novos_dados):
-    base = carregar_base()
-    if email in base:
-        base[email].update(novos_dados)
-        salvar_base(base)
-        return True
-    return False
+    encontrado, _ = _atualizar_cliente(email, lambda c: c.update(novos_dados))
+    return encontrado
 
 def atualizar_horarios_atendimento(email_dono, horarios):
-    base = carregar_base()
-    if email_dono in base:
-        cfg = base[email_dono].get("config", {})
+    def _alterar(cliente):
+        cfg = cliente.get("config", {})
         cfg["horarios_atendimento"] = horarios
-        base[email_dono]["config"] = cfg
-        salvar_base(base)
-        return True
-    return False
+        cliente["config"] = cfg
+
+    encontrado, _ = _atualizar_cliente(email_dono, _alterar)
+    return encontrado
 
 # --- FUNCOES DE EQUIPE E AGENDA ---
 
 def adicionar_barbeiro(email_dono, nome_barbeiro, id_calendario_google="primary"):
-    base = carregar_base()
-    if email_dono in base:
-        base[email_dono]["equipe"].append({
+    def _alterar(cliente):
+        cliente["equipe"].append({
             "nome": nome_barbeiro,
             "id_google_calendar": id_calendario_google
         })
-        salvar_base(base)
-        return True
-    return False
 
-# --- AGENDA INTERNA (JSON) ---
+    encontrado, _ = _atualizar_cliente(email_dono, _alterar)
+    return encontrado
+
+# --- AGENDA INTERNA (diario append-only, ver diario_agendamentos.py) ---
 
 def carregar_agendamentos_internos():
-    if not os.path.exists(ARQUIVO_AGENDAMENTOS):
-        with open(ARQUIVO_AGENDAMENTOS, "w", encoding="utf-8") as f:
-            json.dump({}, f)
-    try:
-        with open(ARQUIVO_AGENDAMENTOS, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+    """Retorna {email_dono: [eventos]} de todas as barbearias. O(total), so para relatorios/migracao."""
+    return {email: diario_agendamentos.listar(email) for email in diario_agendamentos.listar_barbearias()}
 
 def salvar_agendamento_interno(email_dono, barbeiro_nome, data_hora, cliente_nome, servico=None, duracao=30, google_event_id=None, calendar_id=None):
-    agendamentos = carregar_agendamentos_internos()
-
-    if email_dono not in agendamentos:
-        agendamentos[email_dono] = []
-
     novo_evento = {
         "id": str(uuid.uuid4()),
         "barbeiro": barbeiro_nome,
@@ -156,65 +149,62 @@ def salvar_agendamento_interno(email_dono, barbeiro_nome, data_hora, cliente_nom
         "calendar_id": calendar_id
     }
 
-    agendamentos[email_dono].append(novo_evento)
+    # Antes de gravar: na primeira vez as estatisticas se preenchem do diario e nao podem contar este evento
+    painel = estatisticas_dashboard()
+    try:
+        salvo, conflitos = diario_agendamentos.registrar(email_dono, novo_evento)
+    except ValueError:
+        return False, f"Data/hora inválida: {data_hora}. Use AAAA-MM-DDTHH:MM:SS."
 
-    with open(ARQUIVO_AGENDAMENTOS, "w", encoding="utf-8") as f:
-        json.dump(agendamentos, f, indent=4)
+    if not salvo:
+        ocupado = ", ".join(f"{c['start']} ({c.get('duracao', 30)} min)" for c in conflitos)
+        return False, f"Horário indisponível: {barbeiro_nome} já tem agendamento em {ocupado}."
 
+    try:
+        painel.registrar_agendamento(email_dono, data_hora, novo_evento["servico"])
+    except Exception as e:
+        logger.error(f"Erro ao atualizar estatisticas do dashboard: {e}")
     return True, f"Agendado com sucesso para {cliente_nome} com {barbeiro_nome}!"
 
 def cancelar_agendamento_interno(email_dono, agendamento_id):
-    agendamentos = carregar_agendamentos_internos()
-    if email_dono not in agendamentos:
-        return False, None
-
-    removido = None
-    novos = []
-    for a in agendamentos[email_dono]:
-        if a.get("id") == agendamento_id and removido is None:
-            removido = a
-            continue
-        novos.append(a)
-
+    painel = estatisticas_dashboard()
+    removido = diario_agendamentos.cancelar(email_dono, agendamento_id)
     if removido is None:
         return False, None
-
-    agendamentos[email_dono] = novos
-    with open(ARQUIVO_AGENDAMENTOS, "w", encoding="utf-8") as f:
-        json.dump(agendamentos, f, indent=4)
-
+    try:
+        painel.registrar_cancelamento(email_dono, removido.get("start"), removido.get("servico"))
+    except Exception as e:
+        logger.error(f"Erro ao atualizar estatisticas do dashboard: {e}")
     return True, removido
 
 def listar_agenda_interna(email_dono):
-    agendamentos = carregar_agendamentos_internos()
-    return agendamentos.get(email_dono, [])
+    return diario_agendamentos.listar(email_dono)
 
 # --- FUNCOES FINANCEIRAS ---
 
 def ativar_pagamento_cliente(email):
-    base = carregar_base()
-    if email in base:
-        base[email]["pagamento"]["ativo"] = True
-        base[email]["pagamento"]["plano"] = "pro"
-        salvar_base(base)
-        return True, base[email]
-    return False, None
+    def _alterar(cliente):
+        cliente["pagamento"]["ativo"] = True
+        cliente["pagamento"]["plano"] = "pro"
+        return cliente
+
+    return _atualizar_cliente(email, _alterar)
 
 def adicionar_creditos_video(email, quantidade):
-    base = carregar_base()
-    if email in base:
-        saldo_atual = base[email].get("creditos_video", 0)
-        base[email]["creditos_video"] = saldo_atual + int(quantidade)
-        salvar_base(base)
-        return True, base[email]
-    return False, None
+    def _alterar(cliente):
+        saldo_atual = cliente.get("creditos_video", 0)
+        cliente["creditos_video"] = saldo_atual + int(quantidade)
+        return cliente
+
+    return _atualizar_cliente(email, _alterar)
 
 def descontar_credito_video(email):
-    base = carregar_base()
-    if email in base:
-        saldo_atual = base[email].get("creditos_video", 0)
+    def _alterar(cliente):
+        saldo_atual = cliente.get("creditos_video", 0)
         if saldo_atual > 0:
-            base[email]["creditos_video"] = saldo_atual - 1
-            salvar_base(base)
+            cliente["creditos_video"] = saldo_atual - 1
             return True
-    return False
+        return False
+
+    _, descontou = _atualizar_cliente(email, _alterar)
+    return bool(descontou)
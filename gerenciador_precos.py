@@ -27,6 +27,16 @@ def _normalizar_precos(dados: dict) -> dict:
         normalizado[nome] = {"preco": preco, "duracao": duracao}
     return normalizado
 
+def obter_duracao(precos: dict, servico, padrao: int = 30) -> int:
+    """Duração (min) de um serviço na tabela, ignorando maiúsculas. Aceita o formato antigo (só preço)."""
+    if not servico:
+        return padrao
+    chave = str(servico).lower().strip()
+    for nome, valor in precos.items():
+        if nome.lower().strip() == chave:
+            return int(valor.get("duracao", padrao)) if isinstance(valor, dict) else padrao
+    return padrao
+
 def carregar_precos():
     """Lê o JSON e retorna o dicionário de preços normalizado."""
     if not os.path.exists(ARQUIVO_PRECOS):
@@ -62,6 +72,13 @@ def atualizar_um_preco(item, valor):
     else:
         return "⚠️ Erro ao salvar no disco."
 
+def versao_precos():
+    """Muda quando o arquivo de preços é regravado (usado como chave de cache)."""
+    try:
+        return os.stat(ARQUIVO_PRECOS).st_mtime_ns
+    except OSError:
+        return 0
+
 def get_texto_tabela():
     """Gera o texto formatado para o Prompt do Victor."""
     precos = carregar_precos()
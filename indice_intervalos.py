@@ -0,0 +1,106 @@
+import bisect
+import datetime
+import logging
+
+logger = logging.getLogger("IndiceIntervalos")
+
+SAO_PAULO_TZ = datetime.timezone(datetime.timedelta(hours=-3))
+_EPOCA = datetime.datetime(2000, 1, 1)
+
+
+def para_minutos(data_hora):
+    """Converte 'AAAA-MM-DDTHH:MM[:SS][+-HH:MM]' (ou datetime) em minutos desde 2000-01-01, horario de Sao Paulo."""
+    dt = data_hora if isinstance(data_hora, datetime.datetime) else datetime.datetime.fromisoformat(str(data_hora).replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(SAO_PAULO_TZ).replace(tzinfo=None)
+    return int((dt - _EPOCA).total_seconds() // 60)
+
+
+def de_minutos(minutos):
+    return _EPOCA + datetime.timedelta(minutes=minutos)
+
+
+def intervalo_do_evento(evento):
+    """(inicio, fim) em minutos a partir de um evento no formato da agenda interna (start + duracao)."""
+    inicio = para_minutos(evento["start"])
+    return inicio, inicio + int(evento.get("duracao") or 30)
+
+
+class IndiceIntervalos:
+    """
+    Intervalos [inicio, fim) de UM barbeiro, ordenados pelo inicio.
+
+    Busca de conflito em O(log n + k): so olha quem comeca entre (inicio - maior duracao) e o fim
+    pedido, entao funciona mesmo com sobreposicoes antigas ja gravadas.
+    """
+
+    def __init__(self):
+        self._inicios = []
+        self._itens = []
+        self._inicio_por_id = {}
+        self._maior_duracao = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+    def adicionar(self, inicio, fim, ident):
+        if ident in self._inicio_por_id:
+            self.remover(ident)
+        pos = bisect.bisect_right(self._inicios, inicio)
+        self._inicios.insert(pos, inicio)
+        self._itens.insert(pos, (inicio, fim, ident))
+        self._inicio_por_id[ident] = inicio
+        self._maior_duracao = max(self._maior_duracao, fim - inicio)
+
+    def remover(self, ident):
+        inicio = self._inicio_por_id.pop(ident, None)
+        if inicio is None:
+            return False
+        pos = bisect.bisect_left(self._inicios, inicio)
+        while pos < len(self._itens) and self._itens[pos][0] == inicio:
+            if self._itens[pos][2] == ident:
+                del self._inicios[pos]
+                del self._itens[pos]
+                return True
+            pos += 1
+        return False
+
+    def entre(self, inicio, fim):
+        """Intervalos que encostam em [inicio, fim), em ordem de inicio."""
+        pos = bisect.bisect_left(self._inicios, inicio - self._maior_duracao)
+        fim_pos = bisect.bisect_left(self._inicios, fim)
+        return [item for item in self._itens[pos:fim_pos] if item[1] > inicio]
+
+    def conflitos(self, inicio, fim):
+        return [item[2] for item in self.entre(inicio, fim)]
+
+
+class IndiceAgenda:
+    """Um IndiceIntervalos por barbeiro de uma barbearia (vale para a agenda interna e para o espelho do Google)."""
+
+    def __init__(self):
+        self.barbeiros = {}
+
+    @staticmethod
+    def _chave(barbeiro):
+        return (barbeiro or "Principal").strip().lower()
+
+    def indice(self, barbeiro):
+        chave = self._chave(barbeiro)
+        if chave not in self.barbeiros:
+            self.barbeiros[chave] = IndiceIntervalos()
+        return self.barbeiros[chave]
+
+    def adicionar_evento(self, evento):
+        try:
+            inicio, fim = intervalo_do_evento(evento)
+        except (ValueError, TypeError, KeyError):
+            logger.warning(f"Evento com data invalida fora do indice: {evento.get('id')} ({evento.get('start')})")
+            return
+        self.indice(evento.get("barbeiro")).adicionar(inicio, fim, evento["id"])
+
+    def remover_evento(self, evento):
+        self.indice(evento.get("barbeiro")).remover(evento["id"])
+
+    def conflitos(self, barbeiro, inicio, fim):
+        return self.indice(barbeiro).conflitos(inicio, fim)
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import threading
+import uuid
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger("IngestaoMidia")
+
+MIDIA_MAX_BYTES = int(os.getenv("MIDIA_MAX_BYTES", str(10 * 1024 * 1024)))
+MIDIA_TIMEOUT_S = float(os.getenv("MIDIA_TIMEOUT_S", "15"))
+MIDIA_MAX_CONEXOES = int(os.getenv("MIDIA_MAX_CONEXOES", "50"))
+TAMANHO_BLOCO = 64 * 1024
+# URLs já baixadas lembradas em memória (retentativas do Twilio nem chegam a baixar)
+MAX_URLS_LEMBRADAS = 2000
+
+TIPOS_ACEITOS = {
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+
+
+class MidiaRecusada(Exception):
+    pass
+
+
+class IngestaoMidia:
+    """
+    Baixa as imagens que chegam pelo WhatsApp em streaming, num pool httpx compartilhado.
+
+    O arquivo vai para o disco em blocos (memória constante por download), com teto de tamanho
+    e tipo de conteúdo. O nome final é o sha256 do conteúdo: a mesma foto reenviada (ou a mesma
+    URL numa retentativa do Twilio) vira um único arquivo.
+    """
+
+    def __init__(self, pasta, max_bytes=MIDIA_MAX_BYTES, timeout=MIDIA_TIMEOUT_S, max_conexoes=MIDIA_MAX_CONEXOES):
+        self.pasta = Path(pasta)
+        self.pasta.mkdir(exist_ok=True)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_conexoes = max_conexoes
+        self._client = None
+        self._lock = threading.Lock()
+        self._por_url = OrderedDict()
+        self.baixadas = 0
+        self.duplicadas = 0
+        self.recusadas = 0
+        self.bytes_gravados = 0
+
+    def _cliente_http(self):
+        if self._client is None:
+            # Mídia do Twilio exige Basic Auth quando a conta protege as URLs
+            sid, token = os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN")
+            self._client = httpx.AsyncClient(
+                auth=(sid, token) if sid and token else None,
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_conexoes, max_keepalive_connections=self.max_conexoes),
+            )
+        return self._client
+
+    async def baixar(self, url) -> Optional[str]:
+        """Caminho local da imagem (deduplicada), ou None se o download falhar ou for recusado."""
+        with self._lock:
+            conhecido = self._por_url.get(url)
+        if conhecido and os.path.exists(conhecido):
+            with self._lock:
+                self.duplicadas += 1
+            return conhecido
+
+        temporario = self.pasta / f".parcial_{uuid.uuid4().hex}"
+        try:
+            logger.info(f"Baixando imagem: {url}")
+            async with self._cliente_http().stream("GET", url) as resposta:
+                if resposta.status_code != 200:
+                    raise MidiaRecusada(f"HTTP {resposta.status_code}")
+                tipo = resposta.headers.get("content-type", "").split(";")[0].strip().lower()
+                extensao = TIPOS_ACEITOS.get(tipo)
+                if not extensao:
+                    raise MidiaRecusada(f"tipo de conteúdo não aceito: {tipo or 'desconhecido'}")
+                declarado = resposta.headers.get("content-length")
+                if declarado and declarado.isdigit() and int(declarado) > self.max_bytes:
+                    raise MidiaRecusada(f"arquivo de {declarado} bytes (máximo {self.max_bytes})")
+
+                resumo = hashlib.sha256()
+                total = 0
+                with open(temporario, "wb") as f:
+                    async for bloco in resposta.aiter_bytes(TAMANHO_BLOCO):
+                        total += len(bloco)
+                        if total > self.max_bytes:
+                            raise MidiaRecusada(f"arquivo passou de {self.max_bytes} bytes")
+                        resumo.update(bloco)
+                        f.write(bloco)
+
+            destino = self.pasta / f"wpp_{resumo.hexdigest()[:32]}.{extensao}"
+            if destino.exists():
+                temporario.unlink()
+                duplicada = True
+            else:
+                os.replace(temporario, destino)
+                duplicada = False
+
+            with self._lock:
+                if duplicada:
+                    self.duplicadas += 1
+                else:
+                    self.baixadas += 1
+                    self.bytes_gravados += total
+                self._por_url[url] = str(destino)
+                while len(self._por_url) > MAX_URLS_LEMBRADAS:
+                    self._por_url.popitem(last=False)
+            return str(destino)
+
+        except MidiaRecusada as e:
+            with self._lock:
+                self.recusadas += 1
+            logger.warning(f"Imagem recusada ({url}): {e}")
+        except Exception as e:
+            logger.error(f"Erro download imagem: {e}")
+        finally:
+            if temporario.exists():
+                temporario.unlink()
+        return None
+
+    async def fechar(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "baixadas": self.baixadas,
+                "duplicadas": self.duplicadas,
+                "recusadas": self.recusadas,
+                "bytes_gravados": self.bytes_gravados,
+                "max_bytes": self.max_bytes,
+            }
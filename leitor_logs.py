@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import re
+import logging
+
+# Bloco lido de trás para frente a partir do fim do arquivo
+TAMANHO_BLOCO = 64 * 1024
+# Teto de leitura de um tail (com filtro de nível raro, não varre um arquivo de GBs inteiro)
+MAX_BYTES_TAIL = int(os.getenv("LOGS_MAX_BYTES_TAIL", str(32 * 1024 * 1024)))
+# Intervalo entre verificações de linhas novas no streaming
+INTERVALO_ACOMPANHAR_S = 0.5
+
+# "%(asctime)s - %(levelname)s - %(name)s - %(message)s" (logger_config)
+_RE_CABECALHO = re.compile(r"^\d{2}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} - ([A-Z]+) - ")
+
+
+def nivel_da_linha(linha):
+    """Nível (número do logging) de uma linha de cabeçalho, ou None se for continuação (traceback etc.)."""
+    if linha.startswith("{"):
+        # LOG_FORMATO=json: cada linha é um registro completo
+        try:
+            return logging.getLevelNamesMapping().get(json.loads(linha).get("nivel"))
+        except (ValueError, AttributeError):
+            return None
+    encontrado = _RE_CABECALHO.match(linha)
+    if not encontrado:
+        return None
+    return logging.getLevelNamesMapping().get(encontrado.group(1))
+
+
+def nivel_minimo(nivel):
+    """'warning', 'ERROR', 30... -> número do logging. None/'' = sem filtro."""
+    if nivel in (None, ""):
+        return None
+    if isinstance(nivel, int) or str(nivel).isdigit():
+        return int(nivel)
+    numero = logging.getLevelNamesMapping().get(str(nivel).strip().upper())
+    if numero is None:
+        raise ValueError(f"Nível de log desconhecido: {nivel}")
+    return numero
+
+
+def _linhas_de_tras_para_frente(f, max_bytes):
+    """Gera as linhas do arquivo (bytes, sem o \\n) da última para a primeira, lendo blocos do fim."""
+    f.seek(0, os.SEEK_END)
+    posicao = f.tell()
+    limite = max(0, posicao - max_bytes)
+    resto = b""
+    while posicao > limite:
+        tamanho = min(TAMANHO_BLOCO, posicao - limite)
+        posicao -= tamanho
+        f.seek(posicao)
+        bloco = f.read(tamanho) + resto
+        partes = bloco.split(b"\n")
+        # A primeira parte pode ser o pedaço final de uma linha que começa no bloco anterior
+        resto = partes.pop(0)
+        for parte in reversed(partes):
+            yield parte
+    if resto and limite == 0:
+        yield resto
+
+
+def ultimas_linhas(caminho, n=50, nivel=None, max_bytes=MAX_BYTES_TAIL):
+    """
+    As últimas `n` entradas do log, na ordem do arquivo, sem ler o arquivo inteiro.
+    nivel: nível mínimo ("WARNING" traz WARNING, ERROR e CRITICAL). Linhas de continuação
+    (tracebacks) acompanham a entrada a que pertencem.
+    """
+    minimo = nivel_minimo(nivel)
+    if n <= 0 or not os.path.exists(caminho):
+        return []
+
+    entradas = []
+    continuacao = []
+    with open(caminho, "rb") as f:
+        for bruta in _linhas_de_tras_para_frente(f, max_bytes):
+            linha = bruta.decode("utf-8", errors="replace").rstrip("\r")
+            if not linha and not continuacao:
+                continue
+            continuacao.append(linha)
+            nivel_linha = nivel_da_linha(linha)
+            if nivel_linha is None:
+                continue
+            entrada, continuacao = list(reversed(continuacao)), []
+            if minimo is None or nivel_linha >= minimo:
+                entradas.append("\n".join(entrada) + "\n")
+                if len(entradas) >= n:
+                    break
+    # Sem filtro, linhas soltas no começo do trecho lido (sem cabeçalho) também contam
+    if continuacao and minimo is None and len(entradas) < n:
+        entradas.append("\n".join(reversed(continuacao)) + "\n")
+    entradas.reverse()
+    return entradas
+
+
+async def acompanhar(obter_caminho, nivel=None, intervalo=INTERVALO_ACOMPANHAR_S):
+    """
+    Gera as linhas novas do log conforme são escritas (como `tail -f`), a partir do fim atual.
+    obter_caminho() é chamado a cada verificação: na virada do dia passa para o arquivo novo.
+    """
+    minimo = nivel_minimo(nivel)
+    caminho = obter_caminho()
+    posicao = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+    pendente = b""
+    nivel_atual = None
+
+    while True:
+        atual = obter_caminho()
+        if atual != caminho:
+            caminho, posicao, pendente = atual, 0, b""
+        tamanho = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+        if tamanho < posicao:
+            # Arquivo truncado ou recriado
+            posicao, pendente = 0, b""
+
+        if tamanho > posicao:
+            with open(caminho, "rb") as f:
+                f.seek(posicao)
+                dados = f.read(tamanho - posicao)
+            posicao += len(dados)
+            partes = (pendente + dados).split(b"\n")
+            pendente = partes.pop()
+            for bruta in partes:
+                linha = bruta.decode("utf-8", errors="replace").rstrip("\r")
+                nivel_linha = nivel_da_linha(linha)
+                if nivel_linha is not None:
+                    nivel_atual = nivel_linha
+                if minimo is None or (nivel_atual is not None and nivel_atual >= minimo):
+                    yield linha
+        else:
+            await asyncio.sleep(intervalo)
@@ -1,29 +1,198 @@
+import atexit
+import gzip
+import json
 import logging
+import logging.handlers
 import os
-from datetime import date
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
 ActiveLoggers = {}
+# Um pipeline (fila + thread escritora) por nome de log: Log("BotLog") em vários módulos divide o mesmo
+Pipelines = {}
+_lock_pipelines = threading.Lock()
+
+# "texto" (padrão) ou "json": uma linha JSON por registro no arquivo (o console continua em texto)
+LOG_FORMATO = os.getenv("LOG_FORMATO", "texto").strip().lower()
+# Registros aguardando a thread escritora; com a fila cheia (disco travado) o registro é descartado
+LOG_FILA_MAX = int(os.getenv("LOG_FILA_MAX", "10000"))
+# Arquivo de dia anterior só é comprimido depois de parado há esse tempo (outro worker pode estar fechando o dia)
+LOG_ARQUIVAR_APOS_S = 60
+# Dias de log mantidos na pasta (0 = nunca apaga); os dias anteriores a hoje ficam em .log.gz
+LOG_DIAS_GUARDADOS = int(os.getenv("LOG_DIAS_GUARDADOS", "0"))
+
+FORMATO_TEXTO = logging.Formatter(fmt=f'%(asctime)s - %(levelname)s - %(name)s - %(message)s', datefmt='%d-%m-%y %H:%M:%S')
+
+
+class FormatoJson(logging.Formatter):
+    """Uma linha JSON por registro: {"ts", "nivel", "logger", "msg"} (traceback, se houver, vai no msg)."""
+
+    def format(self, record):
+        return json.dumps({
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }, ensure_ascii=False)
+
+
+class ArquivoDiario(logging.Handler):
+    """
+    Escreve em <pasta>/<Nome>_<data>.log e troca de arquivo na virada do dia (o nome segue a data
+    de cada registro, não a do início do processo). Os arquivos de dias anteriores são comprimidos
+    em .log.gz numa thread à parte, e os mais velhos que `dias_guardados` são apagados.
+    Roda na thread do QueueListener: o event loop nunca espera pelo disco.
+    """
+
+    def __init__(self, pasta, nome, dias_guardados=LOG_DIAS_GUARDADOS):
+        super().__init__()
+        self.pasta = Path(pasta)
+        self.nome = nome
+        self.dias_guardados = dias_guardados
+        self._dia = None
+        self._arquivo = None
+        self._segunda_passada = None
+
+    def caminho(self, dia):
+        return self.pasta / f'{self.nome}_{dia}.log'
+
+    def _abrir(self, dia):
+        if self._arquivo:
+            self._arquivo.close()
+        # Adicionei utf-8, que é eficaz ao trabalhar com emojis(evita travar o bot, pois o log nao abria)
+        self._arquivo = open(self.caminho(dia), mode='a', encoding='utf-8')
+        self._dia = dia
+        threading.Thread(target=self.arquivar_antigos, args=(dia,), name=f"log-gzip-{self.nome}", daemon=True).start()
+        # O arquivo de ontem acabou de ser escrito na virada e fica de fora da primeira passada;
+        # uma segunda, depois da carência, comprime no mesmo dia em vez de só na próxima virada
+        if self._segunda_passada:
+            self._segunda_passada.cancel()
+        self._segunda_passada = threading.Timer(LOG_ARQUIVAR_APOS_S + 5, self.arquivar_antigos, args=(dia,))
+        self._segunda_passada.name = f"log-gzip-{self.nome}-2"
+        self._segunda_passada.daemon = True
+        self._segunda_passada.start()
+
+    def emit(self, record):
+        try:
+            dia = date.fromtimestamp(record.created)
+            if dia != self._dia:
+                self._abrir(dia)
+            self._arquivo.write(self.format(record) + "\n")
+            self._arquivo.flush()
+        except Exception:
+            self.handleError(record)
+
+    def arquivar_antigos(self, hoje):
+        """Comprime os .log de dias anteriores a `hoje` e apaga o que passou da retenção."""
+        for antigo in self.pasta.glob(f'{self.nome}_*.log'):
+            dia = antigo.stem[len(self.nome) + 1:]
+            try:
+                if dia >= str(hoje) or time.time() - antigo.stat().st_mtime < LOG_ARQUIVAR_APOS_S:
+                    continue
+                comprimido = antigo.with_name(antigo.name + ".gz")
+                # Temporário por processo: vários workers podem tentar arquivar o mesmo dia
+                parcial = antigo.with_name(f'{antigo.name}.gz.{os.getpid()}')
+                with open(antigo, 'rb') as origem, gzip.open(parcial, 'wb') as destino:
+                    shutil.copyfileobj(origem, destino)
+                os.replace(parcial, comprimido)
+                antigo.unlink()
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                # Não usa o próprio logger: o erro voltaria para este handler
+                sys.stderr.write(f"Erro ao comprimir log {antigo}: {e}\n")
+
+        if self.dias_guardados > 0:
+            limite = str(hoje - timedelta(days=self.dias_guardados))
+            for comprimido in self.pasta.glob(f'{self.nome}_*.log.gz'):
+                if comprimido.name[len(self.nome) + 1:-len('.log.gz')] < limite:
+                    comprimido.unlink(missing_ok=True)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._segunda_passada:
+                self._segunda_passada.cancel()
+                self._segunda_passada = None
+            if self._arquivo:
+                self._arquivo.close()
+                self._arquivo = None
+        finally:
+            self.release()
+        super().close()
+
+
+class FilaLimitada(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (e conta) registros quando a fila está cheia, em vez de bloquear."""
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+class Pipeline:
+    """Fila + QueueListener com os handlers reais (console e arquivo) de um nome de log."""
+
+    def __init__(self, log_path, Name):
+        self.c_handler = logging.StreamHandler()  # Console
+        self.f_handler = ArquivoDiario(log_path, Name)
+
+        self.c_handler.setLevel(logging.INFO)
+        self.f_handler.setLevel(logging.INFO)
+
+        self.c_handler.setFormatter(FORMATO_TEXTO)
+        self.f_handler.setFormatter(FormatoJson() if LOG_FORMATO == "json" else FORMATO_TEXTO)
+
+        self.fila = queue.Queue(maxsize=LOG_FILA_MAX)
+        self.q_handler = FilaLimitada(self.fila)
+        self.q_handler.setLevel(logging.INFO)
+        self.listener = logging.handlers.QueueListener(self.fila, self.c_handler, self.f_handler, respect_handler_level=True)
+        self.listener.start()
+        self.ativo = True
+        atexit.register(self.parar)
+
+    def parar(self):
+        """Escreve o que está na fila e encerra a thread escritora."""
+        if self.ativo:
+            self.ativo = False
+            self.listener.stop()
+            self.f_handler.close()
+
+    def estatisticas(self):
+        return {
+            "na_fila": self.fila.qsize(),
+            "fila_max": self.fila.maxsize,
+            "descartados": self.q_handler.descartados,
+            "formato": LOG_FORMATO,
+        }
+
 
 class Log:
     def __init__(self, Name):
         #cria a pasta log
         self.log_path = Path("logs")
         self.log_path.mkdir(exist_ok=True)
-        
-        file_path = self.log_path / f'{Name}_{date.today()}.log'
+        self.nome = Name
 
-        self.c_handler = logging.StreamHandler()  # Console
-        # Adicionei utf-8, que é eficaz ao trabalhar com emojis(evita travar o bot, pois o log nao abria)
-        self.f_handler = logging.FileHandler(filename=file_path, mode='a', encoding='utf-8') 
-        
-        self.c_handler.setLevel(logging.INFO)
-        self.f_handler.setLevel(logging.INFO)
-        
-        log_format = logging.Formatter(fmt=f'%(asctime)s - %(levelname)s - %(name)s - %(message)s', datefmt='%d-%m-%y %H:%M:%S')
-        
-        self.c_handler.setFormatter(log_format)
-        self.f_handler.setFormatter(log_format)
+        # Os loggers só enfileiram; console e arquivo são escritos pela thread do QueueListener
+        with _lock_pipelines:
+            if Name not in Pipelines:
+                Pipelines[Name] = Pipeline(self.log_path, Name)
+            self.pipeline = Pipelines[Name]
+
+    def caminho_do_dia(self, dia=None):
+        return self.log_path / f'{self.nome}_{dia or date.today()}.log'
 
     def get_logger(self, name):
         if ActiveLoggers.get(name):
@@ -31,10 +200,12 @@ class Log:
         else:
             logger = logging.getLogger(name)
             logger.setLevel(logging.INFO)
-            
+
             if not logger.handlers:
-                logger.addHandler(self.c_handler)
-                logger.addHandler(self.f_handler)
-            
+                logger.addHandler(self.pipeline.q_handler)
+
             ActiveLoggers[name] = logger
-            return logger
\ No newline at end of file
+            return logger
+
+    def estatisticas(self):
+        return self.pipeline.estatisticas()
@@ -2,11 +2,11 @@
 import asyncio
 import json
 import re
-import requests
-import uuid
+import time
+import threading
 import logging
 from pathlib import Path
-from datetime import date, datetime
+from datetime import datetime
 
 # ✅ 1. Importação do Stripe e Google Auth
 import stripe
@@ -14,25 +14,41 @@ from google_auth_oauthlib.flow import Flow # <--- IMPORTANTE PARA O LOGIN
 
 from fastapi import FastAPI, Form, Response, Request, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from twilio.twiml.messaging_response import MessagingResponse
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
+import httpx
 
 # --- SEUS MÓDULOS LOCAIS ---
 from logger_config import Log
-from gerenciador_precos import carregar_precos, salvar_precos, atualizar_um_preco, get_texto_tabela
-from agenda_google import listar_proximos_eventos, criar_evento_agenda, autenticar_google
-from personas import system_prompt, get_director_prompt
-from GeradorDeVideo import criar_video_wan, animar_foto_wan
+from leitor_logs import ultimas_linhas, acompanhar, nivel_minimo
+from gerenciador_precos import carregar_precos, salvar_precos, atualizar_um_preco, get_texto_tabela, obter_duracao, versao_precos
+from agenda_google import criar_evento_agenda, autenticar_google, intervalos_ocupados_google, salvar_token_google, credenciais as credenciais_google
+from espelho_google import espelho_google
+from indice_intervalos import para_minutos
+from personas import montar_prompt_barbearia, get_director_prompt
+from fila_videos import fila_videos, CONCLUIDO, ERRO
+from GeradorDeVideo import cache_refinamento, cache_renders
+from diario_agendamentos import iniciar_compactacao_periodica, intervalos_ocupados
+from motor_horarios import consultar_horarios_livres
+from memoria_conversas import criar_memoria_conversas
+from roteador_intencoes import roteador
+from ingestao_midia import IngestaoMidia
+import executores
+from executores import estatisticas_executores, encerrar_executores
+from estatisticas_dashboard import estatisticas as estatisticas_dashboard
+from metricas import metricas, Cronometro
 
 # --- GERENCIADOR DE CLIENTES (SaaS) ---
 from gerenciador_clientes import (
-    registrar_cliente, autenticar_cliente, buscar_cliente_por_telefone, 
+    registrar_cliente, autenticar_cliente, buscar_cliente_por_telefone, buscar_cliente_por_email,
     atualizar_dados_cliente, ativar_pagamento_cliente,
-    adicionar_creditos_video, descontar_credito_video,
-    salvar_agendamento_interno, listar_agenda_interna
+    adicionar_creditos_video,
+    salvar_agendamento_interno, listar_agenda_interna,
+    estatisticas_cache_clientes, versao_cliente
 )
 
 # --- CONFIGURAÇÃO INICIAL ---
@@ -65,19 +81,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 2. CLIENTE AI (GROQ / OPENAI)
+# 2. CLIENTE AI (GROQ / OPENAI) - assíncrono, com pool de conexões keep-alive compartilhado
+MODELO_LLM = "llama-3.3-70b-versatile"
+LLM_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+LLM_MAX_CONEXOES = int(os.getenv("LLM_MAX_CONEXOES", "200"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "50"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
 try:
-    client = OpenAI(
+    client = AsyncOpenAI(
         api_key=os.getenv("GROQ_API_KEY"),
-        base_url="https://api.groq.com/openai/v1"
+        base_url=LLM_BASE_URL,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONEXOES, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(LLM_TIMEOUT_S, connect=5.0)
+        )
     )
 except Exception as e:
     logger.critical(f"Erro Client AI: {e}")
 
 # 3. VARIÁVEIS DE AMBIENTE E PASTAS
 ADMINS = [num.strip() for num in os.getenv("ADMIN_NUMBERS", "").split(",") if num]
+# Disponibilidade do Google servida do espelho local (espelho_google.py); 0 = FreeBusy ao vivo
+USAR_ESPELHO_GOOGLE = os.getenv("GOOGLE_ESPELHO", "1") == "1"
 PASTA_IMAGENS = Path("imagens_recebidas")
 PASTA_IMAGENS.mkdir(exist_ok=True)
+# Download das fotos do WhatsApp: streaming, pool compartilhado e dedup por sha256
+ingestao_midia = IngestaoMidia(PASTA_IMAGENS)
+
+@app.on_event("startup")
+async def iniciar_tarefas_de_fundo():
+    iniciar_compactacao_periodica()
+    if USAR_ESPELHO_GOOGLE:
+        espelho_google.iniciar_sincronizacao_periodica()
+    credenciais_google.iniciar_renovacao_periodica()
+    # Vídeos que estavam renderizando num worker que caiu voltam para a fila
+    await executores.storage.executar(fila_videos.retomar)
+
+@app.on_event("shutdown")
+async def encerrar_conexoes():
+    await client.close()
+    await ingestao_midia.fechar()
+    encerrar_executores()
 
 # --- MODELOS DE DADOS (Pydantic) ---
 
@@ -111,20 +158,6 @@ class VideoGenRequest(BaseModel):
     email_user: Optional[str] = None 
 
 # --- FUNÇÕES AUXILIARES ---
-def salvar_imagem_localmente(url_imagem: str) -> Optional[str]:
-    try:
-        nome_arquivo = f"wpp_{uuid.uuid4().hex[:8]}.jpg"
-        caminho_completo = PASTA_IMAGENS / nome_arquivo
-        logger.info(f"Baixando imagem: {url_imagem}")
-        resposta = requests.get(url_imagem, timeout=10)
-        if resposta.status_code == 200:
-            with open(caminho_completo, "wb") as f:
-                f.write(resposta.content)
-            return str(caminho_completo)
-    except Exception as e:
-        logger.error(f"Erro download imagem: {e}")
-    return None
-
 # ==========================================
 # ROTAS DE AUTENTICAÇÃO
 # ==========================================
@@ -198,9 +231,8 @@ async def google_callback(code: str, state: str):
         flow.fetch_token(code=code)
         credentials = flow.credentials
         
-        # ✅ SALVA O NOVO TOKEN (Isso corrige o 'invalid_grant')
-        with open("token.json", "w") as token_file:
-            token_file.write(credentials.to_json())
+        # ✅ SALVA O TOKEN DA BARBEARIA (state = email do dono; não sobrescreve as outras contas)
+        await asyncio.to_thread(salvar_token_google, state, credentials)
         
         logger.info(f"Token Google renovado com sucesso para: {state}")
                 
@@ -223,13 +255,14 @@ async def checkout_subscription(data: LoginData):
             ativar_pagamento_cliente(data.email)
             return {"status": "simulated", "url": "http://localhost:5173/dashboard?sucesso=simulacao_bot"}
 
-        checkout_session = stripe.checkout.Session.create(
-            line_items=[{'price': os.getenv("STRIPE_PRICE_ID_SUBSCRIPTION"), 'quantity': 1}],
-            mode='subscription',
-            success_url="http://localhost:5173/dashboard?sucesso=bot",
-            cancel_url="http://localhost:5173/assinatura",
-            metadata={"email_cliente": data.email, "tipo": "assinatura_bot"}
-        )
+        with metricas.medir("chamada_externa_segundos", servico="stripe", operacao="checkout_assinatura"):
+            checkout_session = stripe.checkout.Session.create(
+                line_items=[{'price': os.getenv("STRIPE_PRICE_ID_SUBSCRIPTION"), 'quantity': 1}],
+                mode='subscription',
+                success_url="http://localhost:5173/dashboard?sucesso=bot",
+                cancel_url="http://localhost:5173/assinatura",
+                metadata={"email_cliente": data.email, "tipo": "assinatura_bot"}
+            )
         return {"status": "success", "url": checkout_session.url}
     except Exception as e:
         logger.error(f"Erro Stripe Sub: {e}")
@@ -243,17 +276,18 @@ async def checkout_credits(data: LoginData):
             adicionar_creditos_video(data.email, 10)
             return {"status": "simulated", "url": "http://localhost:5173/studio?sucesso=simulacao_creditos"}
 
-        checkout_session = stripe.checkout.Session.create(
-            line_items=[{'price': os.getenv("STRIPE_PRICE_ID_CREDITS"), 'quantity': 1}],
-            mode='payment',
-            success_url="http://localhost:5173/studio?sucesso=creditos",
-            cancel_url="http://localhost:5173/studio",
-            metadata={
-                "email_cliente": data.email, 
-                "tipo": "compra_creditos",
-                "qtd": 10 
-            }
-        )
+        with metricas.medir("chamada_externa_segundos", servico="stripe", operacao="checkout_creditos"):
+            checkout_session = stripe.checkout.Session.create(
+                line_items=[{'price': os.getenv("STRIPE_PRICE_ID_CREDITS"), 'quantity': 1}],
+                mode='payment',
+                success_url="http://localhost:5173/studio?sucesso=creditos",
+                cancel_url="http://localhost:5173/studio",
+                metadata={
+                    "email_cliente": data.email, 
+                    "tipo": "compra_creditos",
+                    "qtd": 10 
+                }
+            )
         return {"status": "success", "url": checkout_session.url}
     except Exception as e:
         logger.error(f"Erro Stripe Credits: {e}")
@@ -291,21 +325,70 @@ async def stripe_webhook(request: Request):
 # ==========================================
 
 @app.get("/api/dashboard/stats")
-async def get_stats():
-    return {"agendamentos_hoje": 4, "receita_estimada": 350.00, "videos_gerados": 12, "status_sistema": "Online 🟢"}
+async def get_stats(email: Optional[str] = None):
+    # Agregados mantidos a cada agendamento/cancelamento/vídeo (estatisticas_dashboard.py)
+    cliente = buscar_cliente_por_email(email) if email else None
+    precos = cliente.get("precos", {}) if cliente else carregar_precos()
+    dados = estatisticas_dashboard().resumo(email or "demo", precos)
+    dados["status_sistema"] = "Online 🟢"
+    return dados
 
 @app.get("/api/dashboard/logs")
-async def get_logs():
-    log_lines = []
+async def get_logs(n: int = 50, level: Optional[str] = None):
+    try:
+        nivel_minimo(level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        nome_arquivo = log_setup.log_path / f"BotLog_{date.today()}.log"
-        if os.path.exists(nome_arquivo):
-            with open(nome_arquivo, "r", encoding="utf-8") as f:
-                log_lines = f.readlines()[-50:] 
+        # Lê do fim do arquivo para trás: custo proporcional a n, não ao tamanho do log do dia
+        log_lines = await asyncio.to_thread(ultimas_linhas, log_setup.caminho_do_dia(), max(0, min(n, 1000)), level)
     except Exception as e:
         log_lines = [f"Erro ao ler logs: {str(e)}"]
     return {"logs": log_lines}
 
+@app.get("/api/dashboard/logs/stream")
+async def stream_logs(request: Request, level: Optional[str] = None):
+    """Server-Sent Events com as linhas novas do log, para o dashboard não precisar ficar consultando."""
+    try:
+        nivel_minimo(level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def eventos():
+        yield "retry: 3000\n\n"
+        async for linha in acompanhar(log_setup.caminho_do_dia, level):
+            if await request.is_disconnected():
+                break
+            yield f"data: {linha}\n\n"
+
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/dashboard/cache")
+async def get_cache_stats():
+    return {
+        "clientes": estatisticas_cache_clientes(),
+        "conversas": conversas.estatisticas(),
+        "refinamento_video": cache_refinamento.estatisticas(),
+        "renders_video": cache_renders.estatisticas(),
+        "midia": ingestao_midia.estatisticas(),
+        "espelho_google": espelho_google.estatisticas(),
+        "credenciais_google": credenciais_google.estatisticas(),
+        "logs": log_setup.estatisticas(),
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Histogramas de latência (etapas do WhatsApp, tools, serviços externos, executores) no formato do Prometheus."""
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/dashboard/executores")
+async def get_executores_stats():
+    return estatisticas_executores()
+
+@app.get("/api/dashboard/router")
+async def get_router_stats():
+    return roteador.estatisticas()
+
 @app.get("/api/dashboard/prices")
 async def get_prices_api():
     return carregar_precos()
@@ -340,12 +423,15 @@ async def get_agenda_internal_api(email: str):
     eventos = listar_agenda_interna(email)
     return eventos
 
+def _proximos_eventos_google(email):
+    service = autenticar_google(email)
+    agora = datetime.utcnow().isoformat() + "Z"
+    return service.events().list(calendarId="primary", timeMin=agora, maxResults=20, singleEvents=True, orderBy="startTime").execute()
+
 @app.get("/api/dashboard/calendar")
-async def get_calendar_events():
+async def get_calendar_events(email: Optional[str] = None):
     try:
-        service = autenticar_google()
-        agora = datetime.utcnow().isoformat() + "Z"
-        events = service.events().list(calendarId="primary", timeMin=agora, maxResults=20, singleEvents=True, orderBy="startTime").execute()
+        events = await executores.google.executar(_proximos_eventos_google, email)
         items = events.get("items", [])
         
         eventos_limpos = []
@@ -365,19 +451,46 @@ async def generate_video_dashboard(req: VideoGenRequest):
     if not req.email_user:
         raise HTTPException(status_code=400, detail="Usuário não identificado.")
 
-    tem_saldo = descontar_credito_video(req.email_user)
-    if not tem_saldo:
-        raise HTTPException(status_code=402, detail="Sem créditos. Recarregue no Studio.")
-
-    try:
-        if req.tipo == "imagem" and req.image_url:
-            url = animar_foto_wan(req.image_url, req.prompt)
-        else:
-            url = criar_video_wan(req.prompt)
-        return {"video_url": url}
-    except Exception as e:
-        adicionar_creditos_video(req.email_user, 1)
-        raise HTTPException(status_code=500, detail=str(e))
+    # Desconta o crédito e devolve o job na hora; o render roda na fila (crédito volta se falhar)
+    ok, job = await executores.storage.executar(
+        fila_videos.submeter,
+        req.email_user, req.prompt, tipo=req.tipo, image_url=req.image_url, email_cobranca=req.email_user
+    )
+    if not ok:
+        status = 402 if "crédito" in job.lower() else 429
+        raise HTTPException(status_code=status, detail=job)
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/api/dashboard/video-jobs/{job['id']}"}
+
+@app.get("/media/videos/{nome_arquivo}")
+async def get_video_cache(nome_arquivo: str):
+    # MP4s baixados pelo cache de renders (RENDER_CACHE_BAIXAR=1); o nome é o hash do pedido
+    chave = nome_arquivo.removesuffix(".mp4")
+    caminho = cache_renders.caminho_local(chave)
+    if not re.fullmatch(r"[0-9a-f]{64}", chave) or not os.path.exists(caminho):
+        raise HTTPException(status_code=404, detail="Vídeo não encontrado.")
+    return FileResponse(caminho, media_type="video/mp4")
+
+@app.get("/api/dashboard/video-jobs")
+async def list_video_jobs(email_user: str):
+    return {"jobs": await executores.storage.executar(fila_videos.listar, email_user)}
+
+@app.get("/api/dashboard/video-jobs/{job_id}")
+async def get_video_job(job_id: str):
+    job = await executores.storage.executar(fila_videos.obter, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return job
+
+@app.get("/api/dashboard/video-jobs/{job_id}/result")
+async def get_video_job_result(job_id: str):
+    job = await executores.storage.executar(fila_videos.obter, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    if job["status"] == ERRO:
+        raise HTTPException(status_code=500, detail=job["erro"])
+    if job["status"] != CONCLUIDO:
+        return Response(status_code=202, content=json.dumps({"status": job["status"]}), media_type="application/json")
+    return {"video_url": job["video_url"]}
 
 # ==========================================
 # LÓGICA DO WHATSAPP + AI
@@ -388,12 +501,13 @@ tools_agenda = [
         "type": "function", 
         "function": {
             "name": "verificar_agenda", 
-            "description": "Verifica horários disponíveis.", 
+            "description": "Retorna os próximos horários livres (já considerando expediente e duração do serviço).", 
             "parameters": {
                 "type": "object", 
                 "properties": {
-                    "nome_barbeiro": {"type": "string", "description": "Nome do barbeiro (opcional)"},
-                    "data": {"type": "string", "description": "Data para verificar (AAAA-MM-DD). Opcional."} 
+                    "nome_barbeiro": {"type": "string", "description": "Nome do barbeiro (opcional; sem ele consulta a equipe toda)"},
+                    "data": {"type": "string", "description": "Data para verificar (AAAA-MM-DD). Opcional."},
+                    "servico": {"type": "string", "description": "Serviço desejado, para calcular a duração. Opcional."}
                 }
             }
         }
@@ -408,7 +522,8 @@ tools_agenda = [
                 "properties": {
                     "data_hora": {"type": "string"}, 
                     "nome_cliente": {"type": "string"},
-                    "nome_barbeiro": {"type": "string", "description": "Nome do barbeiro escolhido (ou Principal)"}
+                    "nome_barbeiro": {"type": "string", "description": "Nome do barbeiro escolhido (ou Principal)"},
+                    "servico": {"type": "string", "description": "Serviço da tabela (corte, barba, combo...)"}
                 }, 
                 "required": ["data_hora", "nome_cliente"]
             }
@@ -419,14 +534,299 @@ tools_agenda = [
 
 tools_video = [
     {"type": "function", "function": {"name": "gerar_video_marketing", "description": "Cria vídeo texto.", "parameters": {"type": "object", "properties": {"descricao_ideia": {"type": "string"}}, "required": ["descricao_ideia"]}}},
-    {"type": "function", "function": {"name": "animar_foto_cliente", "description": "Anima foto.", "parameters": {"type": "object", "properties": {"url_imagem": {"type": "string"}, "ideia_movimento": {"type": "string"}}, "required": ["url_imagem", "ideia_movimento"]}}}
+    {"type": "function", "function": {"name": "animar_foto_cliente", "description": "Anima foto.", "parameters": {"type": "object", "properties": {"url_imagem": {"type": "string"}, "ideia_movimento": {"type": "string"}}, "required": ["url_imagem", "ideia_movimento"]}}},
+    {"type": "function", "function": {"name": "status_video", "description": "Consulta o andamento dos vídeos pedidos.", "parameters": {"type": "object", "properties": {}}}}
 ]
 
-historico_conversas = {}
-modos_usuarios = {} 
+# Histórico e modo de cada número. Backend escolhido por CONVERSAS_BACKEND (memoria | sqlite | redis);
+# com mais de um worker do uvicorn use sqlite ou redis (ver memoria_conversas.py)
+conversas = criar_memoria_conversas()
+
+# Timeout de cada tool (s). O turno inteiro (duas chamadas à IA + tools) tem que caber na janela de
+# 15 s do webhook do Twilio. Cada um pode ser trocado por TOOL_TIMEOUT_<NOME>_S (ex: TOOL_TIMEOUT_AGENDAR_SERVICO_S).
+TOOL_TIMEOUT_PADRAO_S = float(os.getenv("TOOL_TIMEOUT_S", "8"))
+TOOL_TIMEOUTS = {
+    nome: float(os.getenv(f"TOOL_TIMEOUT_{nome.upper()}_S", padrao))
+    for nome, padrao in {
+        "verificar_agenda": 6,
+        "agendar_servico": 8,
+        "alterar_preco_servico": 5,
+        "gerar_video_marketing": 5,
+        "animar_foto_cliente": 5,
+        "status_video": 3,
+    }.items()
+}
+# Tools que gravam: passando do prazo não são canceladas (a thread no executor terminaria a gravação
+# mesmo assim); a IA responde que está processando e o resultado real chega depois pelo WhatsApp.
+TOOLS_QUE_ALTERAM = {"agendar_servico", "alterar_preco_servico", "gerar_video_marketing", "animar_foto_cliente"}
+# Confirmações em andamento (referência forte: o asyncio só guarda referência fraca das tasks)
+_confirmacoes_pendentes = set()
+
+# alterar_preco_servico faz ler-alterar-gravar em tabela_precos.json e nos preços do cliente
+_trava_precos = threading.Lock()
+
+def avisar_whatsapp(numero, texto, media_url=None):
+    """Mensagem ativa (fora da resposta do webhook): registra no histórico do número e manda pelo Twilio REST."""
+    historico = conversas.obter_historico(numero)
+    if historico:
+        historico.append({"role": "assistant", "content": texto})
+        conversas.salvar_historico(numero, historico)
+
+    sid, token = os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN")
+    remetente = os.getenv("TWILIO_WHATSAPP_FROM")
+    if not (sid and token and remetente):
+        logger.info(f"Aviso para {numero}: Twilio REST não configurado, sem aviso ativo.")
+        return
+    from twilio.rest import Client as TwilioClient
+    envio = {"from_": remetente, "to": numero, "body": texto}
+    if media_url:
+        envio["media_url"] = [media_url]
+    TwilioClient(sid, token).messages.create(**envio)
+
+def avisar_video_pronto(numero, job):
+    """Aviso da fila: manda o vídeo (ou o erro) pelo WhatsApp e registra no histórico do número."""
+    if job["status"] == CONCLUIDO:
+        avisar_whatsapp(numero, f"🎬 Seu vídeo ficou pronto!\n{job['video_url']}", media_url=job["video_url"])
+    else:
+        avisar_whatsapp(numero, f"⚠️ Não consegui gerar o vídeo: {job['erro']}")
+
+# O job pode terminar em outro worker: o aviso vai pelo número gravado no job, não por closure
+fila_videos.configurar_aviso(avisar_video_pronto)
+
+def buscador_de_ocupados(cliente_saas, tipo_agenda):
+    """
+    Fonte dos horários ocupados para o motor_horarios: sempre o diário interno (onde todo
+    agendamento do bot é gravado) e, nas barbearias com agenda Google, também as agendas da equipe -
+    do espelho em memória (espelho_google.py) ou, com GOOGLE_ESPELHO=0, do FreeBusy ao vivo.
+    """
+    email_agenda = cliente_saas["email"] if cliente_saas else "demo"
+    conta_google = cliente_saas["email"] if cliente_saas else None
+    calendarios = {m["nome"]: m.get("id_google_calendar", "primary") for m in (cliente_saas or {}).get("equipe", [])}
+
+    def _buscar(barbeiros, inicio, fim):
+        ocupados = intervalos_ocupados(email_agenda, barbeiros, inicio, fim)
+        if tipo_agenda == "google":
+            da_equipe = {b: calendarios.get(b, "primary") for b in barbeiros}
+            if USAR_ESPELHO_GOOGLE:
+                do_google = espelho_google.intervalos_ocupados(da_equipe, inicio, fim, conta=conta_google)
+            else:
+                do_google = intervalos_ocupados_google(da_equipe, inicio, fim, conta=conta_google)
+            for barbeiro, lista in do_google.items():
+                ocupados[barbeiro] = list(ocupados.get(barbeiro, [])) + lista
+        return ocupados
+    return _buscar
+
+def _alterar_preco(servico, novo_valor, cliente_saas):
+    with _trava_precos:
+        resultado = atualizar_um_preco(servico, novo_valor)
+        if cliente_saas:
+             p = dict((buscar_cliente_por_email(cliente_saas["email"]) or cliente_saas).get("precos", {}))
+             item_key = servico.lower().strip()
+             # Só o preço muda: a duração do serviço continua valendo para os agendamentos
+             antigo = p.get(item_key)
+             duracao = int(antigo.get("duracao", 30)) if isinstance(antigo, dict) else 30
+             p[item_key] = {"preco": float(novo_valor), "duracao": duracao}
+             atualizar_dados_cliente(cliente_saas["email"], {"precos": p})
+    return resultado
+
+async def executar_tool(nome_funcao, args, cliente_saas, tipo_agenda, eh_admin, numero=None):
+    """
+    Executa uma tool pedida pela IA. Todo código bloqueante vai para o executor da dependência
+    (executores.google / storage / fal), nunca para o event loop.
+    """
+    # ✅ LÓGICA DE AGENDA HÍBRIDA & DINÂMICA
+    if nome_funcao in ["agendar_servico", "verificar_agenda"]:
+        nome_barbeiro_req = args.get("nome_barbeiro", "Principal")
+
+        # Default: Agenda Mestre
+        id_calendar = "primary"
+        nome_real = "Principal"
+
+        # ✅ BUSCA DINÂMICA DO ID DO BARBEIRO NA EQUIPE
+        if cliente_saas:
+            for membro in cliente_saas.get("equipe", []):
+                if membro["nome"].lower() in nome_barbeiro_req.lower():
+                    id_calendar = membro.get("id_google_calendar", "primary")
+                    nome_real = membro["nome"]
+                    break
+
+        if nome_funcao == "agendar_servico":
+            precos_atuais = cliente_saas.get("precos", {}) if cliente_saas else await executores.storage.executar(carregar_precos)
+            duracao = obter_duracao(precos_atuais, args.get("servico"))
+            conta_google = cliente_saas["email"] if cliente_saas else None
+
+            # 0. Agenda Google: confere no espelho compromissos marcados fora do bot
+            conflito_google = []
+            if tipo_agenda == "google" and USAR_ESPELHO_GOOGLE:
+                try:
+                    inicio_min = para_minutos(args.get("data_hora"))
+                    conflito_google = await executores.google.executar(
+                        espelho_google.conflitos, id_calendar, inicio_min, inicio_min + duracao, conta=conta_google
+                    )
+                except Exception as e_espelho:
+                    logger.warning(f"Sem conferência no espelho Google ({id_calendar}): {e_espelho}")
+
+            # 1. Salva no Backup Interno (diario) - recusa se o barbeiro ja estiver ocupado
+            if conflito_google:
+                salvo, msg_interna = False, f"Horário indisponível: {nome_real} já tem compromisso na agenda Google nesse horário."
+            else:
+                salvo, msg_interna = await executores.storage.executar(
+                    salvar_agendamento_interno,
+                    cliente_saas["email"] if cliente_saas else "demo",
+                    nome_real,
+                    args.get("data_hora"),
+                    args.get("nome_cliente"),
+                    servico=args.get("servico"),
+                    duracao=duracao
+                )
+
+            # 2. Tenta salvar no Google Calendar
+            msg_retorno = ""
+            if not salvo:
+                msg_retorno = msg_interna
+            elif tipo_agenda == "google" or id_calendar != "primary":
+                try:
+                    logger.info(f"Tentando agendar no Google para: {id_calendar}")
+                    resultado_google = await executores.google.executar(
+                        criar_evento_agenda,
+                        args.get("data_hora"), 
+                        f"{args.get('nome_cliente')} ({nome_real})",
+                        calendar_id=id_calendar,
+                        duracao_min=duracao,
+                        conta=conta_google
+                    )
+                    msg_retorno = resultado_google 
+                    espelho_google.invalidar(id_calendar, conta=conta_google)
+                except Exception as e_google:
+                    logger.error(f"Falha no Google: {e_google}")
+                    msg_retorno = f"Agendado com sucesso no sistema interno para {nome_real}. (Obs: Erro na sync Google)"
+            else:
+                msg_retorno = f"Agendado com sucesso no sistema da barbearia para {nome_real}!"
+
+            resultado = msg_retorno
+
+        elif nome_funcao == "verificar_agenda":
+            # Agenda Google lê o espelho/FreeBusy; a interna só o diário local
+            executor = executores.google if tipo_agenda == "google" else executores.storage
+            resultado = await executor.executar(
+                consultar_horarios_livres,
+                cliente_saas,
+                buscador_de_ocupados(cliente_saas, tipo_agenda),
+                nome_barbeiro=args.get("nome_barbeiro"),
+                servico=args.get("servico"),
+                data=args.get("data")
+            )
+
+    elif nome_funcao == "alterar_preco_servico":
+        if eh_admin: 
+            resultado = await executores.storage.executar(_alterar_preco, args.get("servico"), args.get("novo_valor"), cliente_saas)
+        else: 
+            resultado = "Sem permissão."
+    elif nome_funcao in ["gerar_video_marketing", "animar_foto_cliente"]:
+        dono = cliente_saas["email"] if cliente_saas else numero
+        if nome_funcao == "gerar_video_marketing":
+            ok, job = await executores.storage.executar(fila_videos.submeter, dono, args.get("descricao_ideia"), avisar=numero)
+        else:
+            ok, job = await executores.storage.executar(
+                fila_videos.submeter, dono, args.get("ideia_movimento"), tipo="imagem", image_url=args.get("url_imagem"),
+                avisar=numero
+            )
+        if ok:
+            resultado = f"Vídeo na fila de renderização (pedido {job['id']}). Leva alguns minutos; o link chega aqui quando ficar pronto."
+        else:
+            resultado = job
+    elif nome_funcao == "status_video":
+        dono = cliente_saas["email"] if cliente_saas else numero
+        jobs = await executores.storage.executar(fila_videos.listar, dono, limite=3)
+        if not jobs:
+            resultado = "Nenhum vídeo pedido recentemente."
+        else:
+            resultado = "\n".join(
+                f"- {j['id']}: {j['status']}" + (f" {j['video_url']}" if j["video_url"] else "") + (f" ({j['erro']})" if j["erro"] else "")
+                for j in jobs
+            )
+    else:
+        resultado = "Função desconhecida."
+    return resultado
+
+async def executar_tool_call(tool_call, cliente_saas, tipo_agenda, eh_admin, numero=None):
+    """
+    Roda uma tool_call e devolve a mensagem role=tool para o histórico, no máximo em
+    TOOL_TIMEOUTS[nome] segundos. Consultas que passam do prazo são canceladas. Tools que gravam
+    (TOOLS_QUE_ALTERAM) rodam protegidas por shield: passando do prazo continuam em segundo plano,
+    a IA responde que está processando e o resultado real vai depois para o número.
+    """
+    nome_funcao = tool_call.function.name
+    limite = TOOL_TIMEOUTS.get(nome_funcao, TOOL_TIMEOUT_PADRAO_S)
+    inicio = time.perf_counter()
+    status = "ok"
+    try:
+        args = json.loads(tool_call.function.arguments or "{}")
+        logger.info(f"Tool: {nome_funcao} | Args: {args}")
+        tarefa = asyncio.ensure_future(executar_tool(nome_funcao, args, cliente_saas, tipo_agenda, eh_admin, numero))
+        if nome_funcao in TOOLS_QUE_ALTERAM:
+            try:
+                resultado = await asyncio.wait_for(asyncio.shield(tarefa), timeout=limite)
+            except asyncio.TimeoutError:
+                logger.warning(f"Tool {nome_funcao} passou de {limite:.0f}s; confirmação vai depois")
+                status = "lenta"
+                confirmacao = asyncio.ensure_future(_confirmar_quando_terminar(tarefa, nome_funcao, numero))
+                _confirmacoes_pendentes.add(confirmacao)
+                confirmacao.add_done_callback(_confirmacoes_pendentes.discard)
+                resultado = ("Ainda processando (o sistema está lento). NÃO diga que deu certo nem que falhou: "
+                             "avise o cliente que o pedido está sendo processado e que a confirmação chega por aqui em instantes.")
+        else:
+            resultado = await asyncio.wait_for(tarefa, timeout=limite)
+    except asyncio.TimeoutError:
+        logger.error(f"Timeout Tool {nome_funcao}")
+        resultado = f"Erro técnico: {nome_funcao} demorou demais para responder."
+        status = "timeout"
+    except Exception as e:
+        logger.error(f"Erro Tool {nome_funcao}: {e}")
+        resultado = f"Erro técnico: {str(e)}"
+        status = "erro"
+    metricas.observar(
+        "tool_segundos", time.perf_counter() - inicio,
+        tool=nome_funcao, tenant=cliente_saas["email"] if cliente_saas else "demo", status=status
+    )
+
+    return {
+        "role": "tool", "tool_call_id": tool_call.id,
+        "name": nome_funcao, "content": str(resultado)
+    }
+
+
+async def _confirmar_quando_terminar(tarefa, nome_funcao, numero):
+    """Tool que gravou depois do prazo: manda o resultado real para o número quando terminar."""
+    try:
+        resultado = await tarefa
+    except Exception as e:
+        logger.error(f"Erro Tool {nome_funcao} (após o prazo): {e}")
+        resultado = f"⚠️ Não consegui concluir o pedido: {e}"
+    logger.info(f"Tool {nome_funcao} terminou após o prazo: {str(resultado)[:200]}")
+    if numero:
+        try:
+            await executores.storage.executar(avisar_whatsapp, numero, str(resultado))
+        except Exception as e:
+            logger.error(f"Erro ao confirmar {nome_funcao} para {numero}: {e}")
+
+
+def resposta_twiml(texto_final):
+    twilio_resp = MessagingResponse()
+    msg = twilio_resp.message(texto_final)
+    
+    url_pattern = r'(https?://[^\s]+(?:\.mp4|fal\.media|pexels)[^\s]*)'
+    urls_encontradas = re.findall(url_pattern, texto_final)
+    if urls_encontradas:
+        msg.media(urls_encontradas[0])
+
+    return Response(content=str(twilio_resp), media_type="application/xml")
 
 @app.post("/whatsapp")
 async def reply_whatsapp(request: Request):
+    # Spans de cada etapa do turno -> whatsapp_etapa_segundos em /metrics
+    cronometro = Cronometro()
+    tenant, caminho = "demo", "erro"
     try:
         form_data = await request.form()
         Body = form_data.get("Body", "").strip()
@@ -436,28 +836,19 @@ async def reply_whatsapp(request: Request):
 
         if not From: return Response("Sender missing")
 
+        cronometro.marcar("leitura_form")
         cliente_saas = buscar_cliente_por_telefone(From)
+        cronometro.marcar("busca_cliente")
         
         if cliente_saas:
-            pass # Liberado
+            tenant = cliente_saas["email"]
 
-        # Define Variáveis Dinâmicas
+        # Define Variáveis Dinâmicas (o texto do prompt com equipe/preços sai do cache em personas.py)
         if cliente_saas:
-            nome_bot = cliente_saas["config"].get("nome_bot", "Assistente")
             nome_barbearia = cliente_saas["config"].get("nome_barbearia", "Barbearia")
             tipo_agenda = cliente_saas["config"].get("tipo_agenda", "interna")
-            
-            equipe = cliente_saas.get("equipe", [])
-            nomes_equipe = ", ".join([m["nome"] for m in equipe])
-            
-            p = cliente_saas.get("precos", {})
-            tabela_atual = f"TABELA {nome_barbearia.upper()}:\n"
-            for k, v in p.items(): tabela_atual += f"- {k}: R$ {v}\n"
         else:
-            nome_bot = "Victor AI"
             nome_barbearia = "Barbearia Modelo"
-            nomes_equipe = "Principal"
-            tabela_atual = get_texto_tabela()
             tipo_agenda = "interna"
 
         eh_admin = (From in ADMINS) or (cliente_saas is not None)
@@ -468,188 +859,122 @@ async def reply_whatsapp(request: Request):
                 pode_usar_video = False
             
             if pode_usar_video:
-                modos_usuarios[From] = "video"
+                conversas.definir_modo(From, "video")
                 Body = Body[6:].strip() or "Modo Diretor."
             else:
                 Body = "Seu plano atual não inclui a criação de vídeos."
         
         elif Body.lower().startswith("/barbeiro"):
-            modos_usuarios[From] = "barbeiro"
+            conversas.definir_modo(From, "barbeiro")
             Body = Body[9:].strip()
 
-        modo_atual = modos_usuarios.get(From, "barbeiro")
+        modo_atual = conversas.obter_modo(From, "barbeiro")
         
-        if modo_atual == "video" and eh_admin:
+        modo_diretor = modo_atual == "video" and eh_admin
+        if modo_diretor:
             prompt_sistema = get_director_prompt()
             tools_ativas = tools_video
         else:
-            prompt_sistema = system_prompt()
-            contexto_atual = (
-                "[DADOS ATUAIS]\n"
-                f"- Nome do bot: {nome_bot}\n"
-                f"- Barbearia: {nome_barbearia}\n"
-                f"- Profissionais: {nomes_equipe}\n"
-                f"- Tipo de agenda: {tipo_agenda}\n"
-                f"{tabela_atual}"
-            )
-            prompt_sistema = f"{prompt_sistema}\n\n{contexto_atual}"
+            if cliente_saas:
+                prompt_sistema = montar_prompt_barbearia(
+                    cliente_saas["email"], versao_cliente(cliente_saas["email"]), cliente=cliente_saas
+                )
+            else:
+                prompt_sistema = montar_prompt_barbearia("demo", versao_precos(), gerar_tabela=get_texto_tabela)
             tools_ativas = tools_agenda
-            modos_usuarios[From] = "barbeiro"
+            if modo_atual != "barbeiro":
+                conversas.definir_modo(From, "barbeiro")
 
-        if From not in historico_conversas:
-            historico_conversas[From] = []
-        
-        if len(historico_conversas[From]) > 12:
-            historico_conversas[From] = [historico_conversas[From][0]] + historico_conversas[From][-11:]
+        cronometro.marcar("prompt")
 
-        if not historico_conversas[From] or historico_conversas[From][0]["role"] != "system":
-            historico_conversas[From].insert(0, {"role": "system", "content": prompt_sistema})
+        # Cópia local; o corte das mensagens antigas acontece ao salvar de volta na memória
+        historico = conversas.obter_historico(From)
+
+        if not historico or historico[0]["role"] != "system":
+            historico.insert(0, {"role": "system", "content": prompt_sistema})
         else:
-            historico_conversas[From][0]["content"] = prompt_sistema
+            historico[0] = {"role": "system", "content": prompt_sistema}
+        cronometro.marcar("historico")
 
         conteudo_msg = Body
         if num_media > 0 and media_url and eh_admin:
-            local_path = await asyncio.to_thread(salvar_imagem_localmente, media_url)
+            local_path = await ingestao_midia.baixar(media_url)
             if local_path:
                 conteudo_msg = f"{Body} [IMAGEM RECEBIDA: {local_path}]"
+            cronometro.marcar("midia")
 
-        historico_conversas[From].append({"role": "user", "content": conteudo_msg})
+        historico.append({"role": "user", "content": conteudo_msg})
         logger.info(f"Msg de {From} ({nome_barbearia}): {conteudo_msg}")
 
+        # Caminho rápido: preço, horário de funcionamento e /barbeiro vazio saem direto dos dados da barbearia
+        if not modo_diretor and num_media == 0:
+            texto_rapido = roteador.responder(Body, cliente_saas)
+            cronometro.marcar("roteador")
+            if texto_rapido is not None:
+                logger.info(f"Resposta rápida (sem IA) para {From}")
+                historico.append({"role": "assistant", "content": texto_rapido})
+                conversas.salvar_historico(From, historico)
+                cronometro.marcar("salvar_historico")
+                caminho = "rapido"
+                return resposta_twiml(texto_rapido)
+
         # Chamada AI
-        resposta = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="llama-3.3-70b-versatile",
-            messages=historico_conversas[From],
+        inicio_llm = time.perf_counter()
+        resposta = await client.chat.completions.create(
+            model=MODELO_LLM,
+            messages=historico,
             tools=tools_ativas if tools_ativas else None,
             tool_choice="auto" if tools_ativas else None,
-            temperature=0.3
+            temperature=0.3,
+            timeout=LLM_TIMEOUT_S
         )
+        roteador.registrar_latencia_llm(time.perf_counter() - inicio_llm)
+        cronometro.marcar("llm_1", model=MODELO_LLM)
         msg_ia = resposta.choices[0].message
         texto_final = ""
 
         if msg_ia.tool_calls:
-            tool_call = msg_ia.tool_calls[0]
-            nome_funcao = tool_call.function.name
-            args = json.loads(tool_call.function.arguments)
-            logger.info(f"Tool: {nome_funcao} | Args: {args}")
-            
-            try:
-                # ✅ LÓGICA DE AGENDA HÍBRIDA & DINÂMICA
-                if nome_funcao in ["agendar_servico", "verificar_agenda"]:
-                    nome_barbeiro_req = args.get("nome_barbeiro", "Principal")
-                    
-                    # Default: Agenda Mestre
-                    id_calendar = "primary"
-                    nome_real = "Principal"
-                    
-                    # ✅ BUSCA DINÂMICA DO ID DO BARBEIRO NA EQUIPE
-                    if cliente_saas:
-                        for membro in cliente_saas.get("equipe", []):
-                            if membro["nome"].lower() in nome_barbeiro_req.lower():
-                                id_calendar = membro.get("id_google_calendar", "primary")
-                                nome_real = membro["nome"]
-                                break
-                    
-                    if nome_funcao == "agendar_servico":
-                        # 1. Salva no Backup Interno (JSON)
-                        salvar_agendamento_interno(
-                            cliente_saas["email"] if cliente_saas else "demo",
-                            nome_real,
-                            args.get("data_hora"),
-                            args.get("nome_cliente")
-                        )
-
-                        # 2. Tenta salvar no Google Calendar
-                        msg_retorno = ""
-                        if tipo_agenda == "google" or id_calendar != "primary":
-                            try:
-                                logger.info(f"Tentando agendar no Google para: {id_calendar}")
-                                resultado_google = criar_evento_agenda(
-                                    args.get("data_hora"), 
-                                    f"{args.get('nome_cliente')} ({nome_real})",
-                                    calendar_id=id_calendar
-                                )
-                                msg_retorno = resultado_google 
-                            except Exception as e_google:
-                                logger.error(f"Falha no Google: {e_google}")
-                                msg_retorno = f"Agendado com sucesso no sistema interno para {nome_real}. (Obs: Erro na sync Google)"
-                        else:
-                            msg_retorno = f"Agendado com sucesso no sistema da barbearia para {nome_real}!"
-
-                        resultado = msg_retorno
-                    
-                    elif nome_funcao == "verificar_agenda":
-                        if tipo_agenda == "google":
-                            resultado = listar_proximos_eventos(calendar_id=id_calendar)
-                        else:
-                            agendamentos = listar_agenda_interna(cliente_saas["email"] if cliente_saas else "demo")
-                            # Filtra apenas do barbeiro certo
-                            agendamentos_barbeiro = [a for a in agendamentos if a["barbeiro"] == nome_real]
-                            
-                            # Filtro opcional por Data
-                            data_filtro = args.get("data")
-                            if data_filtro:
-                                agendamentos_barbeiro = [a for a in agendamentos_barbeiro if a["start"].startswith(data_filtro)]
-
-                            if not agendamentos_barbeiro:
-                                resultado = f"Agenda do {nome_real} está livre{' nesta data' if data_filtro else ''}."
-                            else:
-                                resultado = f"Ocupado em: " + ", ".join([a["start"] for a in agendamentos_barbeiro])
-
-                elif nome_funcao == "alterar_preco_servico":
-                    if eh_admin: 
-                        resultado = atualizar_um_preco(args.get("servico"), args.get("novo_valor"))
-                        if cliente_saas:
-                             p = cliente_saas.get("precos", {})
-                             item_key = args.get("servico").lower().strip()
-                             p[item_key] = float(args.get("novo_valor"))
-                             atualizar_dados_cliente(cliente_saas["email"], {"precos": p})
-                    else: 
-                        resultado = "Sem permissão."
-                elif nome_funcao == "gerar_video_marketing":
-                    resultado = criar_video_wan(args.get("descricao_ideia"))
-                elif nome_funcao == "animar_foto_cliente":
-                    resultado = animar_foto_wan(args.get("url_imagem"), args.get("ideia_movimento"))
-                else:
-                    resultado = "Função desconhecida."
-            except Exception as e:
-                logger.error(f"Erro Tool {nome_funcao}: {e}")
-                resultado = f"Erro técnico: {str(e)}"
-
-            historico_conversas[From].append(msg_ia)
-            historico_conversas[From].append({
-                "role": "tool", "tool_call_id": tool_call.id,
-                "name": nome_funcao, "content": str(resultado)
-            })
-
-            resp_final = await asyncio.to_thread(
-                client.chat.completions.create,
-                model="llama-3.3-70b-versatile",
-                messages=historico_conversas[From]
+            # Todas as tools pedidas rodam juntas (ex: agenda de 3 barbeiros) -> uma só volta extra na IA
+            resultados = await asyncio.gather(*(
+                executar_tool_call(tool_call, cliente_saas, tipo_agenda, eh_admin, From)
+                for tool_call in msg_ia.tool_calls
+            ))
+            cronometro.marcar("tools")
+
+            historico.append(msg_ia.model_dump(exclude_none=True))
+            historico.extend(resultados)
+
+            resp_final = await client.chat.completions.create(
+                model=MODELO_LLM,
+                messages=historico,
+                timeout=LLM_TIMEOUT_S
             )
+            cronometro.marcar("llm_2", model=MODELO_LLM)
             texto_final = resp_final.choices[0].message.content
-            if not texto_final: texto_final = f"✅ Concluído:\n{str(resultado)}"
+            if not texto_final: texto_final = "✅ Concluído:\n" + "\n".join(r["content"] for r in resultados)
+            caminho = "llm_tools"
         else:
             texto_final = msg_ia.content
+            caminho = "llm"
 
-        historico_conversas[From].append({"role": "assistant", "content": texto_final})
-        
-        twilio_resp = MessagingResponse()
-        msg = twilio_resp.message(texto_final)
-        
-        url_pattern = r'(https?://[^\s]+(?:\.mp4|fal\.media|pexels)[^\s]*)'
-        urls_encontradas = re.findall(url_pattern, texto_final)
-        if urls_encontradas:
-            msg.media(urls_encontradas[0])
-
-        return Response(content=str(twilio_resp), media_type="application/xml")
+        historico.append({"role": "assistant", "content": texto_final})
+        conversas.salvar_historico(From, historico)
+        cronometro.marcar("salvar_historico")
+        return resposta_twiml(texto_final)
 
     except Exception as e:
         logger.error(f"ERRO CRÍTICO WHATSAPP: {e}", exc_info=True)
+        caminho = "erro"
         return Response(content=str(MessagingResponse().message("Erro interno.")), media_type="application/xml")
+    finally:
+        cronometro.marcar("twiml")
+        cronometro.publicar(metricas, tenant, caminho)
 
 if __name__ == "__main__":
     import uvicorn
-    print("🚀 Servidor Victor AI SAAS rodando na porta 8000...")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    if workers > 1 and os.getenv("CONVERSAS_BACKEND", "memoria").lower() == "memoria":
+        logger.warning("UVICORN_WORKERS > 1 com CONVERSAS_BACKEND=memoria: cada worker terá seu próprio histórico.")
+    print(f"🚀 Servidor Victor AI SAAS rodando na porta 8000 ({workers} worker(s))...")
+    # Com mais de um worker o uvicorn precisa importar o app pelo caminho ("main:app")
+    uvicorn.run("main:app" if workers > 1 else app, host="0.0.0.0", port=8000, workers=workers)
\ No newline at end of file
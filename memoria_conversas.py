@@ -0,0 +1,269 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger("MemoriaConversas")
+
+MAX_CONVERSAS = int(os.getenv("CONVERSAS_MAX", "10000"))
+MAX_BYTES = int(os.getenv("CONVERSAS_MAX_BYTES", str(64 * 1024 * 1024)))
+TTL_OCIOSO_S = float(os.getenv("CONVERSAS_TTL_S", str(6 * 3600)))
+MAX_MENSAGENS = 12
+
+
+def aparar_historico(historico, max_mensagens=MAX_MENSAGENS):
+    """Mantem o prompt de sistema + as ultimas mensagens, sem deixar um resultado de tool orfao no inicio."""
+    if len(historico) <= max_mensagens:
+        return historico
+    sistema = historico[:1] if historico and historico[0].get("role") == "system" else []
+    resto = historico[len(sistema):][-(max_mensagens - len(sistema)):]
+    while resto and resto[0].get("role") == "tool":
+        resto = resto[1:]
+    return sistema + resto
+
+
+def _tamanho(historico, modo):
+    return len(json.dumps(historico, ensure_ascii=False, default=str)) + len(modo or "")
+
+
+class MemoriaConversas:
+    """
+    Historico e modo (/barbeiro, /video) de cada numero, em memoria.
+
+    LRU com expiracao por inatividade (TTL) e teto global de entradas e de bytes aproximados
+    (tamanho do JSON do historico), para o processo nao crescer para sempre.
+    """
+
+    def __init__(self, max_conversas=MAX_CONVERSAS, max_bytes=MAX_BYTES, ttl_ocioso=TTL_OCIOSO_S):
+        self.max_conversas = max_conversas
+        self.max_bytes = max_bytes
+        self.ttl_ocioso = ttl_ocioso
+        self._lock = threading.Lock()
+        self._conversas = OrderedDict()
+        self._bytes = 0
+        self.expiradas = 0
+        self.despejadas = 0
+
+    def _entrada(self, numero):
+        """Retorna a entrada (tocando no LRU) ou None se nao existe/expirou. Chamar com o lock."""
+        self._expirar()
+        entrada = self._conversas.get(numero)
+        if entrada is not None:
+            entrada["acesso"] = time.monotonic()
+            self._conversas.move_to_end(numero)
+        return entrada
+
+    def _expirar(self):
+        limite = time.monotonic() - self.ttl_ocioso
+        while self._conversas:
+            numero, entrada = next(iter(self._conversas.items()))
+            if entrada["acesso"] > limite:
+                break
+            self._remover(numero)
+            self.expiradas += 1
+
+    def _remover(self, numero):
+        entrada = self._conversas.pop(numero)
+        self._bytes -= entrada["bytes"]
+
+    def _gravar(self, numero, historico, modo):
+        antiga = self._conversas.pop(numero, None)
+        if antiga is not None:
+            self._bytes -= antiga["bytes"]
+        tamanho = _tamanho(historico, modo)
+        self._conversas[numero] = {"historico": historico, "modo": modo, "bytes": tamanho, "acesso": time.monotonic()}
+        self._bytes += tamanho
+
+        while len(self._conversas) > self.max_conversas or (self._bytes > self.max_bytes and len(self._conversas) > 1):
+            mais_antigo = next(iter(self._conversas))
+            self._remover(mais_antigo)
+            self.despejadas += 1
+
+    # --- API usada pelo main.py ---
+
+    def obter_historico(self, numero):
+        with self._lock:
+            entrada = self._entrada(numero)
+            return list(entrada["historico"]) if entrada else []
+
+    def salvar_historico(self, numero, historico):
+        with self._lock:
+            entrada = self._entrada(numero)
+            modo = entrada["modo"] if entrada else None
+            self._gravar(numero, aparar_historico(historico), modo)
+
+    def obter_modo(self, numero, padrao="barbeiro"):
+        with self._lock:
+            entrada = self._entrada(numero)
+            return (entrada and entrada["modo"]) or padrao
+
+    def definir_modo(self, numero, modo):
+        with self._lock:
+            entrada = self._entrada(numero)
+            self._gravar(numero, entrada["historico"] if entrada else [], modo)
+
+    def estatisticas(self):
+        with self._lock:
+            self._expirar()
+            return {
+                "backend": "memoria",
+                "conversas": len(self._conversas),
+                "bytes_aproximados": self._bytes,
+                "expiradas": self.expiradas,
+                "despejadas": self.despejadas,
+                "max_conversas": self.max_conversas,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class ConversasSQLite:
+    """
+    Mesmo contrato da MemoriaConversas, mas em SQLite (WAL) no disco local: varios workers do
+    uvicorn na mesma maquina enxergam o mesmo historico.
+    """
+
+    def __init__(self, caminho="conversas.db", max_conversas=MAX_CONVERSAS, ttl_ocioso=TTL_OCIOSO_S):
+        self.max_conversas = max_conversas
+        self.ttl_ocioso = ttl_ocioso
+        self._lock = threading.Lock()
+        self._escritas = 0
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversas ("
+            "numero TEXT PRIMARY KEY, historico TEXT NOT NULL, modo TEXT, acesso REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversas_acesso ON conversas(acesso)")
+
+    def _ler(self, numero):
+        with self._lock:
+            linha = self._conn.execute(
+                "SELECT historico, modo FROM conversas WHERE numero = ? AND acesso > ?",
+                (numero, time.time() - self.ttl_ocioso),
+            ).fetchone()
+        if linha is None:
+            return [], None
+        return json.loads(linha[0]), linha[1]
+
+    def _gravar(self, sql, parametros):
+        """Um único INSERT ... ON CONFLICT: outro worker nunca grava entre a leitura e a escrita."""
+        with self._lock:
+            self._conn.execute(sql, parametros)
+            self._escritas += 1
+            if self._escritas % 100 == 0:
+                self._limpar()
+
+    def _limpar(self):
+        """Remove conversas ociosas e, se passar do teto, as mais antigas. Chamar com o lock."""
+        self._conn.execute("DELETE FROM conversas WHERE acesso <= ?", (time.time() - self.ttl_ocioso,))
+        self._conn.execute(
+            "DELETE FROM conversas WHERE numero IN ("
+            "SELECT numero FROM conversas ORDER BY acesso DESC LIMIT -1 OFFSET ?)",
+            (self.max_conversas,),
+        )
+
+    def obter_historico(self, numero):
+        return self._ler(numero)[0]
+
+    def salvar_historico(self, numero, historico):
+        # Só a coluna historico muda; o modo de uma conversa expirada não sobrevive
+        agora = time.time()
+        self._gravar(
+            "INSERT INTO conversas (numero, historico, modo, acesso) VALUES (?, ?, NULL, ?) "
+            "ON CONFLICT(numero) DO UPDATE SET historico = excluded.historico, acesso = excluded.acesso, "
+            "modo = CASE WHEN conversas.acesso > ? THEN conversas.modo END",
+            (numero, json.dumps(aparar_historico(historico), ensure_ascii=False, default=str), agora, agora - self.ttl_ocioso),
+        )
+
+    def obter_modo(self, numero, padrao="barbeiro"):
+        return self._ler(numero)[1] or padrao
+
+    def definir_modo(self, numero, modo):
+        agora = time.time()
+        self._gravar(
+            "INSERT INTO conversas (numero, historico, modo, acesso) VALUES (?, '[]', ?, ?) "
+            "ON CONFLICT(numero) DO UPDATE SET modo = excluded.modo, acesso = excluded.acesso, "
+            "historico = CASE WHEN conversas.acesso > ? THEN conversas.historico ELSE '[]' END",
+            (numero, modo, agora, agora - self.ttl_ocioso),
+        )
+
+    def estatisticas(self):
+        with self._lock:
+            self._limpar()
+            total, tamanho = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(historico)), 0) FROM conversas").fetchone()
+        return {"backend": "sqlite", "conversas": total, "bytes_aproximados": tamanho, "max_conversas": self.max_conversas}
+
+
+class ConversasRedis:
+    """
+    Mesmo contrato, num hash por número (campos historico e modo) em qualquer cliente com a
+    interface do redis-py para hmget, hset(mapping=...), expire e pipeline - redis-py, fakeredis
+    ou o RedisFake de servidores_fake.py.
+    Cada escrita é um MULTI (HSET do campo + EXPIRE): salvar_historico não apaga o modo que
+    outro worker acabou de definir, e vice-versa.
+    O TTL de inatividade vira o EXPIRE da chave; o teto de memoria fica com a politica do servidor
+    (ex: maxmemory-policy allkeys-lru).
+    """
+
+    # Hash; as chaves antigas ("conversa:", um JSON só) expiram sozinhas pelo TTL
+    PREFIXO = "conversa:h:"
+
+    def __init__(self, cliente, ttl_ocioso=TTL_OCIOSO_S):
+        self.cliente = cliente
+        self.ttl_ocioso = int(ttl_ocioso)
+        self.leituras = 0
+        self.escritas = 0
+
+    def _ler(self, numero):
+        self.leituras += 1
+        historico, modo = self.cliente.hmget(self.PREFIXO + numero, ["historico", "modo"])
+        if isinstance(modo, bytes):
+            modo = modo.decode("utf-8")
+        return (json.loads(historico) if historico else []), (modo or None)
+
+    def _gravar(self, numero, campos):
+        self.escritas += 1
+        chave = self.PREFIXO + numero
+        transacao = self.cliente.pipeline(transaction=True)
+        transacao.hset(chave, mapping=campos)
+        transacao.expire(chave, self.ttl_ocioso)
+        transacao.execute()
+
+    def obter_historico(self, numero):
+        return self._ler(numero)[0]
+
+    def salvar_historico(self, numero, historico):
+        self._gravar(numero, {"historico": json.dumps(aparar_historico(historico), ensure_ascii=False, default=str)})
+
+    def obter_modo(self, numero, padrao="barbeiro"):
+        return self._ler(numero)[1] or padrao
+
+    def definir_modo(self, numero, modo):
+        self._gravar(numero, {"modo": modo or ""})
+
+    def estatisticas(self):
+        return {"backend": "redis", "leituras": self.leituras, "escritas": self.escritas}
+
+
+def criar_memoria_conversas():
+    """
+    Escolhe o backend pelo CONVERSAS_BACKEND:
+    - "memoria" (padrao): so serve com 1 worker do uvicorn
+    - "sqlite": arquivo CONVERSAS_ARQUIVO (padrao conversas.db), compartilhado entre workers da maquina
+    - "redis": REDIS_URL, compartilhado entre maquinas (REDIS_BACKEND=fake usa o RedisFake
+      de servidores_fake.py, em processo)
+    """
+    backend = os.getenv("CONVERSAS_BACKEND", "memoria").lower()
+    if backend == "sqlite":
+        return ConversasSQLite(os.getenv("CONVERSAS_ARQUIVO", "conversas.db"))
+    if backend == "redis" and os.getenv("REDIS_BACKEND", "").lower() == "fake":
+        from servidores_fake import RedisFake
+        return ConversasRedis(RedisFake())
+    if backend == "redis":
+        import redis  # dependencia opcional, so para quem usa esse backend
+        return ConversasRedis(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    return MemoriaConversas()
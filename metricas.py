@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Limites (segundos) dos buckets dos histogramas
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Barbearias com série própria; as que chegarem depois entram como tenant="outros"
+# (cada tenant multiplica as séries de cada histograma)
+METRICAS_MAX_TENANTS = int(os.getenv("METRICAS_MAX_TENANTS", "500"))
+
+DESCRICOES = {
+    "whatsapp_turno_segundos": "Duração total de uma mensagem do WhatsApp, por caminho (rapido, llm, llm_tools, erro).",
+    "whatsapp_etapa_segundos": "Duração de cada etapa do reply_whatsapp.",
+    "tool_segundos": "Duração de cada tool pedida pela IA, com o status (ok, lenta, timeout, erro).",
+    "chamada_externa_segundos": "Chamadas a serviços externos (google, fal, stripe, groq).",
+    "executor_espera_segundos": "Tempo na fila do executor da dependência antes de começar a rodar.",
+    "executor_execucao_segundos": "Tempo rodando no executor da dependência (google, fal, storage), por função.",
+}
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histograma:
+    """Contagens por bucket, soma e total de uma combinação de rótulos."""
+
+    __slots__ = ("buckets", "soma", "total")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.buckets[bisect_left(BUCKETS, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class Metricas:
+    """
+    Registro de histogramas em memória, exportado no formato texto do Prometheus (/metrics).
+    observar() custa um bisect e um dict sob lock. Cada worker do uvicorn tem o seu registro
+    (o Prometheus raspa cada worker, ou soma por instância).
+    """
+
+    def __init__(self, max_tenants=METRICAS_MAX_TENANTS):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._tenants = set()
+        self.max_tenants = max_tenants
+
+    def _tenant(self, tenant):
+        if tenant in self._tenants:
+            return tenant
+        if len(self._tenants) < self.max_tenants:
+            self._tenants.add(tenant)
+            return tenant
+        return "outros"
+
+    def observar(self, nome, segundos, **rotulos):
+        with self._lock:
+            if "tenant" in rotulos:
+                rotulos["tenant"] = self._tenant(rotulos["tenant"] or "demo")
+            chave = (nome, tuple(sorted(rotulos.items())))
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = Histograma()
+            serie.observar(segundos)
+
+    @contextmanager
+    def medir(self, nome, **rotulos):
+        """with metricas.medir("chamada_externa_segundos", servico="stripe", operacao="checkout"): ..."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus."""
+        with self._lock:
+            series = sorted(
+                ((nome, rotulos, list(h.buckets), h.soma, h.total) for (nome, rotulos), h in self._series.items()),
+                key=lambda s: (s[0], s[1]),
+            )
+
+        linhas = []
+        atual = None
+        for nome, rotulos, buckets, soma, total in series:
+            if nome != atual:
+                atual = nome
+                linhas.append(f"# HELP {nome} {DESCRICOES.get(nome, nome)}")
+                linhas.append(f"# TYPE {nome} histogram")
+            base = ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in rotulos)
+            prefixo = base + "," if base else ""
+            acumulado = 0
+            for limite, quantidade in zip(BUCKETS, buckets):
+                acumulado += quantidade
+                linhas.append(f'{nome}_bucket{{{prefixo}le="{limite}"}} {acumulado}')
+            linhas.append(f'{nome}_bucket{{{prefixo}le="+Inf"}} {total}')
+            sufixo = f"{{{base}}}" if base else ""
+            linhas.append(f"{nome}_sum{sufixo} {soma}")
+            linhas.append(f"{nome}_count{sufixo} {total}")
+        return "\n".join(linhas) + "\n"
+
+
+class Cronometro:
+    """
+    Spans em sequência de um turno: marcar("etapa") fecha a etapa que começou na marca anterior.
+    No fim, publicar() manda tudo de uma vez, já com o tenant (que só se conhece no meio do turno).
+    """
+
+    def __init__(self):
+        self.inicio = self._ultima = time.perf_counter()
+        self.etapas = []
+
+    def marcar(self, etapa, model=""):
+        agora = time.perf_counter()
+        self.etapas.append((etapa, agora - self._ultima, model))
+        self._ultima = agora
+
+    def publicar(self, registro, tenant, caminho):
+        for etapa, duracao, model in self.etapas:
+            registro.observar("whatsapp_etapa_segundos", duracao, etapa=etapa, tenant=tenant, model=model)
+        registro.observar("whatsapp_turno_segundos", time.perf_counter() - self.inicio, tenant=tenant, caminho=caminho)
+
+
+metricas = Metricas()
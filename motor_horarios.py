@@ -0,0 +1,206 @@
+import datetime
+import logging
+
+from indice_intervalos import para_minutos, de_minutos, SAO_PAULO_TZ
+from gerenciador_clientes import HORARIOS_PADRAO
+from gerenciador_precos import carregar_precos, obter_duracao
+from roteador_intencoes import normalizar
+
+logger = logging.getLogger("MotorHorarios")
+
+# Granularidade da grade de horarios (minutos). 15 min -> 96 slots por dia, cabe num int.
+SLOT_MINUTOS = 15
+SLOTS_POR_DIA = 24 * 60 // SLOT_MINUTOS
+DIAS_BUSCA_PADRAO = 14
+LIMITE_PADRAO = 10
+
+_NOMES_DIAS = ["seg", "ter", "qua", "qui", "sex", "sáb", "dom"]
+
+
+def _hhmm_para_slot(hhmm, arredondar_para_cima=False):
+    horas, minutos = str(hhmm).split(":")[:2]
+    total = int(horas) * 60 + int(minutos)
+    if arredondar_para_cima:
+        return -(-total // SLOT_MINUTOS)
+    return total // SLOT_MINUTOS
+
+
+def mascara_expediente(horarios, dia_semana):
+    """
+    Bitmap dos slots abertos num dia da semana (0 = segunda, como datetime.weekday()).
+    Aceita o formato de config.horarios_atendimento: {"padrao": {...}, "dias": {"0": {"inicio", "fim"}}}.
+    Dia ausente usa o "padrao"; dia com null ou {"fechado": true} nao abre.
+    """
+    dias = (horarios or {}).get("dias", {})
+    if str(dia_semana) in dias:
+        faixa = dias[str(dia_semana)]
+    else:
+        faixa = (horarios or {}).get("padrao")
+    if not faixa or faixa.get("fechado"):
+        return 0
+
+    inicio = _hhmm_para_slot(faixa.get("inicio", "09:00"), arredondar_para_cima=True)
+    fim = _hhmm_para_slot(faixa.get("fim", "19:00"))
+    if fim <= inicio:
+        return 0
+    return ((1 << (fim - inicio)) - 1) << inicio
+
+
+def mascara_ocupada(intervalos, minuto_base, total_slots):
+    """Bitmap dos intervalos ocupados: bit i = slot i a partir de minuto_base, cortado em total_slots."""
+    mascara = 0
+    for inicio, fim in intervalos:
+        primeiro = (inicio - minuto_base) // SLOT_MINUTOS
+        ultimo = -(-(fim - minuto_base) // SLOT_MINUTOS)
+        if primeiro < 0:
+            primeiro = 0
+        if ultimo > total_slots:
+            ultimo = total_slots
+        if ultimo > primeiro:
+            mascara |= ((1 << (ultimo - primeiro)) - 1) << primeiro
+    return mascara
+
+
+def _inicios_possiveis(livre, slots_servico):
+    """Bit i ligado se os slots i..i+n-1 estao todos livres."""
+    resultado = livre
+    for deslocamento in range(1, slots_servico):
+        resultado &= livre >> deslocamento
+    return resultado
+
+
+def agora_sao_paulo():
+    return datetime.datetime.now(SAO_PAULO_TZ).replace(tzinfo=None)
+
+
+def proximos_horarios_livres(horarios, ocupados, barbeiros, duracao, inicio=None, dias=DIAS_BUSCA_PADRAO, limite=LIMITE_PADRAO):
+    """
+    Proximos `limite` horarios de inicio livres para um servico de `duracao` minutos.
+
+    - horarios: config.horarios_atendimento da barbearia
+    - ocupados: {barbeiro: [(inicio, fim), ...]} em minutos (indice_intervalos.para_minutos), ja
+      restritos a janela consultada. Serve tanto a agenda interna quanto os intervalos do Google.
+    - barbeiros: nomes considerados (a equipe toda ou so um)
+    Retorna [{"barbeiro": nome, "inicio": "AAAA-MM-DDTHH:MM:SS"}] em ordem cronologica.
+    """
+    inicio = inicio or agora_sao_paulo()
+    primeiro_dia = inicio.replace(hour=0, minute=0, second=0, microsecond=0)
+    minuto_agora = para_minutos(inicio)
+    slots_servico = max(1, -(-int(duracao) // SLOT_MINUTOS))
+
+    # Percorre os intervalos (ordenados) so ate o dia que estiver sendo olhado: com `limite`
+    # pequeno normalmente so o primeiro ou segundo dia e montado.
+    minuto_base = para_minutos(primeiro_dia)
+    fila = {b: sorted(ocupados.get(b, ())) for b in barbeiros}
+    posicao = dict.fromkeys(barbeiros, 0)
+    pendentes = {b: [] for b in barbeiros}
+    expedientes = {}
+
+    livres = []
+    for d in range(dias):
+        dia = primeiro_dia + datetime.timedelta(days=d)
+        semana = dia.weekday()
+        if semana not in expedientes:
+            expedientes[semana] = mascara_expediente(horarios, semana)
+        expediente = expedientes[semana]
+        if not expediente:
+            continue
+        minuto_dia = minuto_base + d * 24 * 60
+
+        # Nao oferece horario que ja passou hoje
+        if minuto_agora > minuto_dia:
+            slot_atual = -(-(minuto_agora - minuto_dia) // SLOT_MINUTOS)
+            expediente &= ~((1 << slot_atual) - 1)
+
+        do_dia = []
+        for barbeiro in barbeiros:
+            fim_dia = minuto_dia + 24 * 60
+            lista, i = fila[barbeiro], posicao[barbeiro]
+            do_barbeiro = [iv for iv in pendentes[barbeiro] if iv[1] > minuto_dia]
+            while i < len(lista) and lista[i][0] < fim_dia:
+                do_barbeiro.append(lista[i])
+                i += 1
+            posicao[barbeiro] = i
+            pendentes[barbeiro] = [iv for iv in do_barbeiro if iv[1] > fim_dia]
+
+            livre = expediente & ~mascara_ocupada(do_barbeiro, minuto_dia, SLOTS_POR_DIA)
+            # O servico inteiro precisa caber antes do fim do expediente
+            possiveis = _inicios_possiveis(livre, slots_servico)
+            encontrados = 0
+            while possiveis and encontrados < limite:
+                slot = (possiveis & -possiveis).bit_length() - 1
+                do_dia.append((slot, barbeiro))
+                possiveis &= possiveis - 1
+                encontrados += 1
+
+        do_dia.sort()
+        for slot, barbeiro in do_dia:
+            horario = de_minutos(minuto_dia + slot * SLOT_MINUTOS)
+            livres.append({"barbeiro": barbeiro, "inicio": horario.strftime("%Y-%m-%dT%H:%M:%S")})
+            if len(livres) >= limite:
+                return livres
+    return livres
+
+
+def formatar_horarios_livres(livres, servico, duracao):
+    """Texto curto para a IA: um dia por linha, horarios agrupados por barbeiro."""
+    if not livres:
+        return f"Nenhum horário livre para {servico} ({duracao} min) no período consultado."
+
+    linhas = {}
+    for item in livres:
+        dt = datetime.datetime.fromisoformat(item["inicio"])
+        chave = (dt.date(), item["barbeiro"])
+        linhas.setdefault(chave, []).append(dt.strftime("%H:%M"))
+
+    texto = f"Horários livres para {servico} ({duracao} min):\n"
+    for (data, barbeiro), horas in linhas.items():
+        texto += f"- {data.strftime('%d/%m/%Y')} ({_NOMES_DIAS[data.weekday()]}) {barbeiro}: {', '.join(horas)}\n"
+    return texto
+
+
+def escolher_barbeiros(equipe, nome_barbeiro):
+    """
+    Nomes da equipe pedidos em `nome_barbeiro`, sem diferenciar maiúsculas nem acentos.
+    Nome igual ganha; só sem nenhum igual vale o nome contido no pedido como palavra inteira
+    ("com o João" -> "João"), para "Mariana" não trazer também a "Ana".
+    """
+    pedido = normalizar(nome_barbeiro).casefold()
+    normalizados = [(nome, normalizar(nome).casefold()) for nome in equipe]
+    exatos = [nome for nome, normal in normalizados if normal == pedido]
+    return exatos or [nome for nome, normal in normalizados if normal and f" {normal} " in f" {pedido} "]
+
+
+def consultar_horarios_livres(cliente, buscar_ocupados, nome_barbeiro=None, servico=None, data=None, limite=LIMITE_PADRAO):
+    """
+    Resposta pronta da tool `verificar_agenda`.
+
+    buscar_ocupados(barbeiros, inicio, fim) -> {barbeiro: [(inicio, fim)]} e a fonte dos horarios
+    ocupados (diario interno ou Google), sempre em minutos de indice_intervalos.
+    """
+    equipe = [m["nome"] for m in (cliente or {}).get("equipe", [])] or ["Principal"]
+    barbeiros = equipe
+    if nome_barbeiro:
+        barbeiros = escolher_barbeiros(equipe, nome_barbeiro) or equipe
+
+    config = (cliente or {}).get("config", {})
+    horarios = config.get("horarios_atendimento") or HORARIOS_PADRAO
+    precos = cliente.get("precos", {}) if cliente else carregar_precos()
+    duracao = obter_duracao(precos, servico)
+
+    agora = agora_sao_paulo()
+    inicio, dias = agora, DIAS_BUSCA_PADRAO
+    if data:
+        try:
+            dia = datetime.datetime.fromisoformat(str(data)[:10])
+            inicio, dias = max(agora, dia), 1
+            if dia.date() < agora.date():
+                return f"A data {data} já passou."
+        except ValueError:
+            logger.warning(f"Data invalida em verificar_agenda: {data}")
+
+    primeiro_minuto = para_minutos(inicio.replace(hour=0, minute=0, second=0, microsecond=0))
+    ocupados = buscar_ocupados(barbeiros, primeiro_minuto, primeiro_minuto + dias * 24 * 60)
+
+    livres = proximos_horarios_livres(horarios, ocupados, barbeiros, duracao, inicio=inicio, dias=dias, limite=limite * len(barbeiros))
+    return formatar_horarios_livres(livres, servico or "atendimento", duracao)
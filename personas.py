@@ -1,27 +1,37 @@
-﻿from datetime import datetime
+﻿import time
+from collections import OrderedDict
+from datetime import datetime
 import pytz
 
+# Fuso criado uma vez so (pytz.timezone a cada mensagem custava caro)
+try:
+    TZ_SAO_PAULO = pytz.timezone("America/Sao_Paulo")
+except Exception:
+    TZ_SAO_PAULO = None
+
+# Suba quando mudar o texto de PROMPT_BARBEARIA: invalida os prompts ja montados
+PERSONA_VERSAO = 2
+MAX_PROMPTS_CACHE = 5000
+
 def get_current_time_str():
-    try:
-        tz = pytz.timezone("America/Sao_Paulo")
-        agora = datetime.now(tz)
-    except Exception:
-        agora = datetime.now()
+    agora = datetime.now(TZ_SAO_PAULO) if TZ_SAO_PAULO else datetime.now()
     return agora.strftime("%d/%m/%Y, %A-feira, Hora atual: %H:%M")
 
-def get_system_prompt():
-    tempo_atual = get_current_time_str()
-
+def get_contexto_temporal():
     return f"""
-    [DIRETRIZ MESTRA]
-    Voce e o VICTOR, gerente virtual de uma Barbearia Inteligente.
-    SUA MISSAO: Converter conversas em agendamentos confirmados.
-
     [CONTEXTO TEMPORAL CRITICO]
-    HOJE E EXATAMENTE: {tempo_atual}.
+    HOJE E EXATAMENTE: {get_current_time_str()}.
     - Se o cliente disser "amanha", calcule a data baseada em HOJE.
     - Se o cliente disser "quarta-feira", use a proxima quarta.
     - O ano atual e {datetime.now().year}. Nao agende para anos anteriores.
+    """
+
+# Parte fixa da persona. Fica SEMPRE no inicio e byte a byte igual para todas as barbearias,
+# assim o cache de prompt do provedor reaproveita o prefixo; o que muda vem depois.
+PROMPT_BARBEARIA = """
+    [DIRETRIZ MESTRA]
+    Voce e o VICTOR, gerente virtual de uma Barbearia Inteligente.
+    SUA MISSAO: Converter conversas em agendamentos confirmados.
 
     [SUA PERSONALIDADE]
     - Tom de voz: Urbano, brother, educado e agil. Use girias leves ("Mestre", "Tranquilo", "Chefia").
@@ -56,9 +66,62 @@ def get_system_prompt():
     - Nao responda sobre politica, receitas ou codigos de programacao.
     """
 
+def get_system_prompt():
+    return f"{PROMPT_BARBEARIA}{get_contexto_temporal()}"
+
 def system_prompt():
     return get_system_prompt()
 
+# --- PROMPT POR BARBEARIA (cache) ---
+
+_prompts = OrderedDict()
+
+def _contexto_barbearia(cliente, gerar_tabela=None):
+    if cliente:
+        config = cliente.get("config", {})
+        nome_barbearia = config.get("nome_barbearia", "Barbearia")
+        nomes_equipe = ", ".join(m["nome"] for m in cliente.get("equipe", []))
+        tabela = f"TABELA {nome_barbearia.upper()}:\n"
+        for servico, valor in cliente.get("precos", {}).items():
+            if isinstance(valor, dict):
+                tabela += f"- {servico}: R$ {float(valor.get('preco', 0)):.2f} ({int(valor.get('duracao', 30))} min)\n"
+            else:
+                tabela += f"- {servico}: R$ {float(valor):.2f}\n"
+        nome_bot = config.get("nome_bot", "Assistente")
+        tipo_agenda = config.get("tipo_agenda", "interna")
+    else:
+        nome_bot, nome_barbearia, nomes_equipe, tipo_agenda = "Victor AI", "Barbearia Modelo", "Principal", "interna"
+        tabela = gerar_tabela() if gerar_tabela else ""
+
+    return (
+        "[DADOS ATUAIS]\n"
+        f"- Nome do bot: {nome_bot}\n"
+        f"- Barbearia: {nome_barbearia}\n"
+        f"- Profissionais: {nomes_equipe}\n"
+        f"- Tipo de agenda: {tipo_agenda}\n"
+        f"{tabela}"
+    )
+
+def montar_prompt_barbearia(chave_cliente, versao_cliente, cliente=None, gerar_tabela=None):
+    """
+    Prompt completo do modo barbeiro: persona fixa + dados da barbearia + horario atual.
+    Fica em cache por (versao do cadastro, PERSONA_VERSAO, minuto atual): alterar precos/equipe
+    sobe a versao do cliente e o proximo pedido monta de novo.
+    Sem cliente (modo demo), `gerar_tabela` so e chamado quando o prompt precisa ser remontado.
+    """
+    chave = (versao_cliente, PERSONA_VERSAO, int(time.time() // 60))
+    guardado = _prompts.get(chave_cliente)
+    if guardado is not None and guardado[0] == chave:
+        _prompts.move_to_end(chave_cliente)
+        return guardado[1]
+
+    texto = f"{PROMPT_BARBEARIA}\n{_contexto_barbearia(cliente, gerar_tabela)}{get_contexto_temporal()}"
+    _prompts[chave_cliente] = (chave, texto)
+    _prompts.move_to_end(chave_cliente)
+    while len(_prompts) > MAX_PROMPTS_CACHE:
+        _prompts.popitem(last=False)
+    return texto
+
 def get_director_prompt():
     return """
     [DIRETRIZ MESTRA]
@@ -73,6 +136,10 @@ def get_director_prompt():
     2. MODO ANIMACAO (Imagem -> Video):
        - Ao receber [IMAGEM RECEBIDA: caminho], chame `animar_foto_cliente`.
 
+    3. ACOMPANHAMENTO:
+       - Os videos vao para uma fila e o link chega sozinho quando fica pronto.
+       - Se perguntarem pelo video, chame `status_video`.
+
     [PERSONALIDADE]
     - Profissional, curto, minimalista.
 
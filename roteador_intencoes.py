@@ -0,0 +1,166 @@
+import re
+import threading
+import time
+import unicodedata
+import logging
+
+from gerenciador_clientes import HORARIOS_PADRAO
+from gerenciador_precos import carregar_precos
+
+logger = logging.getLogger("RoteadorIntencoes")
+
+# Confianca minima para aceitar a resposta de um classificador local opcional
+LIMIAR_CLASSIFICADOR = 0.85
+# Mensagens maiores que isso quase sempre pedem mais de uma coisa: vao para a IA
+MAX_CARACTERES = 90
+
+_DIAS = ["segunda", "terça", "quarta", "quinta", "sexta", "sábado", "domingo"]
+
+_RE_PRECO = re.compile(r"\b(quanto (custa|fica|e|sai|ta|esta)|qual (o |e o )?(valor|preco)|preco|precos|valor|valores|tabela)\b")
+_RE_HORARIO = re.compile(
+    r"\b(que horas? (voces )?(abre|abrem|fecha|fecham|funciona|funcionam)|"
+    r"horario de (funcionamento|atendimento)|qual (o )?horario (voces )?(abre|abrem|fecha|fecham|funciona|funcionam)|"
+    r"(abre|abrem|fecha|fecham|funciona|funcionam) (que|ate que) horas?)\b"
+)
+# Qualquer sinal de agendamento/data vai para a IA, que tem as tools de agenda
+_RE_AGENDA = re.compile(r"\b(agend\w*|marca\w*|vaga|livre|disponivel|amanha|hoje|depois|semana|dia \d|\d{1,2}/\d{1,2}|\d{1,2}h)\b")
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", re.sub(r"[^\w/ ]", " ", texto)).strip()
+
+
+def _formatar_preco(nome, valor):
+    # Vírgula decimal só no número: o nome do serviço pode ter ponto ("corte 2.0")
+    if isinstance(valor, dict):
+        preco, duracao = float(valor.get("preco", 0)), int(valor.get("duracao", 30))
+        return f"{nome.capitalize()}: R$ {f'{preco:.2f}'.replace('.', ',')} ({duracao} min)"
+    return f"{nome.capitalize()}: R$ {f'{float(valor):.2f}'.replace('.', ',')}"
+
+
+def _texto_horarios(horarios):
+    """Agrupa dias consecutivos com o mesmo expediente: 'segunda a sexta: 09:00 às 19:00'."""
+    dias = (horarios or {}).get("dias", {})
+    padrao = (horarios or {}).get("padrao")
+    faixas = []
+    for i in range(7):
+        faixa = dias.get(str(i), padrao)
+        if not faixa or faixa.get("fechado"):
+            faixas.append("fechado")
+        else:
+            faixas.append(f"{faixa.get('inicio', '09:00')} às {faixa.get('fim', '19:00')}")
+
+    grupos = []
+    inicio = 0
+    for i in range(1, 8):
+        if i == 7 or faixas[i] != faixas[inicio]:
+            nome = _DIAS[inicio] if i - 1 == inicio else f"{_DIAS[inicio]} a {_DIAS[i - 1]}"
+            grupos.append(f"{nome}: {faixas[inicio]}")
+            inicio = i
+    return "\n".join(f"- {g}" for g in grupos)
+
+
+class RoteadorIntencoes:
+    """
+    Responde sem chamar a IA as perguntas que os dados da barbearia respondem exatamente
+    (preco de um servico, tabela, horario de funcionamento, /barbeiro sem texto).
+    Na duvida devolve None e a mensagem segue para o LLM.
+    """
+
+    def __init__(self, classificador=None):
+        self.classificador = classificador
+        self._lock = threading.Lock()
+        self.mensagens = 0
+        self.respondidas = {}
+        self.latencia_llm_media = None
+        self.tempo_local_total = 0.0
+
+    def registrar_classificador(self, classificador):
+        """classificador(texto_normalizado) -> (intencao, confianca); intencoes: preco, horario."""
+        self.classificador = classificador
+
+    def registrar_latencia_llm(self, segundos):
+        """Media movel da latencia de uma chamada ao LLM, usada para estimar o tempo economizado."""
+        with self._lock:
+            if self.latencia_llm_media is None:
+                self.latencia_llm_media = segundos
+            else:
+                self.latencia_llm_media = 0.9 * self.latencia_llm_media + 0.1 * segundos
+
+    def _intencao(self, texto):
+        if not texto:
+            return "saudacao"
+        if len(texto) > MAX_CARACTERES or _RE_AGENDA.search(texto):
+            return None
+        if _RE_HORARIO.search(texto):
+            return "horario"
+        if _RE_PRECO.search(texto):
+            return "preco"
+        if self.classificador:
+            try:
+                intencao, confianca = self.classificador(texto)
+                if confianca >= LIMIAR_CLASSIFICADOR and intencao in ("preco", "horario"):
+                    return intencao
+            except Exception as e:
+                logger.error(f"Erro no classificador local: {e}")
+        return None
+
+    def _responder_preco(self, texto, cliente):
+        precos = cliente.get("precos", {}) if cliente else carregar_precos()
+        if not precos:
+            return None
+        citados = [nome for nome in precos if re.search(rf"\b{re.escape(normalizar(nome))}s?\b", texto)]
+        if len(citados) == 1:
+            return f"💈 {_formatar_preco(citados[0], precos[citados[0]])}"
+        if citados:
+            return "💈 " + "\n".join(_formatar_preco(nome, precos[nome]) for nome in citados)
+        if re.search(r"\b(precos|valores|tabela)\b", texto):
+            return "💈 Nossa tabela:\n" + "\n".join(_formatar_preco(nome, valor) for nome, valor in precos.items())
+        # Perguntou preco de algo que nao esta na tabela: deixa a IA conversar
+        return None
+
+    def _responder_horario(self, cliente):
+        horarios = (cliente or {}).get("config", {}).get("horarios_atendimento") or HORARIOS_PADRAO
+        return f"🕘 Nosso horário de atendimento:\n{_texto_horarios(horarios)}"
+
+    def responder(self, mensagem, cliente=None):
+        """Retorna o texto da resposta rapida ou None para seguir para a IA."""
+        inicio = time.perf_counter()
+        texto = normalizar(mensagem)
+        intencao = self._intencao(texto)
+
+        resposta = None
+        if intencao == "saudacao":
+            nome_bot = (cliente or {}).get("config", {}).get("nome_bot", "Victor")
+            resposta = f"Fala, chefia! Aqui é o {nome_bot} 💈 Quer ver preços ou marcar um horário?"
+        elif intencao == "preco":
+            resposta = self._responder_preco(texto, cliente)
+        elif intencao == "horario":
+            resposta = self._responder_horario(cliente)
+
+        with self._lock:
+            self.mensagens += 1
+            if resposta is not None:
+                self.respondidas[intencao] = self.respondidas.get(intencao, 0) + 1
+                self.tempo_local_total += time.perf_counter() - inicio
+        return resposta
+
+    def estatisticas(self):
+        with self._lock:
+            total_rapidas = sum(self.respondidas.values())
+            economia = None
+            if self.latencia_llm_media is not None:
+                economia = round(total_rapidas * self.latencia_llm_media - self.tempo_local_total, 3)
+            return {
+                "mensagens": self.mensagens,
+                "respostas_rapidas": total_rapidas,
+                "taxa_caminho_rapido": round(total_rapidas / self.mensagens, 4) if self.mensagens else 0.0,
+                "por_intencao": dict(self.respondidas),
+                "latencia_llm_media_s": round(self.latencia_llm_media, 3) if self.latencia_llm_media else None,
+                "tempo_economizado_estimado_s": economia,
+            }
+
+
+roteador = RoteadorIntencoes()
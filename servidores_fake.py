@@ -0,0 +1,315 @@
+"""
+Servidores falsos para benchmark/teste local, sem gastar cota das APIs reais.
+
+Uso:
+    python servidores_fake.py groq --porta 9001 --latencia-ms 400
+
+O fal (vídeo) tem um stand-in em processo, FalFake, com a mesma interface do fal_client:
+    FAL_BACKEND=fake FAL_LATENCIA_MS=2000 python main.py
+
+O Google Calendar também, GoogleFake (events.list/insert com syncToken e freebusy.query):
+    GOOGLE_BACKEND=fake GOOGLE_LATENCIA_MS=150 python main.py
+
+O Redis das conversas também, RedisFake (hash com TTL e MULTI/EXEC, a parte usada por ConversasRedis):
+    CONVERSAS_BACKEND=redis REDIS_BACKEND=fake python main.py
+
+O Groq falso segue um roteiro simples quando o pedido traz tools: "horário ... AAAA-MM-DD" chama
+verificar_agenda, "agendar/marcar ... AAAA-MM-DD HH:MM" chama agendar_servico, e depois do
+resultado de uma tool responde com um resumo dele (ver benchmark_carga.py).
+
+Depois aponte o bot para ele:
+    GROQ_BASE_URL=http://127.0.0.1:9001/v1 GROQ_API_KEY=fake python main.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+
+LATENCIA_MS = float(os.getenv("FAKE_LATENCIA_MS", "300"))
+
+_RE_DATA = re.compile(r"(\d{4}-\d{2}-\d{2})")
+_RE_DATA_HORA = re.compile(r"(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2})")
+_RE_NOME = re.compile(r"\bsou (?:o |a )?(\w+)", re.IGNORECASE)
+_RE_SERVICO = re.compile(r"\b(corte|barba|combo|sobrancelha)\b", re.IGNORECASE)
+
+
+# ==========================================
+# GROQ / OPENAI (chat.completions)
+# ==========================================
+
+def _tool_call(nome, argumentos):
+    return {
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": nome, "arguments": json.dumps(argumentos, ensure_ascii=False)},
+    }
+
+
+def _mensagem_roteirizada(mensagens, tools):
+    """Mensagem do assistente para o roteiro de agendamento (texto ou tool_calls)."""
+    ultima = mensagens[-1] if mensagens else {}
+    if ultima.get("role") == "tool":
+        return {"role": "assistant", "content": f"Pronto! {str(ultima.get('content', ''))[:200]}"}
+
+    texto = str(ultima.get("content", ""))
+    disponiveis = {t.get("function", {}).get("name") for t in tools or []}
+    servico = _RE_SERVICO.search(texto)
+    servico = servico.group(1).lower() if servico else "corte"
+
+    data_hora = _RE_DATA_HORA.search(texto)
+    if data_hora and "agendar_servico" in disponiveis and re.search(r"\b(agend|marc)", texto, re.IGNORECASE):
+        nome = _RE_NOME.search(texto)
+        return {"role": "assistant", "content": None, "tool_calls": [_tool_call("agendar_servico", {
+            "data_hora": f"{data_hora.group(1)}T{data_hora.group(2)}:00",
+            "nome_cliente": nome.group(1) if nome else "Cliente",
+            "nome_barbeiro": "Principal",
+            "servico": servico,
+        })]}
+
+    data = _RE_DATA.search(texto)
+    if data and "verificar_agenda" in disponiveis and re.search(r"hor[aá]rio", texto, re.IGNORECASE):
+        return {"role": "assistant", "content": None, "tool_calls": [_tool_call("verificar_agenda", {
+            "data": data.group(1), "servico": servico,
+        })]}
+
+    return {"role": "assistant", "content": f"Resposta simulada para: {texto[:80]}"}
+
+
+def criar_app_groq(latencia_ms=LATENCIA_MS):
+    app = FastAPI(title="Fake Groq")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        corpo = await request.json()
+        await asyncio.sleep(latencia_ms / 1000)
+
+        mensagem = _mensagem_roteirizada(corpo.get("messages", []), corpo.get("tools"))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": corpo.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": mensagem,
+                "finish_reason": "tool_calls" if mensagem.get("tool_calls") else "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    return app
+
+
+# ==========================================
+# FAL (Wan 2.1) - em processo
+# ==========================================
+
+class _HandlerFalFake:
+    def __init__(self, fal, app, arguments):
+        self.fal = fal
+        self.app = app
+        self.arguments = arguments
+        self.request_id = uuid.uuid4().hex
+
+    def get(self):
+        time.sleep(self.fal.latencia_s)
+        with self.fal._lock:
+            self.fal.renderizados += 1
+        if self.fal.taxa_falha and random.random() < self.fal.taxa_falha:
+            raise RuntimeError("Falha simulada no fal")
+        chave = hashlib.sha256(json.dumps([self.app, self.arguments], sort_keys=True).encode()).hexdigest()[:16]
+        return {"video": {"url": f"https://fake.fal.media/files/{chave}.mp4"}}
+
+
+class FalFake:
+    """
+    Substitui o fal_client: submit(app, arguments).get() espera FAL_LATENCIA_MS e devolve uma URL
+    de vídeo determinística (mesmos argumentos -> mesma URL). taxa_falha simula erros do fal.
+    """
+
+    def __init__(self, latencia_ms=None, taxa_falha=None):
+        self.latencia_s = float(latencia_ms if latencia_ms is not None else os.getenv("FAL_LATENCIA_MS", "2000")) / 1000
+        self.taxa_falha = float(taxa_falha if taxa_falha is not None else os.getenv("FAL_TAXA_FALHA", "0"))
+        self.renderizados = 0
+        self._lock = threading.Lock()
+
+    def submit(self, app, arguments):
+        return _HandlerFalFake(self, app, arguments)
+
+
+# ==========================================
+# GOOGLE CALENDAR - em processo
+# ==========================================
+
+class _ChamadaGoogleFake:
+    def __init__(self, google, funcao):
+        self.google = google
+        self.funcao = funcao
+
+    def execute(self, *args, **kwargs):
+        time.sleep(self.google.latencia_s)
+        with self.google._lock:
+            self.google.chamadas += 1
+            return self.funcao()
+
+
+class _RecursoGoogleFake:
+    def __init__(self, google, recurso):
+        self.google = google
+        self.recurso = recurso
+
+    def __getattr__(self, metodo):
+        def _montar(**parametros):
+            return _ChamadaGoogleFake(self.google, lambda: getattr(self.google, f"_{self.recurso}_{metodo}")(**parametros))
+        return _montar
+
+
+class GoogleFake:
+    """
+    Substitui o service do Calendar (googleapiclient): events().list/insert e freebusy().query,
+    cada execute() esperando GOOGLE_LATENCIA_MS. As agendas ficam em memória; list com syncToken
+    devolve só os eventos criados depois do token, como o Google.
+    """
+
+    def __init__(self, latencia_ms=None):
+        self.latencia_s = float(latencia_ms if latencia_ms is not None else os.getenv("GOOGLE_LATENCIA_MS", "150")) / 1000
+        self.chamadas = 0
+        self._lock = threading.Lock()
+        self._eventos = {}
+        self._versao = 0
+
+    def events(self):
+        return _RecursoGoogleFake(self, "events")
+
+    def freebusy(self):
+        return _RecursoGoogleFake(self, "freebusy")
+
+    def _events_insert(self, calendarId, body, **_):
+        self._versao += 1
+        evento = dict(body, id=uuid.uuid4().hex, status="confirmed", htmlLink=f"https://fake.calendar/{calendarId}")
+        self._eventos.setdefault(calendarId, []).append((self._versao, evento))
+        return evento
+
+    def _events_list(self, calendarId, syncToken=None, **_):
+        desde = int(syncToken or 0)
+        itens = [evento for versao, evento in self._eventos.get(calendarId, []) if versao > desde]
+        return {"items": itens, "nextSyncToken": str(self._versao)}
+
+    def _freebusy_query(self, body):
+        calendarios = {}
+        for item in body.get("items", []):
+            calendarios[item["id"]] = {"busy": [
+                {"start": evento["start"]["dateTime"], "end": evento["end"]["dateTime"]}
+                for _, evento in self._eventos.get(item["id"], [])
+            ]}
+        return {"calendars": calendarios}
+
+
+# ==========================================
+# REDIS - em processo
+# ==========================================
+
+class _TransacaoRedisFake:
+    """pipeline(transaction=True): acumula os comandos e aplica todos de uma vez no execute()."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._comandos = []
+
+    def hset(self, chave, campo=None, valor=None, mapping=None):
+        self._comandos.append(("hset", (chave, campo, valor, mapping)))
+        return self
+
+    def expire(self, chave, segundos):
+        self._comandos.append(("expire", (chave, segundos)))
+        return self
+
+    def execute(self):
+        with self.redis._lock:
+            resultados = [getattr(self.redis, f"_{comando}")(*args) for comando, args in self._comandos]
+        self._comandos = []
+        return resultados
+
+
+class RedisFake:
+    """
+    Substitui o cliente redis-py nas operações de hash usadas pelas conversas: hmget, hset,
+    expire, delete e pipeline(transaction=True). Devolve bytes, como o redis-py sem
+    decode_responses. As chaves expiram pelo relógio, como o EXPIRE.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self._expira = {}
+        self.comandos = 0
+
+    def _vivo(self, chave):
+        expira = self._expira.get(chave)
+        if expira is not None and expira <= time.monotonic():
+            self._hashes.pop(chave, None)
+            self._expira.pop(chave, None)
+        return self._hashes.get(chave)
+
+    def _hset(self, chave, campo, valor, mapping):
+        campos = dict(mapping or {})
+        if campo is not None:
+            campos[campo] = valor
+        hash_ = self._vivo(chave)
+        if hash_ is None:
+            hash_ = self._hashes[chave] = {}
+        novos = sum(1 for c in campos if c not in hash_)
+        hash_.update({c: v if isinstance(v, bytes) else str(v).encode("utf-8") for c, v in campos.items()})
+        self.comandos += 1
+        return novos
+
+    def _expire(self, chave, segundos):
+        self.comandos += 1
+        if self._vivo(chave) is None:
+            return False
+        self._expira[chave] = time.monotonic() + segundos
+        return True
+
+    def hset(self, chave, campo=None, valor=None, mapping=None):
+        with self._lock:
+            return self._hset(chave, campo, valor, mapping)
+
+    def expire(self, chave, segundos):
+        with self._lock:
+            return self._expire(chave, segundos)
+
+    def hmget(self, chave, campos, *mais):
+        campos = ([campos] if isinstance(campos, str) else list(campos)) + list(mais)
+        with self._lock:
+            self.comandos += 1
+            hash_ = self._vivo(chave) or {}
+            return [hash_.get(campo) for campo in campos]
+
+    def delete(self, *chaves):
+        with self._lock:
+            self.comandos += 1
+            return sum(1 for chave in chaves if self._vivo(chave) is not None and self._hashes.pop(chave, None) is not None)
+
+    def pipeline(self, transaction=True):
+        return _TransacaoRedisFake(self)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("servico", choices=["groq"])
+    parser.add_argument("--porta", type=int, default=9001)
+    parser.add_argument("--latencia-ms", type=float, default=LATENCIA_MS)
+    opcoes = parser.parse_args()
+
+    apps = {"groq": criar_app_groq}
+    uvicorn.run(apps[opcoes.servico](opcoes.latencia_ms), host="127.0.0.1", port=opcoes.porta, log_level="warning")